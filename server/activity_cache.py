@@ -0,0 +1,184 @@
+import time
+from scheduler import activity_key
+from logs import get_logger, log, INFO, ERROR
+
+logger = get_logger("activity_cache")
+
+
+class ChangeStreamSource:
+    """Reads activity changes from a MongoDB change stream.
+
+    If the stream can't be resumed (its resume token fell out of the oplog) or is
+    invalidated, a fresh stream is opened and the collection reloaded; the reload
+    is reported as upserts for every document and deletes for the ids that are gone.
+
+    Args:
+        collection: A pymongo collection (or any stand-in exposing find() and watch())
+        max_await_ms: How long a poll may wait on the server for new events
+    """
+
+    def __init__(self, collection, max_await_ms=1000):
+        self.collection = collection
+        self.max_await_ms = max_await_ms
+        self._stream = None
+        self._resume_token = None
+        self._known = set()
+        self._reload_pending = False
+
+    def load(self):
+        # Open the stream before the snapshot so nothing written in between is lost
+        if self._stream is None:
+            self._open()
+        docs = list(self.collection.find())
+        self._known = {str(doc["_id"]) for doc in docs}
+        return docs
+
+    def _open(self):
+        kwargs = {"full_document": "updateLookup", "max_await_time_ms": self.max_await_ms}
+        if self._resume_token:
+            kwargs["resume_after"] = self._resume_token
+        self._stream = self.collection.watch(**kwargs)
+
+    def _reload(self):
+        # Stays pending until a snapshot is read, so a failed reload is retried on the next poll
+        self._reload_pending = True
+        self._resume_token = None
+        self._stream = None
+        known = self._known
+        docs = self.load()
+        self._reload_pending = False
+        changes = [("delete", key, None) for key in known - self._known]
+        changes.extend(("upsert", str(doc["_id"]), doc) for doc in docs)
+        return changes
+
+    def poll(self):
+        """Return the changes seen since the last poll as (op, key, document) tuples."""
+        if self._reload_pending:
+            return self._reload()
+        changes = []
+        try:
+            while True:
+                event = self._stream.try_next()
+                if event is None:
+                    break
+                if event["operationType"] == "invalidate":
+                    log(logger, INFO, "change stream invalidated, reloading activities")
+                    return changes + self._reload()
+                self._resume_token = event.get("_id")
+                key = str(event["documentKey"]["_id"])
+                if event["operationType"] == "delete":
+                    self._known.discard(key)
+                    changes.append(("delete", key, None))
+                elif event.get("fullDocument") is not None:
+                    self._known.add(key)
+                    changes.append(("upsert", key, event["fullDocument"]))
+        except Exception as e:
+            log(logger, ERROR, "change stream interrupted, resuming", error=e)
+            try:
+                self._open()
+            except Exception as e:
+                log(logger, ERROR, "could not resume change stream, reloading activities", error=e)
+                return changes + self._reload()
+        return changes
+
+
+class PollingSource:
+    """Fallback source that polls for documents whose updatedAt moved past a watermark.
+
+    Polling cannot see deletes, so every reconcile_every polls the set of _ids is
+    compared against the cache with an _id-only projection.
+    """
+
+    def __init__(self, collection, interval=30, reconcile_every=10):
+        self.collection = collection
+        self.interval = interval
+        self.reconcile_every = reconcile_every
+        self.watermark = None
+        self._known = set()
+        self._polls = 0
+        self._next_poll = 0
+
+    def _advance(self, docs):
+        for doc in docs:
+            updated_at = doc.get("updatedAt")
+            if updated_at is not None and (self.watermark is None or updated_at > self.watermark):
+                self.watermark = updated_at
+
+    def load(self):
+        docs = list(self.collection.find())
+        self._advance(docs)
+        self._known = {str(doc["_id"]) for doc in docs}
+        self._next_poll = time.monotonic() + self.interval
+        return docs
+
+    def poll(self):
+        """Return the changes seen since the last poll as (op, key, document) tuples."""
+        if time.monotonic() < self._next_poll:
+            return []
+        self._next_poll = time.monotonic() + self.interval
+        self._polls += 1
+        query = {"updatedAt": {"$gt": self.watermark}} if self.watermark is not None else {"updatedAt": {"$exists": True}}
+        docs = list(self.collection.find(query))
+        self._advance(docs)
+        changes = [("upsert", str(doc["_id"]), doc) for doc in docs]
+        self._known.update(key for _, key, _ in changes)
+        if self._polls % self.reconcile_every == 0:
+            ids = {str(doc["_id"]): doc["_id"] for doc in self.collection.find({}, {"_id": 1})}
+            for key in self._known - ids.keys():
+                changes.append(("delete", key, None))
+            missing = [ids[key] for key in ids.keys() - self._known]
+            if missing:
+                changes.extend(("upsert", str(doc["_id"]), doc) for doc in self.collection.find({"_id": {"$in": missing}}))
+            self._known = set(ids)
+        return changes
+
+
+def open_source(collection):
+    """Use a change stream when the deployment supports one, otherwise fall back to polling."""
+    source = ChangeStreamSource(collection)
+    try:
+        source._open()
+        return source
+    except Exception as e:
+        log(logger, INFO, "change streams unavailable, polling on updatedAt instead", error=e)
+        return PollingSource(collection)
+
+
+class ActivityCache:
+    """In-process copy of the activities collection kept current from a change source.
+
+    Args:
+        source: Object with load() and poll() methods; defaults to the best source
+            for the activities collection
+    """
+
+    def __init__(self, source=None):
+        if source is None:
+            from mongodb_utils import activities
+            source = open_source(activities)
+        self.source = source
+        self._activities = {}
+
+    def __len__(self):
+        return len(self._activities)
+
+    def __iter__(self):
+        return iter(list(self._activities.values()))
+
+    def get(self, key):
+        return self._activities.get(key)
+
+    def load(self):
+        """Load the full collection once and return the snapshot."""
+        self._activities = {activity_key(doc): doc for doc in self.source.load()}
+        return list(self._activities.values())
+
+    def sync(self):
+        """Apply pending inserts, updates and deletes and return them."""
+        changes = self.source.poll()
+        for op, key, doc in changes:
+            if op == "delete":
+                self._activities.pop(key, None)
+            else:
+                self._activities[key] = doc
+        return changes
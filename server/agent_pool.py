@@ -0,0 +1,152 @@
+import os
+import queue
+import threading
+import time
+from contextlib import contextmanager
+import metrics
+
+
+def get_pool_size():
+    """Agents per process, from AGENT_POOL_SIZE (default 4)."""
+    return int(os.getenv("AGENT_POOL_SIZE", "4"))
+
+
+class QueryCancelled(Exception):
+    """The caller gave up on a query before an agent was free to run it."""
+
+
+class AgentPool:
+    """Reusable ReAct agents built once and shared across requests.
+
+    Building an agent is paid once per pool slot instead of once per query. Each
+    request checks out its own agent, so concurrent requests never share one; the
+    underlying LLM client is shared by all of them.
+
+    Args:
+        llm_factory: Callable returning the LLM client shared by every agent
+        tools: Tools given to each agent, or a callable returning them on first build
+        size: Maximum number of agents; defaults to get_pool_size()
+        checkout_timeout: Seconds to wait for a free agent; defaults to AGENT_CHECKOUT_TIMEOUT or 30
+    """
+
+    def __init__(self, llm_factory, tools, size=None, checkout_timeout=None):
+        self.llm_factory = llm_factory
+        self.tools = tools
+        self.size = size or get_pool_size()
+        self.checkout_timeout = checkout_timeout or float(os.getenv("AGENT_CHECKOUT_TIMEOUT", "30"))
+        self._llm = None
+        self._idle = queue.LifoQueue()
+        self._built = 0
+        self._lock = threading.Lock()
+        self._timings = {"construction": [0, 0.0], "inference": [0, 0.0]}
+
+    def _record(self, kind, seconds):
+        with self._lock:
+            self._timings[kind][0] += 1
+            self._timings[kind][1] += seconds
+
+    def _build(self):
+        from langchain.agents import initialize_agent
+        from langchain.agents.agent_types import AgentType
+
+        started = time.perf_counter()
+        if self._llm is None:
+            self._llm = self.llm_factory()
+        if callable(self.tools):
+            self.tools = self.tools()
+        agent = initialize_agent(
+            tools=self.tools,
+            llm=self._llm,
+            agent_type=AgentType.ZERO_SHOT_REACT_DESCRIPTION,
+            verbose=True
+        )
+        self._record("construction", time.perf_counter() - started)
+        return agent
+
+    def warm(self, count=None):
+        """Build agents up front so the first requests don't pay for construction."""
+        count = min(count or self.size, self.size)
+        agents = []
+        with self._lock:
+            count = max(count - self._built, 0)
+            self._built += count
+        try:
+            for _ in range(count):
+                agents.append(self._build())
+        finally:
+            with self._lock:
+                self._built -= count - len(agents)
+            for agent in agents:
+                self._idle.put(agent)
+        return self
+
+    @contextmanager
+    def acquire(self, timeout=None):
+        """Check out an idle agent, building one if the pool isn't full yet.
+
+        Raises:
+            TimeoutError: If no agent is free within timeout seconds (default checkout_timeout)
+        """
+        try:
+            agent = self._idle.get_nowait()
+        except queue.Empty:
+            build = False
+            with self._lock:
+                if self._built < self.size:
+                    self._built += 1
+                    build = True
+            if build:
+                try:
+                    agent = self._build()
+                except Exception:
+                    with self._lock:
+                        self._built -= 1
+                    raise
+            else:
+                timeout = self.checkout_timeout if timeout is None else timeout
+                try:
+                    agent = self._idle.get(timeout=timeout)
+                except queue.Empty:
+                    metrics.AGENT_QUERIES_DROPPED.inc(reason="timeout")
+                    raise TimeoutError(f"No agent free within {timeout:g}s, all {self.size} busy")
+        try:
+            yield agent
+        finally:
+            self._idle.put(agent)
+
+    def run(self, query, callbacks=None, cancelled=None):
+        """Run a query on a pooled agent, reporting steps to optional LangChain callbacks.
+
+        Args:
+            query: The user query
+            callbacks: LangChain callback handlers notified of each step
+            cancelled: Optional threading.Event; if it is set by the time an agent is
+                free, e.g. because the client went away, the query is not run
+
+        Raises:
+            TimeoutError: If no agent frees up within checkout_timeout
+            QueryCancelled: If cancelled was set while waiting
+        """
+        with self.acquire() as agent:
+            if cancelled is not None and cancelled.is_set():
+                metrics.AGENT_QUERIES_DROPPED.inc(reason="cancelled")
+                raise QueryCancelled("Query cancelled before an agent was free")
+            started = time.perf_counter()
+            try:
+                return agent.run(query, callbacks=callbacks)
+            finally:
+                elapsed = time.perf_counter() - started
+                self._record("inference", elapsed)
+                metrics.LLM_SECONDS.observe(elapsed, tool="agent")
+
+    def stats(self):
+        """Return build and inference counts with total and average seconds."""
+        with self._lock:
+            stats = {"size": self.size, "built": self._built, "idle": self._idle.qsize()}
+            for kind, (count, total) in self._timings.items():
+                stats[kind] = {
+                    "count": count,
+                    "total_seconds": round(total, 4),
+                    "avg_seconds": round(total / count, 4) if count else 0.0,
+                }
+        return stats
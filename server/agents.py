@@ -1,69 +1,280 @@
-from dotenv import load_dotenv
-from pydantic import BaseModel
-from langchain_openai import ChatOpenAI
-from langchain_google_genai import ChatGoogleGenerativeAI
-from langchain_core.prompts import ChatPromptTemplate
-from langchain_core.output_parsers import PydanticOutputParser
-from langchain.agents import create_tool_calling_agent, AgentExecutor
-from tools import search_tool, wiki_tool, save_tool, fetch_tool
+import argparse
+import ast
+import asyncio
+import json
 import os
+import re
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from dotenv import load_dotenv
+from pydantic import BaseModel, ValidationError
+from llm_cache import normalize_query
+from logs import get_logger, log, INFO, WARNING
 
 load_dotenv()
 
+logger = get_logger("agents")
+
 class ResearchResponse(BaseModel):
     topic: str
     summary: str
     sources: list[str]
     tools_used: list[str]
-    
-# Get Gemini API key from environment variables
-gemini_api_key = os.getenv("GOOGLE_API_KEY")
-if not gemini_api_key:
-    # Fallback to direct input if not in environment
-    gemini_api_key = input("Please enter your Gemini API key: ")
-    os.environ["GOOGLE_API_KEY"] = gemini_api_key
-
-# Initialize Gemini model
-llm = ChatGoogleGenerativeAI(model="gemini-2.0-flash")
-parser = PydanticOutputParser(pydantic_object=ResearchResponse)
-
-prompt = ChatPromptTemplate.from_messages(
-    [
-        (
-            "system",
-            """
-            You are a research assistant that will help generate a research paper.
-            Answer the user query and use neccessary tools. 
-            Wrap the output in this format and provide no other text\n{format_instructions}
-            """,
-        ),
-        ("placeholder", "{chat_history}"),
-        ("human", "{query}"),
-        ("placeholder", "{agent_scratchpad}"),
-    ]
-).partial(format_instructions=parser.get_format_instructions())
-
-tools = [search_tool, wiki_tool, save_tool,fetch_tool]
-agent = create_tool_calling_agent(
-    llm=llm,
-    prompt=prompt,
-    tools=tools
-)
-
-agent_executor = AgentExecutor(agent=agent, tools=tools, verbose=True)
-query = input("What can i help you research? ")
-
-print("\n=== EXECUTING QUERY ===")
-print(f"Query: {query}")
-print("======================\n")
-
-raw_response = agent_executor.invoke({"query": query})
-
-print("\n=== FINAL RESULTS ===")
-# Extract and print just the output portion
-if "output" in raw_response:
-    print(raw_response["output"])
-else:
-    print("No output found in response")
-    print("Complete response:", raw_response)
-print("======================")
\ No newline at end of file
+
+# What each pre-fetched lookup is credited as in tools_used and sources
+LOOKUP_TOOLS = {"search": "search", "wiki": "wikipedia"}
+LOOKUP_SOURCES = {"search": "DuckDuckGo web search", "wiki": "Wikipedia"}
+
+REPROMPT = "\n\nYour previous answer could not be parsed. Reply with only the JSON object described in the instructions."
+
+_agent_executor = None
+
+def build_agent_executor(llm=None, verbose=True):
+    """Create the research agent on first use; importing this module builds nothing.
+
+    Args:
+        llm: Chat model to use instead of Gemini, e.g. a stub in tests; such executors
+            are not cached
+        verbose: Let LangChain print each agent step; applies when the executor is built
+    """
+    global _agent_executor
+    shared = llm is None
+    if shared and _agent_executor is not None:
+        return _agent_executor
+
+    from langchain_core.prompts import ChatPromptTemplate
+    from langchain_core.output_parsers import PydanticOutputParser
+    from langchain.agents import create_tool_calling_agent, AgentExecutor
+    from research_tools import search_tool, wiki_tool, save_tool, fetch_tool
+
+    if llm is None:
+        from langchain_google_genai import ChatGoogleGenerativeAI
+
+        # Initialize Gemini model
+        llm = ChatGoogleGenerativeAI(model="gemini-2.0-flash")
+    parser = PydanticOutputParser(pydantic_object=ResearchResponse)
+
+    prompt = ChatPromptTemplate.from_messages(
+        [
+            (
+                "system",
+                """
+                You are a research assistant that will help generate a research paper.
+                Answer the user query and use neccessary tools.
+                Research notes already gathered for this query are below; only call a tool
+                for something they don't cover.
+                Wrap the output in this format and provide no other text\n{format_instructions}
+                """,
+            ),
+            ("system", "Research notes:\n{notes}"),
+            ("placeholder", "{chat_history}"),
+            ("human", "{query}"),
+            ("placeholder", "{agent_scratchpad}"),
+        ]
+    ).partial(format_instructions=parser.get_format_instructions())
+
+    tools = [search_tool, wiki_tool, save_tool,fetch_tool]
+    agent = create_tool_calling_agent(
+        llm=llm,
+        prompt=prompt,
+        tools=tools
+    )
+
+    executor = AgentExecutor(agent=agent, tools=tools, verbose=verbose, return_intermediate_steps=True)
+    if shared:
+        _agent_executor = executor
+    return executor
+
+def format_notes(notes):
+    """Render pre-fetched lookups for the prompt."""
+    if not notes:
+        return "(none)"
+    return "\n\n".join(f"[{LOOKUP_SOURCES.get(name, name)}]\n{text}" for name, text in notes.items())
+
+def output_text(output):
+    """Agent output as text; Gemini may answer with a list of content parts."""
+    if isinstance(output, list):
+        return "".join(part.get("text", "") if isinstance(part, dict) else str(part) for part in output)
+    return "" if output is None else str(output)
+
+def _json_object(text):
+    """Pull the outermost {...} out of text and parse it, tolerating common slips."""
+    text = re.sub(r"^```(?:json)?\s*|\s*```$", "", text.strip(), flags=re.I)
+    start, end = text.find("{"), text.rfind("}")
+    if start < 0 or end <= start:
+        return None
+    candidate = text[start:end + 1]
+    for attempt in (candidate, re.sub(r",\s*([}\]])", r"\1", candidate)):
+        try:
+            return json.loads(attempt)
+        except ValueError:
+            pass
+    try:
+        # Single-quoted, Python-style dicts
+        value = ast.literal_eval(candidate)
+        return value if isinstance(value, dict) else None
+    except (ValueError, SyntaxError):
+        return None
+
+def _string_list(value):
+    if value is None:
+        return []
+    if isinstance(value, str):
+        return [item.strip() for item in value.split(",") if item.strip()]
+    if isinstance(value, (list, tuple)):
+        return [str(item) for item in value if item not in (None, "")]
+    return [str(value)]
+
+def repair_response(output, query, tools_used=(), sources=()):
+    """Coerce agent output into a ResearchResponse without asking the LLM again.
+
+    Accepts JSON wrapped in prose or code fences, trailing commas, single quotes,
+    lists given as strings and missing fields. The topic falls back to the query,
+    and tools_used and sources to what the run actually used.
+
+    Returns:
+        ResearchResponse, or None if the output has no usable summary
+    """
+    text = output_text(output)
+    data = _json_object(text)
+    if data is None:
+        if not text.strip():
+            return None
+        data = {"summary": text.strip()}
+    summary = data.get("summary")
+    if isinstance(summary, (list, tuple)):
+        summary = "\n".join(str(part) for part in summary)
+    if not summary or not str(summary).strip():
+        return None
+    used = list(dict.fromkeys(_string_list(data.get("tools_used")) + list(tools_used)))
+    try:
+        return ResearchResponse(
+            topic=str(data.get("topic") or query),
+            summary=str(summary).strip(),
+            sources=_string_list(data.get("sources")) or list(sources),
+            tools_used=used,
+        )
+    except ValidationError:
+        return None
+
+def _invoke(executor, inputs):
+    # The async path runs several tool calls from one agent step concurrently
+    return asyncio.run(executor.ainvoke(inputs))
+
+def research(query, executor=None, sources=None):
+    """Research one query: independent lookups run concurrently, then the agent answers.
+
+    Args:
+        query: What to research
+        executor: AgentExecutor to use; defaults to build_agent_executor()
+        sources: Lookups to run up front (names from research_tools.LOOKUPS); defaults to all
+
+    Returns:
+        ResearchResponse
+
+    Raises:
+        ValueError: If the agent's output can't be turned into a ResearchResponse even after re-asking once
+    """
+    from research_tools import lookup_all
+
+    executor = executor or build_agent_executor()
+    notes = lookup_all(query, sources)
+    inputs = {"query": query, "notes": format_notes(notes)}
+    prefetched = [LOOKUP_TOOLS.get(name, name) for name in notes]
+    cited = [LOOKUP_SOURCES.get(name, name) for name in notes]
+    for attempt in range(2):
+        raw = _invoke(executor, inputs)
+        called = [action.tool for action, _ in raw.get("intermediate_steps", [])]
+        response = repair_response(raw.get("output"), query, prefetched + called, cited)
+        if response is not None:
+            log(logger, INFO, "research done", query=query, prefetched=prefetched, called=called, reprompted=bool(attempt))
+            return response
+        log(logger, WARNING, "research output not parseable", query=query, attempt=attempt + 1)
+        inputs = dict(inputs, query=query + REPROMPT)
+    raise ValueError("Agent output could not be parsed as a ResearchResponse")
+
+def research_batch(queries, concurrency=None, executor=None):
+    """Research many queries with at most `concurrency` running at once.
+
+    Queries that normalize to the same text are researched once and share the result.
+
+    Args:
+        queries: List of query strings
+        concurrency: Defaults to RESEARCH_CONCURRENCY or 4
+        executor: AgentExecutor shared by all queries; defaults to build_agent_executor()
+
+    Returns:
+        List of per-query results with index, query, status ("done" or "error") and
+        either the result or the error message
+    """
+    concurrency = concurrency or int(os.getenv("RESEARCH_CONCURRENCY", "4"))
+    executor = executor or build_agent_executor()
+    results = [{"index": i, "query": query} for i, query in enumerate(queries)]
+    groups = {}
+    for i, query in enumerate(queries):
+        if not isinstance(query, str) or not query.strip():
+            results[i].update(status="error", error="Query must be a non-empty string")
+            continue
+        groups.setdefault(normalize_query(query), []).append(i)
+
+    def run(indexes):
+        try:
+            outcome = {"status": "done", "result": research(queries[indexes[0]], executor).model_dump()}
+        except Exception as e:
+            outcome = {"status": "error", "error": str(e)}
+        for i in indexes:
+            results[i].update(outcome)
+
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="research-batch") as pool:
+        list(pool.map(run, groups.values()))
+    log(logger, INFO, "research batch done", queries=len(queries), unique=len(groups),
+        failed=sum(1 for result in results if result["status"] == "error"))
+    return results
+
+def load_queries(path):
+    """One query per line; blank lines and lines starting with # are skipped."""
+    with open(path, encoding="utf-8") as queries:
+        return [line.strip() for line in queries if line.strip() and not line.lstrip().startswith("#")]
+
+def main():
+    parser = argparse.ArgumentParser(description="Research assistant")
+    parser.add_argument("query", nargs="?", help="Research this query and print the result as JSON")
+    parser.add_argument("--batch", help="File with one query per line, researched concurrently")
+    parser.add_argument("--concurrency", type=int, default=None, help="Queries researched at once in batch mode")
+    parser.add_argument("--out", help="Write batch results to this JSON-lines file instead of stdout")
+    args = parser.parse_args()
+    interactive = not args.query and not args.batch
+
+    # Get Gemini API key from environment variables
+    if not os.getenv("GOOGLE_API_KEY"):
+        if not interactive:
+            sys.exit("GOOGLE_API_KEY is not set")
+        # Fallback to direct input if not in environment
+        os.environ["GOOGLE_API_KEY"] = input("Please enter your Gemini API key: ")
+
+    if args.batch:
+        results = research_batch(load_queries(args.batch), args.concurrency, build_agent_executor(verbose=False))
+        lines = [json.dumps(result) for result in results]
+        if args.out:
+            with open(args.out, "w", encoding="utf-8") as out:
+                out.write("\n".join(lines) + "\n")
+            done = sum(1 for result in results if result["status"] == "done")
+            print(f"{done}/{len(results)} queries researched, results in {args.out}")
+        else:
+            print("\n".join(lines))
+        return
+
+    query = args.query or input("What can i help you research? ")
+
+    print("\n=== EXECUTING QUERY ===")
+    print(f"Query: {query}")
+    print("======================\n")
+
+    response = research(query)
+
+    print("\n=== FINAL RESULTS ===")
+    print(response.model_dump_json(indent=2))
+    print("======================")
+
+if __name__ == "__main__":
+    main()
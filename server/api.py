@@ -1,9 +1,22 @@
 from flask import Flask, request, jsonify
-from tools import process_query_with_agent
+from tools import process_query_with_agent, get_agent_pool, extraction_cache, add_activities_batch
+import metrics
 import traceback
+import json
+import os
 
 app = Flask(__name__)
 
+def parse_result(result):
+    """Parse the agent result as JSON if it seems to be JSON, otherwise return it as is"""
+    try:
+        if isinstance(result, str) and result.strip().startswith('{'):
+            return json.loads(result)
+    except:
+        # If parsing fails, return as string
+        pass
+    return result
+
 @app.route('/')
 def main():
     return 'server is alive'
@@ -22,23 +35,45 @@ def process_query():
             
         query = data['query']
         result = process_query_with_agent(query)
-        
-        # Try to parse the result as JSON if it seems to be JSON
-        try:
-            import json
-            if isinstance(result, str) and result.strip().startswith('{'):
-                parsed_result = json.loads(result)
-                return jsonify({
-                    'status': 'success',
-                    'result': parsed_result
-                })
-        except:
-            # If parsing fails, return as string
-            pass
             
         return jsonify({
             'status': 'success',
-            'result': result
+            'result': parse_result(result)
+        })
+        
+    except Exception as e:
+        traceback.print_exc()
+        return jsonify({
+            'error': str(e),
+            'status': 'error'
+        }), 500
+
+@app.route('/process/batch', methods=['POST'])
+def process_batch():
+    """Create many activities from a list of inputs and report per-item status"""
+    try:
+        data = request.json
+        inputs = data.get('inputs') if isinstance(data, dict) else None
+        
+        if not isinstance(inputs, list) or not inputs:
+            return jsonify({
+                'error': 'Missing inputs parameter',
+                'status': 'error'
+            }), 400
+        max_items = int(os.getenv('BATCH_MAX_ITEMS', '100'))
+        if len(inputs) > max_items:
+            return jsonify({
+                'error': f'Too many inputs, at most {max_items} per batch',
+                'status': 'error'
+            }), 400
+            
+        results = add_activities_batch(inputs)
+        created = sum(1 for result in results if result.get('status') == 'created')
+        return jsonify({
+            'status': 'success' if created == len(results) else 'partial' if created else 'error',
+            'created': created,
+            'failed': len(results) - created,
+            'results': results
         })
         
     except Exception as e:
@@ -53,8 +88,56 @@ def health_check():
     """Simple health check endpoint"""
     return jsonify({
         'status': 'healthy',
-        'message': 'Activity Processing API is running'
+        'message': 'Activity Processing API is running',
+        'agents': get_agent_pool().stats(),
+        'extraction_cache': extraction_cache.stats()
     })
 
+@app.route('/adherence/<scope>/<key>', methods=['GET'])
+def adherence(scope, key):
+    """Daily adherence for an activity or a user, read from the rollup counters"""
+    from mongodb_utils import get_collection
+    from rollups import read_adherence
+
+    if scope not in ('activity', 'user'):
+        return jsonify({'error': 'Scope must be activity or user', 'status': 'error'}), 404
+    try:
+        days = int(request.args.get('days', 30))
+    except ValueError:
+        return jsonify({'error': 'days must be an integer', 'status': 'error'}), 400
+    if not 1 <= days <= int(os.getenv('ADHERENCE_MAX_DAYS', '366')):
+        return jsonify({'error': 'days out of range', 'status': 'error'}), 400
+    try:
+        result = read_adherence(get_collection('adherence_daily'), scope, key, days)
+        return jsonify({'status': 'success', 'result': result})
+    except Exception as e:
+        traceback.print_exc()
+        return jsonify({'error': str(e), 'status': 'error'}), 500
+
+@app.route('/outcomes', methods=['POST'])
+def ingest_outcome():
+    """Accept a call outcome and queue it for the next batched write to records"""
+    from ingest import get_outcome_buffer, parse_outcome, DUPLICATE, FULL
+
+    try:
+        outcome = parse_outcome(request.get_json(silent=True))
+    except ValueError as e:
+        return jsonify({'error': str(e), 'status': 'error'}), 400
+    try:
+        result = get_outcome_buffer().add(outcome)
+    except Exception as e:
+        traceback.print_exc()
+        return jsonify({'error': str(e), 'status': 'error'}), 500
+    if result == FULL:
+        return jsonify({'error': 'Outcome buffer is full, retry shortly', 'status': 'error'}), 503, {'Retry-After': '1'}
+    return jsonify({'status': 'accepted', 'call_id': outcome['call_id'], 'duplicate': result == DUPLICATE}), 202
+
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    """Prometheus metrics for this process"""
+    return metrics.render(), 200, {'Content-Type': metrics.CONTENT_TYPE}
+
 if __name__ == '__main__':
+    # Build the agents before the first request instead of during it
+    get_agent_pool().warm()
     app.run(debug=True, port=5000)
\ No newline at end of file
@@ -0,0 +1,174 @@
+import asyncio
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from asgiref.wsgi import WsgiToAsgi
+from langchain_core.callbacks import BaseCallbackHandler
+from agent_pool import get_pool_size
+from api import app as flask_app, parse_result
+from tools import process_query_with_agent, get_agent_pool
+from logs import get_logger, log, ERROR
+
+# Agent runs are blocking, so they run on a bounded thread pool off the event loop. A
+# thread beyond the agent pool's size would only wait for an agent, so by default there
+# is one per agent and further requests queue here, where a cancelled one is never started.
+MAX_CONCURRENCY = int(os.getenv("ASGI_AGENT_CONCURRENCY") or get_pool_size())
+REQUEST_TIMEOUT = float(os.getenv("ASGI_REQUEST_TIMEOUT", "120"))
+
+executor = ThreadPoolExecutor(max_workers=MAX_CONCURRENCY, thread_name_prefix="agent")
+wsgi_app = WsgiToAsgi(flask_app)
+logger = get_logger("asgi")
+
+
+class StepStreamer(BaseCallbackHandler):
+    """Forwards agent steps from the worker thread to an asyncio queue."""
+
+    def __init__(self, loop, queue):
+        self.loop = loop
+        self.queue = queue
+
+    def _emit(self, event, data):
+        self.loop.call_soon_threadsafe(self.queue.put_nowait, (event, data))
+
+    def on_agent_action(self, action, **kwargs):
+        self._emit("step", {"tool": action.tool, "tool_input": action.tool_input, "log": action.log})
+
+    def on_tool_end(self, output, **kwargs):
+        self._emit("observation", {"output": str(output)})
+
+
+def sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n".encode()
+
+
+async def read_json(receive):
+    body = b""
+    while True:
+        message = await receive()
+        body += message.get("body", b"")
+        if not message.get("more_body"):
+            break
+    try:
+        return json.loads(body or b"{}")
+    except ValueError:
+        return None
+
+
+async def watch_disconnect(receive, cancelled):
+    """Set cancelled once the client goes away; the request body must already be read.
+
+    Once the body is in, the only message left to wait for is http.disconnect. Anything
+    else means the server doesn't hold receive() open, so there is nothing to watch and
+    reading again would only spin the event loop; the caller cancels this when it is done.
+    """
+    message = await receive()
+    if message["type"] == "http.disconnect":
+        cancelled.set()
+        return
+    await asyncio.Event().wait()
+
+
+async def send_json(send, status, payload):
+    body = json.dumps(payload, default=str).encode()
+    await send({"type": "http.response.start", "status": status,
+                "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())]})
+    await send({"type": "http.response.body", "body": body})
+
+
+async def process(scope, receive, send):
+    """POST /process without blocking the event loop, as JSON or as server-sent events."""
+    data = await read_json(receive)
+    if not data or "query" not in data:
+        await send_json(send, 400, {"error": "Missing query parameter", "status": "error"})
+        return
+    headers = dict(scope.get("headers") or [])
+    stream = b"text/event-stream" in headers.get(b"accept", b"") or data.get("stream")
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue()
+    callbacks = [StepStreamer(loop, queue)] if stream else None
+    cancelled = threading.Event()
+    watcher = asyncio.ensure_future(watch_disconnect(receive, cancelled))
+    task = loop.run_in_executor(executor, process_query_with_agent, data["query"], callbacks, cancelled)
+    try:
+        if stream:
+            await stream_result(send, data["query"], task, queue, watcher)
+            return
+        done, _ = await asyncio.wait({task, watcher}, timeout=REQUEST_TIMEOUT, return_when=asyncio.FIRST_COMPLETED)
+        if task not in done:
+            if watcher not in done:
+                await send_json(send, 504, {"error": "Request timed out", "status": "error"})
+            return
+        try:
+            result = task.result()
+        except Exception as e:
+            await send_json(send, 500, {"error": str(e), "status": "error"})
+            return
+        await send_json(send, 200, {"status": "success", "result": parse_result(result)})
+    finally:
+        watcher.cancel()
+        if not task.done():
+            # Nobody will read the answer; a query still waiting for a thread or an agent is dropped
+            cancelled.set()
+
+
+async def stream_result(send, query, task, queue, watcher):
+    """Send agent steps as server-sent events as they happen, then the result."""
+    loop = asyncio.get_running_loop()
+    await send({"type": "http.response.start", "status": 200,
+                "headers": [(b"content-type", b"text/event-stream"), (b"cache-control", b"no-cache")]})
+    await send({"type": "http.response.body", "body": sse("accepted", {"query": query}), "more_body": True})
+    deadline = loop.time() + REQUEST_TIMEOUT
+    while True:
+        remaining = deadline - loop.time()
+        if remaining <= 0:
+            await send({"type": "http.response.body", "body": sse("error", {"error": "Request timed out"})})
+            return
+        getter = asyncio.ensure_future(queue.get())
+        done, _ = await asyncio.wait({getter, task, watcher}, timeout=remaining, return_when=asyncio.FIRST_COMPLETED)
+        if watcher in done:
+            getter.cancel()
+            return
+        if getter in done:
+            event, payload = getter.result()
+            await send({"type": "http.response.body", "body": sse(event, payload), "more_body": True})
+            continue
+        getter.cancel()
+        if task in done:
+            # Flush steps that arrived together with the result
+            while not queue.empty():
+                event, payload = queue.get_nowait()
+                await send({"type": "http.response.body", "body": sse(event, payload), "more_body": True})
+            try:
+                final = sse("result", {"status": "success", "result": parse_result(task.result())})
+            except Exception as e:
+                final = sse("error", {"error": str(e), "status": "error"})
+            await send({"type": "http.response.body", "body": final})
+            return
+
+
+async def app(scope, receive, send):
+    """ASGI entry point: /process is served natively, everything else by the Flask app."""
+    if scope["type"] == "lifespan":
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                try:
+                    await asyncio.get_running_loop().run_in_executor(executor, get_agent_pool().warm)
+                except Exception as e:
+                    log(logger, ERROR, "could not warm agent pool", error=e)
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                executor.shutdown(wait=False)
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+    if scope["type"] == "http" and scope["path"] == "/process" and scope["method"] == "POST":
+        await process(scope, receive, send)
+        return
+    await wsgi_app(scope, receive, send)
+
+
+if __name__ == "__main__":
+    import uvicorn
+    uvicorn.run("asgi:app", host=os.getenv("HOST", "127.0.0.1"), port=int(os.getenv("PORT", "5000")),
+                workers=int(os.getenv("ASGI_WORKERS", "1")))
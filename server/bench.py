@@ -0,0 +1,390 @@
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import logging
+import os
+import platform
+import random
+import resource
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+from bson import ObjectId
+import mongodb_utils
+from dedupe import DedupeLedger
+from dispatch import Dispatcher
+from fake_vapi import FakeVapiServer
+from job import check_activities, check_index, execute_scheduled_job
+from scheduler import WEEKDAYS, ScheduleIndex
+
+# Monday; every synthetic schedule is laid out in the week starting here
+BASE_WEEK = datetime(2025, 1, 6)
+PEAK = BASE_WEEK + timedelta(hours=9)
+SHAPES = ["top_level", "form", "form_data", "one_time_type", "one_time_tag", "one_time_method"]
+NAMES = ["Take medicine", "Morning walk", "Drink water", "Call family", "Stretching", "Lunch", "Study session"]
+# Never send bench traffic anywhere real, whatever .env says
+BENCH_ENV = {
+    "VAPI_API_KEY": "bench",
+    "AGENT_ID": "bench-assistant",
+    "TARGET": "+10000000000",
+    "PHONE_NUMBER_ID": "bench-phone",
+    "GOOGLE_API_KEY": "bench",
+}
+
+
+def synthetic_activity(index, rng, peak_share, expired_share):
+    """One activity in the shape SHAPES[index % len(SHAPES)].
+
+    A peak_share of activities fire at PEAK; the rest are spread over the base week.
+    An expired_share have an expiry before BASE_WEEK, so they never fire.
+    """
+    shape = SHAPES[index % len(SHAPES)]
+    fire_at = PEAK if rng.random() < peak_share else BASE_WEEK + timedelta(minutes=rng.randrange(7 * 24 * 60))
+    name = rng.choice(NAMES)
+    activity = {
+        "_id": ObjectId(),
+        "user_id": f"user_{index % 5000}",
+        "name": name,
+        "description": name,
+        "form": {"name": name, "description": f"{name} (synthetic)"},
+        "expiry": (BASE_WEEK - timedelta(days=5) if rng.random() < expired_share else BASE_WEEK + timedelta(days=30)).isoformat() + "Z",
+    }
+    if shape.startswith("one_time"):
+        activity["timestamp"] = fire_at.strftime("%Y-%m-%dT%H:%M:00")
+        if shape == "one_time_type":
+            activity["type"] = "one_time"
+        elif shape == "one_time_tag":
+            activity["tags"] = ["one_time"]
+        else:
+            activity["metadata"] = {"method": "one_time"}
+        return activity
+    days = sorted({WEEKDAYS[fire_at.weekday()]} | set(rng.sample(WEEKDAYS, rng.randint(0, 3))), key=WEEKDAYS.index)
+    clock = fire_at.strftime("%H:%M")
+    schedule = {"days": days, "recurringTimes": {day: clock for day in days}}
+    activity["type"] = "recurring"
+    if shape == "top_level":
+        activity.update(schedule)
+    elif shape == "form":
+        activity["form"].update(schedule)
+    else:
+        activity["metadata"] = {"form_data": schedule}
+    return activity
+
+
+def generate(count, seed=7, peak_share=0.01, expired_share=0.05):
+    rng = random.Random(seed)
+    return [synthetic_activity(index, rng, peak_share, expired_share) for index in range(count)]
+
+
+def percentiles(values, scale=1000.0):
+    """p50/p95/max of a list of seconds, in milliseconds by default."""
+    if not values:
+        return {}
+    values = sorted(values)
+    return {
+        "p50": round(values[len(values) // 2] * scale, 3),
+        "p95": round(values[min(len(values) - 1, int(len(values) * 0.95))] * scale, 3),
+        "max": round(values[-1] * scale, 3),
+    }
+
+
+def rss_peak_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+class CountingSink:
+    """Dispatcher stand-in that only counts jobs, so ticks measure scheduling alone."""
+
+    def __init__(self):
+        self.jobs = 0
+
+    def dispatch(self, jobs):
+        self.jobs += len(jobs)
+        return len(jobs)
+
+    def stats(self):
+        return {"jobs": self.jobs}
+
+
+def bench_scheduler(size, args, db=None):
+    """Time loading, indexing and ticking over `size` synthetic activities.
+
+    Returns:
+        Result dictionary for this size, plus the generated activities
+    """
+    result = {"size": size}
+    started = time.perf_counter()
+    activities = generate(size, args.seed, args.peak_share, args.expired_share)
+    result["generate_seconds"] = round(time.perf_counter() - started, 3)
+
+    ledger = DedupeLedger()
+    if db is not None:
+        collection = db["activities"]
+        collection.insert_many(activities, ordered=False)
+        started = time.perf_counter()
+        activities = list(collection.find())
+        result["store_load_seconds"] = round(time.perf_counter() - started, 3)
+        ledger = DedupeLedger(db["fired_jobs"])
+
+    # The whole minute-tick as check_activities does it: normalize everything, then fire
+    sink = CountingSink()
+    started = time.perf_counter()
+    check_activities(activities, ledger, now=PEAK, dispatcher=sink)
+    result["cold_tick_ms"] = round((time.perf_counter() - started) * 1000, 3)
+    result["peak_due"] = sink.jobs
+
+    started = time.perf_counter()
+    index = ScheduleIndex(activities)
+    result["index_build_seconds"] = round(time.perf_counter() - started, 3)
+    result["indexed"] = len(index)
+
+    # Steady-state ticks over the hour around the peak with a prebuilt index
+    ledger = DedupeLedger()
+    durations = []
+    for offset in range(-30, 30):
+        now = PEAK + timedelta(minutes=offset)
+        started = time.perf_counter()
+        check_index(index, ledger, now=now, dispatcher=sink, since=now - timedelta(microseconds=1))
+        durations.append(time.perf_counter() - started)
+    result["tick_ms"] = percentiles(durations)
+
+    if not args.skip_memory:
+        del index
+        tracemalloc.start()
+        baseline = tracemalloc.get_traced_memory()[0]
+        index = ScheduleIndex(activities)
+        result["index_mb"] = round((tracemalloc.get_traced_memory()[0] - baseline) / 1024 / 1024, 2)
+        tracemalloc.stop()
+    result["rss_peak_mb"] = rss_peak_mb()
+    return result, activities
+
+
+def bench_dispatch(args):
+    """Place one peak minute of calls through a Dispatcher against the local fake VAPI.
+
+    Jitter is measured at the fake server: how far apart calls that were all due at
+    the same instant actually arrive.
+    """
+    activities = generate(args.dispatch_calls, args.seed, peak_share=1.0, expired_share=0.0)
+    jobs = [(fire_at, entry.activity) for fire_at, entries in ScheduleIndex(activities).due_between(PEAK - timedelta(microseconds=1), PEAK)
+            for entry in entries]
+    if not jobs:
+        return None
+    with FakeVapiServer(latency=args.vapi_latency) as server:
+        os.environ["VAPI_URL"] = server.url
+        dispatcher = Dispatcher(execute_scheduled_job, max_workers=args.dispatch_concurrency)
+        started = time.perf_counter()
+        fire_at = datetime.now()
+        dispatcher.dispatch([(fire_at, activity) for _, activity in jobs])
+        elapsed = time.perf_counter() - started
+        dispatcher.shutdown()
+        offsets = [arrival - started for arrival in server.arrivals]
+    stats = dispatcher.stats()
+    return {
+        "calls": len(jobs),
+        "concurrency": dispatcher.max_workers,
+        "vapi_latency_ms": round(args.vapi_latency * 1000, 1),
+        "sent": stats["sent"],
+        "failed": stats["failed"],
+        "seconds": round(elapsed, 3),
+        "calls_per_second": round(len(jobs) / elapsed, 1) if elapsed else None,
+        "arrival_ms": percentiles(offsets),
+        "jitter_ms": round(statistics.pstdev(offsets) * 1000, 3) if len(offsets) > 1 else 0.0,
+        "lag_ms": {key: round(value * 1000, 3) for key, value in stats["lag"].items()},
+    }
+
+
+def process_queries(users):
+    """/process queries by kind: rule-routed fetch and add, and ones only the agent can route."""
+    return {
+        "fetch": [f"show activities for user_{i}" for i in range(users)],
+        "add": [f"add for user_{i} take medicine at 9pm every day" for i in range(users)],
+        "agent": [f"user_{i} about that thing from before" for i in range(users)],
+    }
+
+
+async def _post(app, path, payload):
+    body = json.dumps(payload).encode()
+    scope = {"type": "http", "http_version": "1.1", "method": "POST", "path": path, "raw_path": path.encode(),
+             "query_string": b"", "headers": [(b"content-type", b"application/json")], "client": ("127.0.0.1", 0),
+             "server": ("127.0.0.1", 80), "scheme": "http", "root_path": ""}
+    status = {}
+
+    received = []
+
+    async def receive():
+        if not received:
+            received.append(True)
+            return {"type": "http.request", "body": body, "more_body": False}
+        # Like a real server, hold the connection open until the response is sent
+        await asyncio.Event().wait()
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            status["code"] = message["status"]
+
+    await app(scope, receive, send)
+    return status.get("code")
+
+
+async def _drive(app, requests, concurrency):
+    gate = asyncio.Semaphore(concurrency)
+    timings = []
+
+    async def one(kind, query):
+        async with gate:
+            started = time.perf_counter()
+            code = await _post(app, "/process", {"query": query})
+            timings.append((kind, code, time.perf_counter() - started))
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(kind, query) for kind, query in requests))
+    return timings, time.perf_counter() - started
+
+
+def bench_api(args):
+    """Drive POST /process on the ASGI app in-process, with the stub LLM standing in for Gemini."""
+    import bench_fetch
+    import tools
+    from fake_llm import FakeLLM
+
+    db = mongodb_utils.get_db()
+    users = 50
+    bench_fetch.populate(db, users=users, power_users=1, activities_per_user=5, activities_per_power_user=100,
+                         records_per_activity=5)
+    mongodb_utils.ensure_indexes()
+    llm = FakeLLM(latency=args.llm_latency)
+    tools.set_llm(llm)
+    import asgi
+
+    queries = process_queries(users)
+    rng = random.Random(args.seed)
+    kinds = list(queries)
+    requests = [(kind, rng.choice(queries[kind])) for kind in (kinds[i % len(kinds)] for i in range(args.api_requests))]
+    # The ReAct agent is verbose and prints every step
+    with contextlib.redirect_stdout(io.StringIO()):
+        tools.get_agent_pool().warm()
+        timings, elapsed = asyncio.run(_drive(asgi.app, requests, args.api_concurrency))
+    result = {
+        "requests": len(timings),
+        "concurrency": args.api_concurrency,
+        "llm_latency_ms": round(args.llm_latency * 1000, 1),
+        "llm_calls": llm.calls,
+        "seconds": round(elapsed, 3),
+        "requests_per_second": round(len(timings) / elapsed, 1) if elapsed else None,
+        "errors": sum(1 for _, code, _ in timings if code != 200),
+        "latency_ms": percentiles([took for _, _, took in timings]),
+        "by_kind": {},
+    }
+    for kind in kinds:
+        took = [seconds for k, _, seconds in timings if k == kind]
+        result["by_kind"][kind] = {"requests": len(took), "latency_ms": percentiles(took)}
+    return result
+
+
+def flatten(report, prefix=""):
+    """Numeric leaves of a report keyed by dotted path; lists of sizes are keyed by size."""
+    values = {}
+    if isinstance(report, dict):
+        for key, value in report.items():
+            values.update(flatten(value, f"{prefix}{key}."))
+    elif isinstance(report, list):
+        for item in report:
+            key = item.get("size") if isinstance(item, dict) else None
+            if key is not None:
+                values.update(flatten(item, f"{prefix}{key}."))
+    elif isinstance(report, (int, float)) and not isinstance(report, bool):
+        values[prefix[:-1]] = report
+    return values
+
+
+def compare(baseline, current):
+    """Relative change of every metric present in both reports, keyed by dotted path."""
+    before = flatten({key: baseline.get(key) for key in ("scheduler", "dispatch", "api")})
+    after = flatten({key: current.get(key) for key in ("scheduler", "dispatch", "api")})
+    changes = {}
+    for path in sorted(before.keys() & after.keys()):
+        old, new = before[path], after[path]
+        changes[path] = {"baseline": old, "current": new,
+                         "change_pct": round((new - old) / old * 100, 1) if old else None}
+    return changes
+
+
+def environment(args):
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__)), timeout=5).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        commit = None
+    return {
+        "commit": commit,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "started_at": datetime.now().isoformat(timespec="seconds"),
+        "params": {key: value for key, value in vars(args).items() if key not in ("out", "compare")},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark scheduler ticks, peak-minute dispatch and /process with local fakes")
+    parser.add_argument("--sizes", default="1000,10000,100000,1000000",
+                        help="Comma-separated activity counts to benchmark the scheduler with")
+    parser.add_argument("--store-max", type=int, default=10000,
+                        help="Largest size loaded through the mongomock store; bigger sizes are ticked from memory")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--peak-share", type=float, default=0.01, help="Share of activities due in the peak minute")
+    parser.add_argument("--expired-share", type=float, default=0.05, help="Share of activities that have expired")
+    parser.add_argument("--skip-memory", action="store_true", help="Don't trace the index's memory (saves time)")
+    parser.add_argument("--dispatch-calls", type=int, default=500, help="Peak-minute calls to place against the fake VAPI")
+    parser.add_argument("--dispatch-concurrency", type=int, default=int(os.getenv("DISPATCH_CONCURRENCY", "16")))
+    parser.add_argument("--vapi-latency", type=float, default=0.05, help="Fake VAPI response delay in seconds")
+    parser.add_argument("--api-requests", type=int, default=300, help="/process requests to send (0 skips)")
+    parser.add_argument("--api-concurrency", type=int, default=16)
+    parser.add_argument("--llm-latency", type=float, default=0.5, help="Stub LLM delay per call in seconds")
+    parser.add_argument("--out", help="Also write the JSON report to this file")
+    parser.add_argument("--compare", help="Earlier JSON report to compare this run against")
+    args = parser.parse_args()
+
+    import mongomock
+    # Logs share stdout with the report, so only warnings get through unless LOG_LEVEL says otherwise
+    if "LOG_LEVEL" not in os.environ:
+        logging.getLogger("tingting").setLevel(logging.WARNING)
+    os.environ.update(BENCH_ENV)
+    mongodb_utils.set_client(mongomock.MongoClient())
+    report = {"environment": environment(args), "scheduler": [], "dispatch": None, "api": None}
+    sizes = sorted(int(size) for size in args.sizes.split(",") if size.strip())
+    for size in sizes:
+        db = None
+        if size <= args.store_max:
+            db = mongodb_utils.get_client()[f"tingting_bench_{size}"]
+        result, activities = bench_scheduler(size, args, db)
+        result["store"] = "mongomock" if db is not None else None
+        report["scheduler"].append(result)
+        if db is not None:
+            mongodb_utils.get_client().drop_database(db.name)
+        del activities
+    if args.dispatch_calls > 0:
+        report["dispatch"] = bench_dispatch(args)
+    if args.api_requests > 0:
+        report["api"] = bench_api(args)
+    report["rss_peak_mb"] = rss_peak_mb()
+    if args.compare:
+        with open(args.compare) as baseline:
+            report["comparison"] = compare(json.load(baseline), report)
+    text = json.dumps(report, indent=2)
+    if args.out:
+        with open(args.out, "w") as out:
+            out.write(text + "\n")
+    print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+import argparse
+import json
+import os
+import random
+import statistics
+import time
+from datetime import datetime, timedelta
+from bson import ObjectId
+import mongodb_utils
+from tools import fetch_activites, estimate_tokens
+
+WEEKDAYS = ["Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun"]
+NAMES = ["Take medicine", "Morning walk", "Drink water", "Call family", "Stretching", "Read a book", "Breathing exercise"]
+
+
+def synthetic_activity(user_id, rng):
+    days = rng.sample(WEEKDAYS, rng.randint(1, 7))
+    return {
+        "_id": ObjectId(),
+        "user_id": user_id,
+        "name": rng.choice(NAMES),
+        "description": "Synthetic activity generated for the fetch benchmark " * rng.randint(1, 3),
+        "type": "recurring",
+        "tags": ["health"],
+        "days": days,
+        "recurringTimes": {day: f"{rng.randint(6, 21):02d}:{rng.choice([0, 15, 30, 45]):02d}" for day in days},
+        "form": {"name": "synthetic", "description": "x" * 200},
+    }
+
+
+def populate(db, users, power_users, activities_per_user, activities_per_power_user, records_per_activity, seed=7):
+    """Fill activities and records with synthetic users; the first power_users have many activities."""
+    rng = random.Random(seed)
+    now = datetime.now()
+    activities, records = [], []
+    for index in range(users):
+        user_id = f"user_{index}"
+        count = activities_per_power_user if index < power_users else activities_per_user
+        for _ in range(count):
+            activity = synthetic_activity(user_id, rng)
+            activities.append(activity)
+            for _ in range(records_per_activity):
+                records.append({
+                    "activityId": str(activity["_id"]),
+                    "completed": rng.random() < 0.7,
+                    "details": "synthetic",
+                    "task": activity["name"],
+                    "createdAt": now - timedelta(days=rng.uniform(0, 60)),
+                })
+    if activities:
+        db["activities"].insert_many(activities, ordered=False)
+    if records:
+        db["records"].insert_many(records, ordered=False)
+    return len(activities), len(records)
+
+
+def naive_fetch(db, user_id):
+    """What sending everything would cost: every activity and record, serialized."""
+    activities = list(db["activities"].find({"user_id": user_id}))
+    ids = [str(activity["_id"]) for activity in activities]
+    records = list(db["records"].find({"activityId": {"$in": ids}}))
+    return json.dumps({"activities": activities, "records": records}, default=str)
+
+
+def measure(fn, user_ids):
+    durations, tokens = [], []
+    for user_id in user_ids:
+        started = time.perf_counter()
+        text = fn(user_id)
+        durations.append(time.perf_counter() - started)
+        tokens.append(estimate_tokens(text))
+    durations.sort()
+    return {
+        "p50_ms": round(statistics.median(durations) * 1000, 2),
+        "p95_ms": round(durations[min(len(durations) - 1, int(len(durations) * 0.95))] * 1000, 2),
+        "tokens_avg": round(statistics.mean(tokens)),
+        "tokens_max": max(tokens),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark fetch_activites against synthetic users")
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--power-users", type=int, default=5)
+    parser.add_argument("--activities", type=int, default=5, help="Activities per regular user")
+    parser.add_argument("--power-activities", type=int, default=500, help="Activities per power user")
+    parser.add_argument("--records", type=int, default=20, help="Records per activity")
+    parser.add_argument("--queries", type=int, default=20, help="Lookups per user group")
+    args = parser.parse_args()
+
+    uri = os.getenv("BENCH_MONGODB_URI")
+    if uri:
+        from pymongo import MongoClient
+        client = MongoClient(uri)
+        # Never benchmark against data we didn't create
+        os.environ["MONGODB_DB"] = "tingting_bench"
+        client.drop_database("tingting_bench")
+    else:
+        import mongomock
+        client = mongomock.MongoClient()
+    mongodb_utils.set_client(client)
+    db = mongodb_utils.get_db()
+
+    started = time.perf_counter()
+    activity_count, record_count = populate(db, args.users, args.power_users, args.activities,
+                                            args.power_activities, args.records)
+    mongodb_utils.ensure_indexes()
+    rng = random.Random(11)
+    power = [f"user_{i}" for i in range(args.power_users)]
+    regular = [f"user_{i}" for i in range(args.power_users, args.users)]
+    power_sample = [rng.choice(power) for _ in range(args.queries)] if power else []
+    regular_sample = [rng.choice(regular) for _ in range(args.queries)] if regular else []
+
+    report = {
+        "store": "mongodb" if uri else "mongomock",
+        "activities": activity_count,
+        "records": record_count,
+        "populate_seconds": round(time.perf_counter() - started, 2),
+        "token_budget": int(os.getenv("FETCH_TOKEN_BUDGET", "1500")),
+        "fetch": {
+            "regular": measure(fetch_activites, regular_sample) if regular_sample else None,
+            "power": measure(fetch_activites, power_sample) if power_sample else None,
+        },
+        "naive": {
+            "regular": measure(lambda user_id: naive_fetch(db, user_id), regular_sample) if regular_sample else None,
+            "power": measure(lambda user_id: naive_fetch(db, user_id), power_sample) if power_sample else None,
+        },
+    }
+    if uri:
+        plan = db["activities"].find({"user_id": "user_0"}).sort("_id", 1).limit(50).explain()
+        report["activities_plan"] = str(plan.get("queryPlanner", {}).get("winningPlan", {}))[:300]
+        client.drop_database("tingting_bench")
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
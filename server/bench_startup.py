@@ -0,0 +1,104 @@
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+# Modules that must import quickly, offline and without printing or prompting
+MODULES = ["mongodb_utils", "tools", "agents", "api", "asgi", "job"]
+
+# Heavy clients that must only be loaded on first use
+LAZY_MODULES = ["langchain_google_genai", "langchain.agents"]
+
+PROBE = """
+import json, sys, time
+started = time.perf_counter()
+import {module}
+imported = time.perf_counter() - started
+ready = None
+if "{module}" == "api":
+    api.app.test_client().get("/")
+    ready = time.perf_counter() - started
+print(json.dumps({{"import": imported, "ready": ready,
+                  "loaded": [m for m in {lazy!r} if m in sys.modules]}}))
+"""
+
+
+def probe(module):
+    """Import module in a fresh interpreter with no services reachable.
+
+    Returns:
+        (wall_seconds, result) where result holds import/ready seconds, any heavy
+        modules that got loaded, and the problem if the import misbehaved
+    """
+    env = dict(os.environ)
+    env.pop("GOOGLE_API_KEY", None)
+    # Unroutable on purpose: an import that connects will hang or fail here
+    env["MONGODB_URI"] = "mongodb://127.0.0.1:9/?serverSelectionTimeoutMS=200&connectTimeoutMS=200"
+    code = PROBE.format(module=module, lazy=LAZY_MODULES)
+    started = time.perf_counter()
+    proc = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True,
+                          stdin=subprocess.DEVNULL, env=env, cwd=os.path.dirname(os.path.abspath(__file__)))
+    wall = time.perf_counter() - started
+    if proc.returncode != 0:
+        return wall, {"error": proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else f"exit {proc.returncode}"}
+    lines = proc.stdout.strip().splitlines()
+    result = json.loads(lines[-1])
+    if len(lines) > 1:
+        result["error"] = f"printed at import: {lines[0][:80]!r}"
+    return wall, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Cold-start benchmark for the API and scheduler entry points")
+    parser.add_argument("--runs", type=int, default=5, help="Fresh interpreters per module")
+    parser.add_argument("--budget", type=float, default=float(os.getenv("STARTUP_BUDGET_SECONDS", "1.5")),
+                        help="Maximum median cold start per module, in seconds")
+    parser.add_argument("--json", action="store_true", help="Print the report as JSON")
+    args = parser.parse_args()
+
+    report = {"budget_seconds": args.budget, "modules": {}}
+    failures = []
+    for module in MODULES:
+        walls, imports, readies, problems = [], [], [], set()
+        for _ in range(args.runs):
+            wall, result = probe(module)
+            walls.append(wall)
+            if "error" in result:
+                problems.add(result["error"])
+            if result.get("loaded"):
+                problems.add(f"loaded {', '.join(result['loaded'])} at import")
+            if "import" in result:
+                imports.append(result["import"])
+            if result.get("ready") is not None:
+                readies.append(result["ready"])
+        entry = {
+            "cold_start_median": round(statistics.median(walls), 3),
+            "cold_start_max": round(max(walls), 3),
+            "import_median": round(statistics.median(imports), 3) if imports else None,
+        }
+        if readies:
+            entry["first_request_median"] = round(statistics.median(readies), 3)
+        if entry["cold_start_median"] > args.budget:
+            problems.add(f"cold start {entry['cold_start_median']}s over budget {args.budget}s")
+        if problems:
+            entry["problems"] = sorted(problems)
+            failures.append(module)
+        report["modules"][module] = entry
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        for module, entry in report["modules"].items():
+            status = "FAIL" if module in failures else "ok"
+            print(f"[LOG] {module:<14} cold={entry['cold_start_median']:.3f}s max={entry['cold_start_max']:.3f}s "
+                  f"import={entry['import_median']}s {status}")
+            for problem in entry.get("problems", []):
+                print(f"[ERROR] {module}: {problem}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
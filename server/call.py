@@ -1,111 +1,247 @@
 import requests
+from requests.adapters import HTTPAdapter
+import json
 import os
+import threading
 from datetime import datetime
 from dotenv import load_dotenv
+from logs import get_logger, log, get_sample_every, DEBUG, WARNING
+import metrics
 
 load_dotenv()
 
-def call(activity_data=None,task='',description='',activity_id=""):
-    """Make a call using the VAPI API with personalized prompt based on activity data.
-    
-    Args:
-        activity_data: Optional dictionary containing activity information
-    """
-    VAPI_API_KEY = os.getenv('VAPI_API_KEY')
-    AGENT_ID = os.getenv('AGENT_ID')
-    TARGET = os.getenv('TARGET')
-    PHONE_NUMBER_ID = os.getenv('PHONE_NUMBER_ID')
+logger = get_logger("call")
+
+# Keyword table used to categorize activities by name, checked in order
+ACTIVITY_CATEGORIES = [
+    ("medication", ("medicine", "pill", "medication")),
+    ("exercise", ("exercise", "workout", "fitness")),
+    ("appointment", ("appointment", "meeting", "visit")),
+    ("meal", ("meal", "eat", "food", "breakfast", "lunch", "dinner")),
+    ("study", ("study", "class", "lesson")),
+    ("sleep", ("sleep", "bed", "rest")),
+]
+
+def categorize_activity(activity_name):
+    """Return the first category whose keywords appear in the activity name, or 'other'."""
+    name = (activity_name or '').lower()
+    for category, keywords in ACTIVITY_CATEGORIES:
+        if any(keyword in name for keyword in keywords):
+            return category
+    return "other"
+
+_session = None
+
+def get_session(pool_size=None):
+    """Return the shared keep-alive session used for VAPI requests."""
+    global _session
+    if _session is None:
+        pool_size = pool_size or int(os.getenv('VAPI_POOL_SIZE', '32'))
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        _session = session
+    return _session
+
+# Prompt per category, filled with greeting, username, activity_name, time_context and detailed_desc
+PROMPT_TEMPLATES = {
+    "medication": "{greeting} {username}, this is TingTing. It's time for your {activity_name} {time_context}. Have you taken it yet?",
+    "exercise": "{greeting} {username}! TingTing here. Time for your {activity_name} {time_context}. Are you ready to get moving?",
+    "appointment": "{greeting} {username}, TingTing here. Just a reminder about your {activity_name} {time_context}. Are you prepared?",
+    "meal": "{greeting} {username}! This is TingTing reminding you it's time for {activity_name} {time_context}. Have you eaten yet?",
+    "study": "{greeting} {username}, TingTing here. It's time for your {activity_name} {time_context}. Are you ready to focus?",
+    "sleep": "{greeting} {username}, this is TingTing. Just a gentle reminder that it's time to prepare for {activity_name} {time_context}.",
+    "detailed": "{greeting} {username}, TingTing here. {detailed_desc} {time_context}.",
+    "other": "{greeting} hardik, this is TingTing. It's time for your {activity_name} {time_context}. Are you ready?",
+}
+
+# (start hour, end hour, greeting, time context) for each part of the day
+DAYPARTS = [
+    (5, 12, "Good morning", "this morning"),
+    (12, 17, "Good afternoon", "this afternoon"),
+    (17, 22, "Good evening", "this evening"),
+]
+
+def get_daypart(hour):
+    """Return (greeting, time context) for an hour of the day."""
+    for start, end, greeting, time_context in DAYPARTS:
+        if start <= hour < end:
+            return greeting, time_context
+    return "Hello", "tonight"
+
+_config = None
+
+def get_vapi_config():
+    """Read the VAPI endpoint and credentials from the environment once."""
+    global _config
+    if _config is None:
+        _config = {
+            "url": os.getenv('VAPI_URL', "https://api.vapi.ai/call"),
+            "api_key": os.getenv('VAPI_API_KEY'),
+            "assistant_id": os.getenv('AGENT_ID'),
+            "target": os.getenv('TARGET'),
+            "phone_number_id": os.getenv('PHONE_NUMBER_ID'),
+            "timeout": float(os.getenv('VAPI_TIMEOUT', '10')),
+        }
+    return _config
+
+def build_prompt(activity_data=None, at=None):
+    """Create a personalized prompt based on the activity data for a call placed at `at`."""
+    if not activity_data:
+        return "Hi, this is TingTing checking in with your scheduled reminder."
+    # Extract user information
+    user_id = activity_data.get('user_id', '')
+    username = user_id.split('_')[-1] if '_' in user_id else user_id
+
+    # Extract activity information
+    activity_name = activity_data.get('description', '')
+    detailed_desc = activity_data.get('detailed_description', '')
+    if not activity_name:
+        return "Hi, this is TingTing checking in with your scheduled reminder."
+
+    # Convert the activity's 24-hour time to a more natural time description
+    time_context = ""
+    if 'frequency' in activity_data and 'time' in activity_data['frequency']:
+        try:
+            time_context = get_daypart(int(activity_data['frequency']['time'].split(':')[0]))[1]
+        except Exception:
+            time_context = "today"
+
+    # Personalize greeting based on the time of day the call is placed
+    greeting = get_daypart((at or datetime.now()).hour)[0]
+
+    category = categorize_activity(activity_name)
+    if category == "other" and detailed_desc:
+        category = "detailed"
+    return PROMPT_TEMPLATES[category].format(
+        greeting=greeting,
+        username=username,
+        activity_name=activity_name,
+        time_context=time_context,
+        detailed_desc=detailed_desc,
+    )
+
+class PreparedCall:
+    """A fully rendered VAPI request, ready to send."""
+
+    __slots__ = ("url", "headers", "body")
 
-    url = "https://api.vapi.ai/call"
+    def __init__(self, url, headers, body):
+        self.url = url
+        self.headers = headers
+        self.body = body
+
+def prepare_call(activity_data=None,task='',description='',activity_id="",at=None):
+    """Render the complete VAPI request for a call placed at `at` (default: now).
+
+    Returns:
+        PreparedCall with the URL, auth headers and JSON-encoded body
+    """
+    config = get_vapi_config()
     headers = {
-        "Authorization": f"Bearer {VAPI_API_KEY}",
+        "Authorization": f"Bearer {config['api_key']}",
         "Content-Type": "application/json"
     }
-    
-    # Create a personalized prompt based on the activity data
-    custom_prompt = "Hi, this is TingTing checking in with your scheduled reminder."
-    greeting = "Hi"
-    time_context = ""
-    
-    if activity_data:
-        # Extract user information
-        user_id = activity_data.get('user_id', '')
-        username = user_id.split('_')[-1] if '_' in user_id else user_id
-        
-        # Extract activity information
-        activity_name = activity_data.get('description', '')
-        detailed_desc = activity_data.get('detailed_description', '')
-        
-        # Get time information for context
-        if 'frequency' in activity_data and 'time' in activity_data['frequency']:
-            time_str = activity_data['frequency']['time']
-            
-            # Convert 24-hour time to more natural time description
-            try:
-                hour = int(time_str.split(':')[0])
-                if 5 <= hour < 12:
-                    time_context = "this morning"
-                elif 12 <= hour < 17:
-                    time_context = "this afternoon"
-                elif 17 <= hour < 22:
-                    time_context = "this evening"
-                else:
-                    time_context = "tonight"
-            except:
-                # If parsing fails, use generic time context
-                time_context = "today"
-        
-        # Personalize greeting based on time of day
-        current_hour = datetime.now().hour
-        if 5 <= current_hour < 12:
-            greeting = "Good morning"
-        elif 12 <= current_hour < 17:
-            greeting = "Good afternoon"
-        elif 17 <= current_hour < 22:
-            greeting = "Good evening"
-        else:
-            greeting = "Hello"
-        
-        # Create personalized prompt based on activity type
-        if activity_name:
-            if "medicine" in activity_name.lower() or "pill" in activity_name.lower() or "medication" in activity_name.lower():
-                custom_prompt = f"{greeting} {username}, this is TingTing. It's time for your {activity_name} {time_context}. Have you taken it yet?"
-            elif "exercise" in activity_name.lower() or "workout" in activity_name.lower() or "fitness" in activity_name.lower():
-                custom_prompt = f"{greeting} {username}! TingTing here. Time for your {activity_name} {time_context}. Are you ready to get moving?"
-            elif "appointment" in activity_name.lower() or "meeting" in activity_name.lower() or "visit" in activity_name.lower():
-                custom_prompt = f"{greeting} {username}, TingTing here. Just a reminder about your {activity_name} {time_context}. Are you prepared?"
-            elif "meal" in activity_name.lower() or "eat" in activity_name.lower() or "food" in activity_name.lower() or "breakfast" in activity_name.lower() or "lunch" in activity_name.lower() or "dinner" in activity_name.lower():
-                custom_prompt = f"{greeting} {username}! This is TingTing reminding you it's time for {activity_name} {time_context}. Have you eaten yet?"
-            elif "study" in activity_name.lower() or "class" in activity_name.lower() or "lesson" in activity_name.lower():
-                custom_prompt = f"{greeting} {username}, TingTing here. It's time for your {activity_name} {time_context}. Are you ready to focus?"
-            elif "sleep" in activity_name.lower() or "bed" in activity_name.lower() or "rest" in activity_name.lower():
-                custom_prompt = f"{greeting} {username}, this is TingTing. Just a gentle reminder that it's time to prepare for {activity_name} {time_context}."
-            else:                # Use detailed description if available
-                if detailed_desc:
-                    custom_prompt = f"{greeting} {username}, TingTing here. {detailed_desc} {time_context}."
-                else:
-                    custom_prompt = f"{greeting} hardik, this is TingTing. It's time for your {activity_name} {time_context}. Are you ready?"
-                    
     payload = {
-        "assistantId": AGENT_ID,
-        "phoneNumberId": PHONE_NUMBER_ID,
+        "assistantId": config['assistant_id'],
+        "phoneNumberId": config['phone_number_id'],
         "customer": {
-            "number": TARGET
-        },        "assistantOverrides": {
+            "number": config['target']
+        },
+        "assistantOverrides": {
             "variableValues": {
-                "custom_prompt": custom_prompt,
+                "custom_prompt": build_prompt(activity_data, at),
                 "task":task,
                 "description":description,
                 "activity_id":activity_id
             }
         }
     }
+    return PreparedCall(config['url'], headers, json.dumps(payload).encode())
 
-    resp = requests.post(url, headers=headers, json=payload)
-    print(resp.status_code, resp.text)
-    
+def send_call(prepared, session=None, timeout=None):
+    """POST a PreparedCall over the shared keep-alive session."""
+    session = session or get_session()
+    if timeout is None:
+        timeout = get_vapi_config()['timeout']
+    try:
+        resp = session.post(prepared.url, headers=prepared.headers, data=prepared.body, timeout=timeout)
+    except requests.RequestException:
+        metrics.VAPI_RESPONSES.inc(status="error")
+        raise
+    metrics.VAPI_RESPONSES.inc(status=resp.status_code)
+    log(logger, DEBUG if resp.status_code < 400 else WARNING, "vapi response",
+        sample=None if resp.status_code < 400 else get_sample_every(), status=resp.status_code, body=resp.text[:200])
     return resp
 
+class PayloadCache:
+    """Calls rendered ahead of their fire time, keyed by (activity id, fire instant).
+
+    The scheduler's sync loops discard() an activity's renders whenever it is updated
+    or deleted, a render made from an older updatedAt is redone when prerender() is
+    handed the newer document, and pop() only returns a render made from the updatedAt
+    of the activity being fired, so an edit just before the fire is never dialed stale.
+    """
+
+    def __init__(self):
+        self._prepared = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._prepared)
+
+    def prerender(self, activity_data, fire_at):
+        """Render the call for one upcoming fire unless it is already cached for this version."""
+        key = (str(activity_data.get('_id', 'unknown')), fire_at)
+        version = activity_data.get('updatedAt')
+        cached = self._prepared.get(key)
+        if cached is not None and cached[0] == version:
+            return
+        form = activity_data.get('form') or {}
+        prepared = prepare_call(activity_data, form.get('name', ''), form.get('description', ''), key[0], at=fire_at)
+        with self._lock:
+            self._prepared[key] = (version, prepared)
+
+    def pop(self, activity_id, fire_at, version=None):
+        """Take the render for a fire, or None if there is none for this updatedAt version."""
+        with self._lock:
+            cached = self._prepared.pop((str(activity_id), fire_at), None)
+        if cached is None or cached[0] != version:
+            return None
+        return cached[1]
+
+    def discard(self, activity_id):
+        """Drop every render for an activity, e.g. after it was edited or deleted."""
+        activity_id = str(activity_id)
+        with self._lock:
+            for key in [key for key in self._prepared if key[0] == activity_id]:
+                del self._prepared[key]
+
+    def discard_before(self, moment):
+        """Drop renders for fires that were never sent, e.g. skipped or deleted activities."""
+        with self._lock:
+            for key in [key for key in self._prepared if key[1] < moment]:
+                del self._prepared[key]
+
+payload_cache = PayloadCache()
+
+def call(activity_data=None,task='',description='',activity_id="",session=None,timeout=None,fire_at=None):
+    """Make a call using the VAPI API with personalized prompt based on activity data.
+    
+    Args:
+        activity_data: Optional dictionary containing activity information
+        session: requests session to send with; defaults to the shared keep-alive session
+        timeout: Request timeout in seconds; defaults to VAPI_TIMEOUT or 10
+        fire_at: Scheduled fire instant; a payload pre-rendered for it from this version of the activity is sent as-is
+    """
+    prepared = None
+    if fire_at is not None:
+        prepared = payload_cache.pop(activity_id, fire_at, (activity_data or {}).get('updatedAt'))
+    if prepared is None:
+        prepared = prepare_call(activity_data, task, description, activity_id)
+    return send_call(prepared, session=session, timeout=timeout)
+
 if __name__ == "__main__":
     # Test the call function directly
     call()
@@ -0,0 +1,74 @@
+import threading
+import time
+from datetime import datetime, timedelta
+
+
+class SystemClock:
+    """The wall clock; what the scheduler uses outside of simulations."""
+
+    def now(self):
+        return datetime.now()
+
+    def time(self):
+        return time.time()
+
+    def monotonic(self):
+        return time.monotonic()
+
+    def sleep(self, seconds):
+        time.sleep(seconds)
+
+
+class VirtualClock:
+    """Simulated time that skips sleeps but lets compute time pass.
+
+    Sleeping jumps straight to the wake-up instant, so a week of one-minute ticks
+    replays in however long the ticks themselves take. Time spent working between
+    sleeps still advances the clock (multiplied by compute_scale), so a slow tick
+    shows up as late dispatches just like it would in production.
+
+    Args:
+        start: Naive local datetime the simulation starts at
+        compute_scale: How much simulated time one real second of work takes; 0 freezes
+            the clock between sleeps
+    """
+
+    def __init__(self, start, compute_scale=1.0):
+        self.start = start
+        self.compute_scale = compute_scale
+        self._elapsed = 0.0
+        self._anchor = time.perf_counter()
+        self._lock = threading.Lock()
+
+    def _seconds(self):
+        return self._elapsed + (time.perf_counter() - self._anchor) * self.compute_scale
+
+    def now(self):
+        with self._lock:
+            return self.start + timedelta(seconds=self._seconds())
+
+    def time(self):
+        return self.now().timestamp()
+
+    def monotonic(self):
+        with self._lock:
+            return self._seconds()
+
+    def sleep(self, seconds):
+        with self._lock:
+            self._elapsed = self._seconds() + max(seconds, 0)
+            self._anchor = time.perf_counter()
+
+
+_clock = SystemClock()
+
+
+def get_clock():
+    """Return the process-wide clock, the wall clock unless set_clock replaced it."""
+    return _clock
+
+
+def set_clock(clock):
+    """Use clock wherever no clock is passed explicitly, e.g. a VirtualClock in simulations."""
+    global _clock
+    _clock = clock
@@ -0,0 +1,84 @@
+import os
+import time
+from collections import OrderedDict
+from datetime import datetime
+from pymongo import ASCENDING
+from pymongo.errors import DuplicateKeyError, OperationFailure, PyMongoError
+from logs import get_logger, log, get_sample_every, INFO, ERROR
+
+logger = get_logger("dedupe")
+
+
+class DedupeLedger:
+    """Records which (activity, fire instant) pairs have been dialed.
+
+    Claims are kept in memory with TTL eviction, so memory stays flat, and in a
+    Mongo collection with a unique index so a restarted or second scheduler cannot
+    claim the same fire again.
+
+    Args:
+        collection: Mongo collection for claims, or None for an in-memory-only ledger
+        ttl_seconds: How long a claim is remembered; defaults to DEDUPE_TTL_SECONDS or 2 days
+    """
+
+    def __init__(self, collection=None, ttl_seconds=None):
+        self.collection = collection
+        self.ttl_seconds = ttl_seconds or int(os.getenv("DEDUPE_TTL_SECONDS", str(2 * 24 * 3600)))
+        self._claims = OrderedDict()
+        if collection is not None:
+            collection.create_index([("activity_id", ASCENDING), ("fire_at", ASCENDING)], unique=True)
+            try:
+                collection.create_index("claimed_at", expireAfterSeconds=self.ttl_seconds)
+            except OperationFailure as e:
+                log(logger, INFO, "keeping existing claimed_at TTL index", error=e)
+
+    def __len__(self):
+        return len(self._claims)
+
+    def __contains__(self, claim):
+        self._evict()
+        return claim in self._claims
+
+    def _evict(self):
+        now = time.monotonic()
+        while self._claims:
+            key, expires = next(iter(self._claims.items()))
+            if expires > now:
+                break
+            self._claims.popitem(last=False)
+
+    def _remember(self, claim):
+        self._claims[claim] = time.monotonic() + self.ttl_seconds
+        self._claims.move_to_end(claim)
+
+    def claim(self, activity_id, fire_at):
+        """Atomically claim a fire; returns False if it was already claimed."""
+        claim = (str(activity_id), fire_at)
+        if claim in self:
+            return False
+        if self.collection is not None:
+            try:
+                self.collection.insert_one({
+                    "activity_id": claim[0],
+                    "fire_at": fire_at,
+                    "claimed_at": datetime.utcnow(),
+                })
+            except DuplicateKeyError:
+                self._remember(claim)
+                return False
+            except PyMongoError as e:
+                log(logger, ERROR, "could not persist claim, using memory only", sample=get_sample_every(),
+                    activity=claim[0], fire_at=fire_at, error=e)
+        self._remember(claim)
+        return True
+
+    def release(self, activity_id, fire_at):
+        """Forget a claim whose call could not be handed off, so the fire can be claimed again."""
+        claim = (str(activity_id), fire_at)
+        self._claims.pop(claim, None)
+        if self.collection is not None:
+            try:
+                self.collection.delete_one({"activity_id": claim[0], "fire_at": fire_at})
+            except PyMongoError as e:
+                log(logger, ERROR, "could not release claim", sample=get_sample_every(),
+                    activity=claim[0], fire_at=fire_at, error=e)
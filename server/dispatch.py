@@ -0,0 +1,104 @@
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from call import get_session
+from clock import get_clock
+from logs import get_logger, log, get_sample_every, ERROR
+import metrics
+
+logger = get_logger("dispatch")
+
+
+class Dispatcher:
+    """Runs due jobs concurrently over a shared keep-alive HTTP session.
+
+    Args:
+        job: Callable taking (activity_data, session=..., timeout=..., fire_at=...) and returning
+            the HTTP response, e.g. job.execute_scheduled_job
+        max_workers: Concurrency limit; defaults to DISPATCH_CONCURRENCY or 16
+        timeout: Per-request timeout in seconds; defaults to VAPI_TIMEOUT or 10
+        session: requests session to share between workers
+        clock: Clock dispatch lag is measured against; defaults to clock.get_clock()
+    """
+
+    def __init__(self, job, max_workers=None, timeout=None, session=None, clock=None):
+        self.job = job
+        self.clock = clock
+        self.max_workers = max_workers or int(os.getenv("DISPATCH_CONCURRENCY", "16"))
+        self.timeout = timeout if timeout is not None else float(os.getenv("VAPI_TIMEOUT", "10"))
+        self.session = session or get_session(self.max_workers)
+        self._pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="dispatch")
+        self._lock = threading.Lock()
+        self._durations = deque(maxlen=1000)
+        self._lags = deque(maxlen=1000)
+        self.sent = 0
+        self.failed = 0
+
+    def _run(self, activity, fire_at):
+        started = time.perf_counter()
+        ok = False
+        error = None
+        try:
+            response = self.job(activity, session=self.session, timeout=self.timeout, fire_at=fire_at)
+            status_code = getattr(response, "status_code", None)
+            ok = status_code == 200
+            if not ok:
+                error = f"status {status_code}" if status_code is not None else "no response"
+        except Exception as e:
+            error = str(e)
+            log(logger, ERROR, "dispatch failed", sample=get_sample_every(), activity=activity.get("_id", "unknown"), error=e)
+        duration = time.perf_counter() - started
+        lag = ((self.clock or get_clock()).now() - fire_at).total_seconds() if fire_at is not None else None
+        metrics.DISPATCH_SECONDS.observe(duration)
+        if lag is not None:
+            metrics.DISPATCH_LAG_SECONDS.observe(lag)
+        with self._lock:
+            self._durations.append(duration)
+            if lag is not None:
+                self._lags.append(lag)
+            if ok:
+                self.sent += 1
+            else:
+                self.failed += 1
+        return ok, error
+
+    def submit(self, activity, fire_at=None):
+        """Queue one job and return a future resolving to (ok, error)."""
+        return self._pool.submit(self._run, activity, fire_at)
+
+    def dispatch(self, jobs):
+        """Run (fire_at, activity) pairs concurrently and wait for all of them.
+
+        Returns:
+            Number of jobs whose call was accepted with a 200
+        """
+        futures = [self.submit(activity, fire_at) for fire_at, activity in jobs]
+        return sum(1 for future in futures if future.result()[0])
+
+    def stats(self):
+        """Return request latency and dispatch lag percentiles in seconds."""
+        with self._lock:
+            durations = sorted(self._durations)
+            lags = sorted(self._lags)
+            sent, failed = self.sent, self.failed
+        return {
+            "sent": sent,
+            "failed": failed,
+            "latency": _percentiles(durations),
+            "lag": _percentiles(lags),
+        }
+
+    def shutdown(self):
+        self._pool.shutdown(wait=True)
+
+
+def _percentiles(values):
+    if not values:
+        return {}
+    return {
+        "p50": values[len(values) // 2],
+        "p95": values[min(len(values) - 1, int(len(values) * 0.95))],
+        "max": values[-1],
+    }
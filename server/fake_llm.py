@@ -0,0 +1,48 @@
+import json
+import threading
+import time
+from datetime import datetime
+from langchain_core.language_models.chat_models import SimpleChatModel
+from fast_parser import USER_ID_RE
+
+_lock = threading.Lock()
+
+
+class FakeLLM(SimpleChatModel):
+    """Local stand-in for the Gemini chat model with a fixed latency.
+
+    Install it with tools.set_llm(FakeLLM(latency=0.5)). Extraction prompts get a
+    valid activity JSON for the user id in the input; anything else (the ReAct
+    agent) gets a final answer straight away, so each agent query costs one call.
+
+    Usage:
+        from tools import set_llm
+        set_llm(FakeLLM(latency=0.2))
+    """
+
+    latency: float = 0.0
+    answer: str = "Done."
+    calls: int = 0
+
+    @property
+    def _llm_type(self):
+        return "fake"
+
+    def _call(self, messages, stop=None, run_manager=None, **kwargs):
+        with _lock:
+            self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+        prompt = "\n".join(str(message.content) for message in messages)
+        if "data extraction assistant" in prompt:
+            match = USER_ID_RE.search(prompt)
+            return json.dumps({
+                "user_id": match.group(1) if match else "user_bench",
+                "description": "Synthetic reminder",
+                "time": "09:00",
+                "date": datetime.now().strftime("%Y-%m-%d"),
+                "tags": ["task"],
+                "type": "one_time",
+                "pattern": [],
+            })
+        return f"Final Answer: {self.answer}"
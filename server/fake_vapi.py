@@ -0,0 +1,88 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class FakeVapiServer:
+    """Local stand-in for the VAPI call endpoint.
+
+    Point call() at it with VAPI_URL=<server.url>. Every POST is recorded, with
+    its perf_counter arrival time in arrivals, and answered with status after
+    sleeping latency seconds.
+
+    Usage:
+        with FakeVapiServer(latency=0.2) as server:
+            os.environ["VAPI_URL"] = server.url
+            ...
+    """
+
+    def __init__(self, latency=0.0, status=200, port=0):
+        self.latency = latency
+        self.status = status
+        self.requests = []
+        self.arrivals = []
+        self._lock = threading.Lock()
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                body = self.rfile.read(length)
+                arrived = time.perf_counter()
+                with fake._lock:
+                    fake.requests.append(json.loads(body or b"{}"))
+                    fake.arrivals.append(arrived)
+                if fake.latency:
+                    time.sleep(fake.latency)
+                reply = json.dumps({"id": f"call_{len(fake.requests)}", "status": "queued"}).encode()
+                self.send_response(fake.status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(reply)))
+                self.end_headers()
+                self.wfile.write(reply)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address
+        return f"http://{host}:{port}/call"
+
+    def reset(self):
+        """Forget recorded requests, e.g. between benchmark rounds."""
+        with self._lock:
+            self.requests.clear()
+            self.arrivals.clear()
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+if __name__ == "__main__":
+    server = FakeVapiServer().start()
+    print(f"Fake VAPI listening on {server.url}")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        server.stop()
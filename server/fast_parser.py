@@ -0,0 +1,235 @@
+import os
+import re
+from datetime import datetime, timedelta
+from call import categorize_activity
+from logs import get_logger, log, WARNING
+
+logger = get_logger("fast_parser")
+
+WEEKDAY_NAMES = {
+    "monday": "mon", "mon": "mon", "tuesday": "tue", "tues": "tue", "tue": "tue",
+    "wednesday": "wed", "wed": "wed", "thursday": "thu", "thurs": "thu", "thu": "thu",
+    "friday": "fri", "fri": "fri", "saturday": "sat", "sat": "sat", "sunday": "sun", "sun": "sun",
+}
+ALL_DAYS = ["mon", "tue", "wed", "thu", "fri", "sat", "sun"]
+WEEKDAY_PATTERN = r"(?:monday|tuesday|wednesday|thursday|friday|saturday|sunday|mon|tues?|wed|thurs?|fri|sat|sun)s?"
+
+USER_ID_RE = re.compile(r"\b(u(?:se)?r+[_-][A-Za-z0-9]+)\b", re.I)
+# "for user 123", or "for <id>" where the id mixes digits with letters or underscores
+FOR_USER_RE = re.compile(r"\bfor\s+(?:user\s+(\w[\w-]*)|((?=\w*[A-Za-z_])(?=\w*\d)\w[\w-]*))", re.I)
+CLOCK_RE = re.compile(r"\b(?:at\s+)?(?<![\d.:])(\d{1,2})(?:[:.](\d{2}))?\s*(a\.?m\.?|p\.?m\.?)(?=\W|$)|\b(?:at\s+)?(?<![\d.:])([01]?\d|2[0-3]):([0-5]\d)\b", re.I)
+CLOCK_WORD_RE = re.compile(r"^\d{1,2}(?:[:.]\d{2})?(?:am|pm)$", re.I)
+# A time the rules could not read, e.g. "at 13pm" or "at 9,30"
+STRAY_TIME_RE = re.compile(r"\bat\s+\d|\d\s*[ap]\.?m\b", re.I)
+NAMED_TIME_RE = re.compile(r"\b(?:at\s+)?(noon|midday|midnight)\b", re.I)
+RELATIVE_RE = re.compile(r"\bin\s+(\d+|an?|one)\s*(minutes?|mins?|hours?|hrs?)\b", re.I)
+ISO_DATE_RE = re.compile(r"\b(?:on\s+)?(\d{4}-\d{2}-\d{2})\b")
+RELATIVE_DATE_RE = re.compile(r"\b(?:starting\s+|from\s+)?(day after tomorrow|tomorrow|today|tonight)\b", re.I)
+DAILY_RE = re.compile(r"\b(?:every\s*day|everyday|daily|each\s+day|twice\s+(?:a\s+)?daily|twice\s+a\s+day)\b", re.I)
+WEEKDAYS_RE = re.compile(r"\b(?:every\s+)?(weekdays|weekends)\b", re.I)
+EVERY_DAY_RE = re.compile(rf"\b(?:every|each|on)\s+({WEEKDAY_PATTERN}(?:\s*(?:,|and|&)\s*{WEEKDAY_PATTERN})*)\b", re.I)
+NEXT_DAY_RE = re.compile(rf"\b(?:next|this|on)\s+({WEEKDAY_PATTERN})\b", re.I)
+DURATION_RE = re.compile(r"\b(?:and\s+)?(?:continuing\s+)?for\s+(?:the\s+)?(?:next\s+)?(\d+|an?|one|two|three|four)\s*(days?|weeks?|wks?|months?)\b", re.I)
+# Date and recurrence wording the rules above don't understand; if any is left over, the LLM decides
+UNPARSED_TEMPORAL_RE = re.compile(
+    rf"\b(?:next|last|until|till|except|excluding|starting|beginning|other\s+day"
+    r"|in\s+(?:\d+|an?|one|two|three|four|a\s+few)\s*(?:days?|weeks?|wks?|months?|years?)"
+    r"|(?:the\s+)?\d{1,2}(?:st|nd|rd|th)|\d{1,2}/\d{1,2}(?:/\d{2,4})?"
+    r"|weeks?|fortnight(?:ly)?|months?|years?|weekly|monthly|yearly|annually|every|each"
+    r"|jan(?:uary)?|feb(?:ruary)?|march|apr(?:il)?|june?|july?|aug(?:ust)?|sept?(?:ember)?|oct(?:ober)?|nov(?:ember)?|dec(?:ember)?"
+    rf"|{WEEKDAY_PATTERN})\b",
+    re.I,
+)
+FILLER_RE = re.compile(r"^\s*(?:please\s+)?(?:add|create|schedule|set)?\s*(?:an?\s+)?(?:new\s+)?(?:activity|reminder|task)?\s*(?:for\s+)?(?:called|named|to)?\s*|\b(?:remind\s+(?:me|them)\s+to)\b", re.I)
+
+NUMBER_WORDS = {"a": 1, "an": 1, "one": 1, "two": 2, "three": 3, "four": 4}
+
+
+def _number(value):
+    return NUMBER_WORDS.get(value.lower()) or int(value)
+
+
+def _clock(match):
+    """Convert a CLOCK_RE match into HH:MM, or None if it is not a real time like "13pm"."""
+    if match.group(1):
+        if not 1 <= int(match.group(1)) <= 12:
+            return None
+        hour = int(match.group(1)) % 12
+        minute = int(match.group(2) or 0)
+        if match.group(3).lower().startswith("p"):
+            hour += 12
+    else:
+        hour, minute = int(match.group(4)), int(match.group(5))
+    if hour > 23 or minute > 59:
+        return None
+    return f"{hour:02d}:{minute:02d}"
+
+
+def _days(text):
+    """Return the short names of the weekdays mentioned in text, e.g. ["mon", "wed"]."""
+    days = []
+    for day in re.findall(WEEKDAY_PATTERN, text, re.I):
+        day = day.lower()
+        days.append(WEEKDAY_NAMES.get(day) or WEEKDAY_NAMES[day[:-1]])
+    return days
+
+
+def _recurring_days(text):
+    """The EVERY_DAY_RE match naming repeating weekdays: "every mon", "each tue" or plural "on fridays"."""
+    for match in EVERY_DAY_RE.finditer(text):
+        if not match.group(0).lower().startswith("on") or re.match(rf"on\s+{WEEKDAY_PATTERN}s\b", match.group(0), re.I):
+            return match
+    return None
+
+
+def parse_activity(input_str, now=None):
+    """Extract activity fields from simple inputs without calling the LLM.
+
+    Fills the same schema as the extraction prompt in tools.extract_activity_data_with_llm.
+
+    Args:
+        input_str: User input, e.g. "user_123 take medicine at 9:45 pm tomorrow"
+        now: Reference time for relative dates; defaults to datetime.now()
+
+    Returns:
+        (data, confidence) where confidence in [0, 1] says how safely the rules
+        covered the input; callers fall back to the LLM below their threshold
+    """
+    now = now or datetime.now()
+    text = input_str.strip()
+    confidence = 1.0
+    consumed = []
+
+    def take(match):
+        consumed.append(match.span())
+
+    data = {
+        "user_id": "",
+        "description": "",
+        "time": "",
+        "date": now.strftime("%Y-%m-%d"),
+        "tags": [],
+        "type": "one_time",
+        "pattern": [],
+        "duration": "",
+    }
+
+    match = USER_ID_RE.search(text)
+    if match:
+        data["user_id"] = match.group(1)
+        take(match)
+    else:
+        match = next((match for match in FOR_USER_RE.finditer(text)
+                      if not CLOCK_WORD_RE.match(match.group(1) or match.group(2))), None)
+        if match:
+            data["user_id"] = match.group(1) or match.group(2)
+            take(match)
+        else:
+            # Without a recognisable id the LLM is better at finding one, e.g. "10 pushups at 9pm"
+            confidence = min(confidence, 0.2)
+
+    times = []
+    for match in CLOCK_RE.finditer(text):
+        clock = _clock(match)
+        if clock:
+            times.append(clock)
+            take(match)
+        else:
+            confidence = min(confidence, 0.4)
+    for match in NAMED_TIME_RE.finditer(text):
+        times.append("12:00" if match.group(1).lower() != "midnight" else "00:00")
+        take(match)
+    moment = None
+    for match in RELATIVE_RE.finditer(text):
+        amount = _number(match.group(1))
+        unit = match.group(2).lower()
+        moment = now + (timedelta(hours=amount) if unit.startswith("h") else timedelta(minutes=amount))
+        times.append(moment.strftime("%H:%M"))
+        take(match)
+    if not times:
+        confidence = min(confidence, 0.4)
+    elif len(set(times)) > 1:
+        # The schema holds one time; let the LLM decide how to represent several
+        confidence = min(confidence, 0.5)
+    else:
+        data["time"] = times[0]
+    if moment is not None:
+        data["date"] = moment.strftime("%Y-%m-%d")
+
+    for match in ISO_DATE_RE.finditer(text):
+        data["date"] = match.group(1)
+        take(match)
+    for match in RELATIVE_DATE_RE.finditer(text):
+        word = match.group(1).lower()
+        offset = {"today": 0, "tonight": 0, "tomorrow": 1, "day after tomorrow": 2}[word]
+        data["date"] = (now + timedelta(days=offset)).strftime("%Y-%m-%d")
+        take(match)
+
+    if DAILY_RE.search(text):
+        data["type"] = "recurring"
+        data["pattern"] = list(ALL_DAYS)
+        take(DAILY_RE.search(text))
+    elif WEEKDAYS_RE.search(text):
+        match = WEEKDAYS_RE.search(text)
+        data["type"] = "recurring"
+        data["pattern"] = ALL_DAYS[:5] if match.group(1).lower() == "weekdays" else ALL_DAYS[5:]
+        take(match)
+    elif _recurring_days(text):
+        match = _recurring_days(text)
+        data["type"] = "recurring"
+        data["pattern"] = sorted(set(_days(match.group(1))), key=ALL_DAYS.index)
+        take(match)
+    else:
+        match = NEXT_DAY_RE.search(text)
+        if match:
+            day = ALL_DAYS.index(_days(match.group(1))[0])
+            offset = (day - now.weekday()) % 7 or 7
+            data["date"] = (now + timedelta(days=offset)).strftime("%Y-%m-%d")
+            take(match)
+    if re.search(r"\b(?:every|weekly|monthly|hourly|alternate)\b", text, re.I) and data["type"] != "recurring":
+        confidence = min(confidence, 0.5)
+
+    match = DURATION_RE.search(text)
+    if match:
+        amount = _number(match.group(1))
+        unit = match.group(2).lower()
+        unit = "week" if unit.startswith("w") else "month" if unit.startswith("m") else "day"
+        data["duration"] = f"{amount} {unit}{'s' if amount != 1 else ''}"
+        take(match)
+
+    spans = []
+    for start, end in sorted(consumed):
+        if spans and start <= spans[-1][1]:
+            spans[-1][1] = max(spans[-1][1], end)
+        else:
+            spans.append([start, end])
+    remaining = text
+    for start, end in reversed(spans):
+        remaining = remaining[:start] + " " + remaining[end:]
+    remaining = FILLER_RE.sub(" ", remaining)
+    remaining = re.sub(r"\b(?:at|on|starting|from|and|for|every)\s*(?=[,.]|$)", " ", remaining, flags=re.I)
+    remaining = re.sub(r"^[\s,.:-]*(?:to\s+)?|[\s,.:-]+$", "", re.sub(r"\s+", " ", remaining))
+    data["description"] = remaining
+    if not remaining:
+        confidence = min(confidence, 0.3)
+    elif UNPARSED_TEMPORAL_RE.search(remaining) or STRAY_TIME_RE.search(remaining):
+        # e.g. "next week", "in 2 days", "until friday": the date or time above would be wrong
+        confidence = min(confidence, 0.4)
+
+    category = categorize_activity(remaining)
+    data["tags"] = [category] if category != "other" else ["task"]
+    return data, confidence
+
+
+def get_min_confidence():
+    """Inputs parsed below FAST_PARSE_MIN_CONFIDENCE (default 0.8) go to the LLM."""
+    return float(os.getenv("FAST_PARSE_MIN_CONFIDENCE", "0.8"))
+
+
+def try_parse_activity(input_str, now=None):
+    """parse_activity, but an input the rules trip over gets confidence 0 so it goes to the LLM."""
+    try:
+        return parse_activity(input_str, now)
+    except Exception as e:
+        log(logger, WARNING, "fast parser failed, deferring to the LLM", input=input_str, error=e)
+        return None, 0.0
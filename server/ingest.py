@@ -0,0 +1,268 @@
+import atexit
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from pymongo import ASCENDING, UpdateOne
+from pymongo.errors import BulkWriteError, OperationFailure
+from logs import get_logger, log, INFO, WARNING, ERROR
+from rollups import COMPLETED_VALUES
+import metrics
+
+logger = get_logger("ingest")
+
+QUEUED = "queued"
+DUPLICATE = "duplicate"
+FULL = "full"
+
+
+def parse_outcome(data):
+    """Pull one call outcome out of a webhook body.
+
+    Accepts the flat body save-response takes (activityId / activity_id / "activity id",
+    completed, details, task) plus a call id, or a VAPI end-of-call report, where the
+    activity id comes back from the assistantOverrides variableValues call() sent.
+
+    Returns:
+        Dictionary with call_id, activityId, completed, details and task
+
+    Raises:
+        ValueError: If the call id, activity id or completion is missing
+    """
+    if not isinstance(data, dict):
+        raise ValueError("Body must be a JSON object")
+    message = data.get("message") if isinstance(data.get("message"), dict) else None
+    if message is not None:
+        call = message.get("call") or {}
+        variables = ((call.get("assistantOverrides") or {}).get("variableValues") or {})
+        analysis = message.get("analysis") or {}
+        call_id = call.get("id")
+        activity_id = variables.get("activity_id")
+        completed = analysis.get("successEvaluation")
+        details = analysis.get("summary") or message.get("summary") or ""
+        task = variables.get("task") or ""
+    else:
+        call_id = data.get("call_id") or data.get("callId")
+        activity_id = data.get("activityId") or data.get("activity_id") or data.get("activity id")
+        completed = data.get("completed")
+        details = data.get("details") or ""
+        task = data.get("task") or ""
+    if not call_id:
+        raise ValueError("Missing call id")
+    if not activity_id or completed is None:
+        raise ValueError("Missing required fields")
+    return {
+        "call_id": str(call_id),
+        "activityId": str(activity_id),
+        # The same test the adherence rollups apply to records written by save-response
+        "completed": completed in COMPLETED_VALUES,
+        "details": str(details),
+        "task": str(task),
+    }
+
+
+def ensure_outcome_indexes(records):
+    """Unique call_id on records, so a redelivered outcome can't become a second record."""
+    try:
+        records.create_index([("call_id", ASCENDING)], unique=True,
+                             partialFilterExpression={"call_id": {"$exists": True}})
+    except OperationFailure as e:
+        log(logger, WARNING, "could not create call_id index", error=e)
+
+
+class OutcomeBuffer:
+    """Call outcomes held in memory and written to records in one bulk_write.
+
+    A background thread flushes when flush_size outcomes are waiting or the oldest
+    has waited flush_seconds, so the webhook only pays for a dictionary insert.
+    Writes are upserts on call_id with $setOnInsert, so redelivered outcomes and
+    retried flushes never create a second record. createdAt is set just before the
+    batch is written, like the insertOne it replaces, and the time the outcome
+    arrived is kept in receivedAt. A slow write can still commit a record behind
+    one another writer already committed; the rollups' RecordFeed allows for that.
+    A flush that fails for any reason puts its outcomes back and is retried after
+    flush_seconds.
+
+    Args:
+        records: The records collection
+        flush_size: Defaults to OUTCOME_FLUSH_SIZE or 200
+        flush_seconds: Defaults to OUTCOME_FLUSH_SECONDS or 1
+        max_pending: Outcomes held before add() refuses more; defaults to OUTCOME_BUFFER_MAX or 10000
+        recent_size: How many flushed call ids are remembered to answer duplicates without Mongo
+    """
+
+    def __init__(self, records, flush_size=None, flush_seconds=None, max_pending=None, recent_size=10000):
+        self.records = records
+        self.flush_size = flush_size or int(os.getenv("OUTCOME_FLUSH_SIZE", "200"))
+        self.flush_seconds = flush_seconds or float(os.getenv("OUTCOME_FLUSH_SECONDS", "1"))
+        self.max_pending = max_pending or int(os.getenv("OUTCOME_BUFFER_MAX", "10000"))
+        self.recent_size = recent_size
+        self._pending = OrderedDict()
+        self._recent = OrderedDict()
+        self._oldest = None
+        self._retry_at = 0
+        self._cond = threading.Condition()
+        self._flush_lock = threading.Lock()
+        self._closed = False
+        self._thread = None
+        self.flushed = 0
+        self.failed_flushes = 0
+
+    def __len__(self):
+        with self._cond:
+            return len(self._pending)
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="outcome-flush", daemon=True)
+        self._thread.start()
+        return self
+
+    def add(self, outcome):
+        """Queue an outcome from parse_outcome.
+
+        Returns:
+            QUEUED, DUPLICATE if the call id is already queued or was recently written,
+            or FULL if the buffer is at max_pending
+        """
+        call_id = outcome["call_id"]
+        with self._cond:
+            if call_id in self._pending or call_id in self._recent:
+                metrics.OUTCOMES_RECEIVED.inc(result=DUPLICATE)
+                return DUPLICATE
+            if len(self._pending) >= self.max_pending:
+                metrics.OUTCOMES_RECEIVED.inc(result=FULL)
+                return FULL
+            self._pending[call_id] = dict(outcome, receivedAt=datetime.utcnow())
+            depth = len(self._pending)
+            if self._oldest is None:
+                # The flush thread sleeps without a deadline while the buffer is empty
+                self._oldest = time.monotonic()
+                self._cond.notify()
+            elif depth >= self.flush_size:
+                self._cond.notify()
+        metrics.OUTCOMES_RECEIVED.inc(result=QUEUED)
+        metrics.OUTCOME_BUFFER_DEPTH.set(depth)
+        return QUEUED
+
+    def _due(self):
+        if not self._pending:
+            return False
+        if self._closed:
+            return True
+        now = time.monotonic()
+        if now < self._retry_at:
+            return False
+        return len(self._pending) >= self.flush_size or now - self._oldest >= self.flush_seconds
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._due():
+                    if self._closed:
+                        return
+                    timeout = None
+                    if self._oldest is not None:
+                        timeout = max(self._oldest + self.flush_seconds, self._retry_at) - time.monotonic()
+                    self._cond.wait(None if timeout is None else max(timeout, 0))
+            failures = self.failed_flushes
+            try:
+                self.flush()
+            except Exception as e:
+                # flush() puts back what it couldn't write; whatever broke, keep the thread alive
+                log(logger, ERROR, "outcome flush thread error", error=e)
+                self.failed_flushes += 1
+            if self.failed_flushes != failures:
+                if self._closed:
+                    return
+                # Don't retry a failing write in a tight loop
+                self._retry_at = time.monotonic() + self.flush_seconds
+
+    def flush(self):
+        """Write everything pending with one unordered bulk_write.
+
+        Returns:
+            Number of outcomes written; on failure they go back in the buffer for the next flush
+        """
+        with self._flush_lock:
+            with self._cond:
+                batch = self._pending
+                self._pending = OrderedDict()
+                self._oldest = None
+            if not batch:
+                return 0
+            started = time.perf_counter()
+            try:
+                created_at = datetime.utcnow()
+                operations = [
+                    UpdateOne({"call_id": call_id}, {"$setOnInsert": dict(outcome, createdAt=created_at)}, upsert=True)
+                    for call_id, outcome in batch.items()
+                ]
+                self.records.bulk_write(operations, ordered=False)
+            except BulkWriteError as e:
+                # Two upserts racing on the unique index; the record exists either way
+                if any(error.get("code") != 11000 for error in e.details.get("writeErrors", [])):
+                    self._requeue(batch, e)
+                    return 0
+            except Exception as e:
+                self._requeue(batch, e)
+                return 0
+            took = time.perf_counter() - started
+            with self._cond:
+                for call_id in batch:
+                    self._recent[call_id] = True
+                while len(self._recent) > self.recent_size:
+                    self._recent.popitem(last=False)
+                depth = len(self._pending)
+            self.flushed += len(batch)
+            metrics.OUTCOME_FLUSH_SECONDS.observe(took)
+            metrics.OUTCOMES_WRITTEN.inc(len(batch))
+            metrics.OUTCOME_BUFFER_DEPTH.set(depth)
+            log(logger, INFO, "flushed outcomes", outcomes=len(batch), took=took)
+            return len(batch)
+
+    def _requeue(self, batch, error):
+        self.failed_flushes += 1
+        metrics.OUTCOME_FLUSH_FAILURES.inc()
+        with self._cond:
+            # Keep the original arrival order ahead of anything queued meanwhile
+            batch.update((call_id, outcome) for call_id, outcome in self._pending.items() if call_id not in batch)
+            self._pending = batch
+            self._oldest = time.monotonic()
+            depth = len(self._pending)
+            self._cond.notify()
+        metrics.OUTCOME_BUFFER_DEPTH.set(depth)
+        log(logger, ERROR, "could not flush outcomes, will retry", outcomes=depth, error=error)
+
+    def close(self):
+        """Stop the flush thread after writing whatever is still pending."""
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        if self._thread is not None:
+            self._thread.join(timeout=self.flush_seconds + 10)
+        self.flush()
+
+    def stats(self):
+        with self._cond:
+            depth = len(self._pending)
+        return {"depth": depth, "flushed": self.flushed, "failed_flushes": self.failed_flushes,
+                "flush_size": self.flush_size, "flush_seconds": self.flush_seconds}
+
+
+_buffer = None
+_buffer_lock = threading.Lock()
+
+
+def get_outcome_buffer():
+    """Return the process-wide OutcomeBuffer, starting its flush thread on first use."""
+    global _buffer
+    with _buffer_lock:
+        if _buffer is None:
+            from mongodb_utils import get_collection
+
+            records = get_collection("records")
+            ensure_outcome_indexes(records)
+            _buffer = OutcomeBuffer(records).start()
+            atexit.register(_buffer.close)
+    return _buffer
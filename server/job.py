@@ -1,119 +1,433 @@
+import argparse
+import multiprocessing
 import os
+import socket
 import time
-from datetime import datetime
+from datetime import datetime, timedelta
 import schedule
 from dotenv import load_dotenv
-from mongodb_utils import fetch_all_activities, db
-from call import call
+from mongodb_utils import get_collection, ensure_indexes, fetch_due_activities, set_next_fire_at, backfill_next_fire_at, archive_expired_activities, ensure_archive_indexes, count_activity_sets
+from call import call, payload_cache
+from scheduler import Scheduler, ScheduleIndex, activity_key
+from activity_cache import ActivityCache
+from clock import get_clock
+from dispatch import Dispatcher
+from dedupe import DedupeLedger
+from leases import LeaseManager
+from outbox import Outbox, drain
+from logs import get_logger, log, get_sample_every, DEBUG, INFO, WARNING, ERROR
+import metrics
 
 load_dotenv()
 
-def get_current_time():    
-    return datetime.now().strftime("%H:%M")
+logger = get_logger("scheduler")
 
-def get_current_date():    
-    return datetime.now().strftime("%Y-%m-%d")
+def get_current_time(clock=None):    
+    return (clock or get_clock()).now().strftime("%H:%M")
 
-def execute_scheduled_job(activity_data):
+def get_current_date(clock=None):    
+    return (clock or get_clock()).now().strftime("%Y-%m-%d")
+
+def execute_scheduled_job(activity_data, session=None, timeout=None, fire_at=None):
+    response = None
     try:
-        user_id = activity_data.get("user_id", "unknown")
-        description = activity_data.get("description", "your scheduled activity")
-        print(f"\n=== EXECUTING SCHEDULED JOB ===")
-        print(f"Time: {get_current_time()}")
-        print(f"Activity: {description}")
-        print(f"User: {user_id}")
-        response = call(activity_data,activity_data['form']['name'],activity_data['form']['description'],str(activity_data.get('_id', 'unknown')))
-        if hasattr(response, 'status_code') and response.status_code == 200:
-            print("Call successfully initiated!")
-        else:
-            print(f"Call failed or no response object.")
+        log(logger, DEBUG, "executing scheduled job", activity=activity_data.get("_id", "unknown"),
+            user=activity_data.get("user_id", "unknown"), fire_at=fire_at)
+        form = activity_data.get('form') or {}
+        response = call(activity_data,form.get('name', ''),form.get('description', ''),str(activity_data.get('_id', 'unknown')),session=session,timeout=timeout,fire_at=fire_at)
+        if not (hasattr(response, 'status_code') and response.status_code == 200):
+            log(logger, WARNING, "call not accepted", sample=get_sample_every(),
+                activity=activity_data.get("_id", "unknown"), status=getattr(response, "status_code", None))
     except Exception as e:
-        print(f"Error executing scheduled job: {e}")
-
-def check_activities(activities, executed_one_time):    
-    current_time = get_current_time()
-    current_date = get_current_date()
-    print(f"\n[LOG] Current time: {current_time}, Current date: {current_date}")
-    job_executed = False
-    for activity in activities:
-        activity_type = activity.get("type")
-        tags = activity.get("tags", [])
-        metadata = activity.get("metadata", {})
-        is_one_time = (
-            activity_type == "one_time" or
-            (isinstance(tags, list) and "one_time" in tags) or
-            (isinstance(metadata, dict) and metadata.get("method") == "one_time")
-        )
-        if is_one_time:
-            timestamp_str = activity.get("timestamp")
-            activity_date = None
-            activity_time = None
-            if timestamp_str:
-                try:
-                    # Expecting format: YYYY-MM-DDTHH:MM:SS
-                    activity_date, time_part = timestamp_str.split('T')
-                    activity_time = time_part[:5]  # HH:MM
-                except Exception as e:
-                    print(f"[ERROR] Invalid timestamp format for activity '{activity.get('name', activity.get('_id', 'unknown'))}': {timestamp_str}")
-            print(f"[LOG] One-time/manual activity '{activity.get('name', activity.get('_id', 'unknown'))}' scheduled for {activity_date} at {activity_time} (from timestamp: {timestamp_str})")
-            print(f"[LOG] Comparing: scheduled_date={activity_date} == current_date={current_date} and scheduled_time={activity_time} == current_time={current_time}")
-            key = f"{activity.get('name', activity.get('_id', 'unknown'))}_{activity_date}_{activity_time}"
-            if activity_date == current_date and activity_time == current_time and key not in executed_one_time:
-                print(f"[MATCH] One-time/manual activity '{activity.get('name', activity.get('_id', 'unknown'))}' scheduled for now ({current_time})")
-                execute_scheduled_job(activity)
-                executed_one_time.add(key)
-                job_executed = True
-        elif activity_type == "recurring":
-            # Try to get days and recurringTimes from multiple possible locations
-            days = activity.get("days")
-            recurring_times = activity.get("recurringTimes")
-            # Fallback to form or metadata.form_data if not found at top level
-            if not days or not recurring_times:
-                form = activity.get("form", {})
-                if not days:
-                    days = form.get("days")
-                if not recurring_times:
-                    recurring_times = form.get("recurringTimes")
-            if not days or not recurring_times:
-                metadata = activity.get("metadata", {})
-                form_data = metadata.get("form_data", {})
-                if not days:
-                    days = form_data.get("days")
-                if not recurring_times:
-                    recurring_times = form_data.get("recurringTimes")
-            days = days or []
-            recurring_times = recurring_times or {}
-            today = datetime.now().strftime("%a")  # e.g., 'Mon'
-            print(f"[LOG] Recurring activity '{activity.get('name', activity.get('_id', 'unknown'))}' days: {days} recurringTimes: {recurring_times}")
-            if today in days:
-                scheduled_time = recurring_times.get(today)
-                print(f"[LOG] Today is {today}. Scheduled time for today: {scheduled_time}")
-                print(f"[LOG] Comparing: scheduled_time={scheduled_time} == current_time={current_time}")
-                key = f"{activity.get('name', activity.get('_id', 'unknown'))}_{today}_{scheduled_time}_{current_date}"
-                if scheduled_time == current_time and key not in executed_one_time:
-                    print(f"[MATCH] Recurring activity '{activity.get('name', activity.get('_id', 'unknown'))}' scheduled for now ({current_time}) on {today}")
-                    execute_scheduled_job(activity)
-                    executed_one_time.add(key)
-                    job_executed = True
-    return job_executed
-
-def run_scheduler():
-    print("Starting TingTing job scheduler (rewritten)...")
-    executed_one_time = set()
+        log(logger, ERROR, "scheduled job failed", sample=get_sample_every(),
+            activity=activity_data.get("_id", "unknown"), error=e)
+    return response
+
+def dispatch_jobs(jobs, dispatcher=None):
+    """Place calls for (fire_at, activity) pairs through a Dispatcher or Outbox, or inline."""
+    if dispatcher is not None:
+        # An Outbox also retries enqueues Mongo refused on an earlier tick
+        if jobs or getattr(dispatcher, "unqueued", None):
+            dispatcher.dispatch(jobs)
+            if logger.isEnabledFor(DEBUG):
+                log(logger, DEBUG, "dispatch stats", **dispatcher.stats())
+        return
+    for fire_at, activity in jobs:
+        execute_scheduled_job(activity, fire_at=fire_at)
+
+def get_prerender_seconds():
+    """How far ahead call payloads are rendered, from CALL_PRERENDER_MINUTES (default 2)."""
+    return float(os.getenv("CALL_PRERENDER_MINUTES", "2")) * 60
+
+def prerender_upcoming(jobs, now, grace_seconds, leases=None):
+    """Render the VAPI payload for upcoming (fire_at, activity) pairs so the fire only sends bytes."""
+    for fire_at, activity in jobs:
+        if leases is not None and not leases.owns(activity):
+            continue
+        try:
+            payload_cache.prerender(activity, fire_at)
+        except Exception as e:
+            log(logger, ERROR, "could not pre-render call", sample=get_sample_every(),
+                activity=activity.get("_id", "unknown"), error=e)
+    payload_cache.discard_before(now - timedelta(seconds=grace_seconds))
+
+def get_grace_seconds():
+    """How late a fire may still be placed, from SCHEDULER_GRACE_SECONDS (default 300)."""
+    return float(os.getenv("SCHEDULER_GRACE_SECONDS", "300"))
+
+def get_backfill_overlap_seconds():
+    """How far back each backfill re-reads updatedAt, covering client clock skew and slow writes."""
+    return float(os.getenv("SCHEDULER_BACKFILL_OVERLAP_SECONDS", "300"))
+
+def within_grace(fire_at, now, grace_seconds):
+    if now - fire_at <= timedelta(seconds=grace_seconds):
+        return True
+    metrics.JOBS_SKIPPED.inc(reason="late")
+    log(logger, WARNING, "skipping late fire", sample=get_sample_every(), fire_at=fire_at, grace_seconds=grace_seconds)
+    return False
+
+def check_index(index, ledger, now=None, dispatcher=None, since=None, grace_seconds=None, leases=None):
+    """Fire every indexed activity scheduled in the window (since, now].
+
+    Args:
+        index: ScheduleIndex of normalized activities
+        ledger: DedupeLedger each fire is claimed in before dialing
+        now: End of the window; defaults to the current time
+        dispatcher: Optional Dispatcher to place the calls concurrently
+        since: Last processed instant; defaults to just before the current minute
+        grace_seconds: Minutes older than this are skipped instead of fired late
+        leases: Optional LeaseManager; only activities in owned partitions are fired
+
+    Returns:
+        Number of jobs dispatched, so truthy if any job was executed
+    """
+    now = now or get_clock().now()
+    if grace_seconds is None:
+        grace_seconds = get_grace_seconds()
+    if since is None:
+        since = now.replace(second=0, microsecond=0) - timedelta(microseconds=1)
+    jobs = []
+    scanned = 0
+    for fire_at, entries in index.due_between(since, now):
+        scanned += len(entries)
+        if not within_grace(fire_at, now, grace_seconds):
+            continue
+        for entry in entries:
+            if leases is not None and not leases.owns(entry.activity):
+                continue
+            if not ledger.claim(entry.key, fire_at):
+                continue
+            activity = entry.activity
+            log(logger, DEBUG, "matched", activity=activity.get("name", activity.get("_id", "unknown")), fire_at=fire_at)
+            jobs.append((fire_at, activity))
+    metrics.ACTIVITIES_SCANNED.inc(scanned, mode="scan")
+    metrics.JOBS_DUE.inc(len(jobs), mode="scan")
+    dispatch_jobs(jobs, dispatcher)
+    return len(jobs)
+
+def check_activities(activities, ledger, now=None, dispatcher=None):
+    """Normalize a list of raw activities and fire the ones due in the minute of now (default: this minute)."""
+    return check_index(ScheduleIndex(activities), ledger, now=now, dispatcher=dispatcher)
+
+def sleep_until_next_minute(clock=None):
+    """Sleep to the next minute boundary of the clock, measured on its monotonic time."""
+    clock = clock or get_clock()
+    now = clock.now()
+    deadline = clock.monotonic() + 60 - now.second - now.microsecond / 1_000_000
     while True:
+        remaining = deadline - clock.monotonic()
+        if remaining <= 0:
+            return
+        clock.sleep(remaining)
+
+def record_tick(mode, started, indexed, due=None, clock=None):
+    """Publish one loop iteration's duration and size; logged only when something fired."""
+    took = time.perf_counter() - started
+    metrics.TICK_SECONDS.observe(took, mode=mode)
+    metrics.ACTIVITIES_INDEXED.set(indexed, mode=mode)
+    metrics.LAST_TICK.set((clock or get_clock()).time(), mode=mode)
+    log(logger, INFO if due else DEBUG, "tick", mode=mode, indexed=indexed, due=due, took=took)
+
+def run_scheduler(cache=None, leases=None, dispatcher=None, ledger=None, clock=None, until=None):
+    """Tick once per minute boundary, firing everything scheduled since the last tick.
+
+    A slow tick never loses minutes: the next tick covers the whole (last_tick, now]
+    window, and fires later than SCHEDULER_GRACE_SECONDS are skipped.
+
+    Args:
+        clock: Source of now and sleep; defaults to clock.get_clock()
+        until: Return once the clock reaches this instant instead of running forever
+    """
+    clock = clock or get_clock()
+    log(logger, INFO, "starting job scheduler", mode="scan")
+    if ledger is None:
+        ledger = DedupeLedger(get_collection("fired_jobs"))
+    dispatcher = dispatcher or Dispatcher(execute_scheduled_job, clock=clock)
+    grace_seconds = get_grace_seconds()
+    if cache is None:
+        cache = ActivityCache()
+    index = ScheduleIndex(cache.load())
+    log(logger, INFO, "indexed activities", indexed=len(index), total=len(cache))
+    last_tick = clock.now().replace(second=0, microsecond=0) - timedelta(microseconds=1)
+    while until is None or clock.now() < until:
         try:
-            activities = fetch_all_activities()
-            print(f"[LOG] Refetched {len(activities)} activities from database.")
-            for activity in activities:
-                print(f"[LOG] Activity ID: {activity.get('_id', 'unknown')}, Timestamp: {activity.get('timestamp', 'N/A')}")
+            for op, key, activity in cache.sync():
+                payload_cache.discard(key)
+                if op == "delete":
+                    index.remove(key)
+                else:
+                    index.upsert(activity)
         except Exception as e:
-            print(f"[ERROR] Could not refetch activities: {e}")
-            activities = []
-        job_executed = check_activities(activities, executed_one_time)
-        if job_executed:
-            time.sleep(60)  # Sleep 60 seconds if a job was executed
+            log(logger, ERROR, "could not sync activities", error=e)
+        started = time.perf_counter()
+        now = clock.now()
+        expired = index.prune(now)
+        if expired:
+            metrics.JOBS_SKIPPED.inc(expired, reason="expired")
+            log(logger, INFO, "unscheduled expired activities", count=expired, indexed=len(index))
+        fired = check_index(index, ledger, now=now, dispatcher=dispatcher, since=last_tick, grace_seconds=grace_seconds, leases=leases)
+        if isinstance(dispatcher, Dispatcher):
+            upcoming = index.due_between(now, now + timedelta(seconds=get_prerender_seconds()))
+            prerender_upcoming([(fire_at, entry.activity) for fire_at, entries in upcoming for entry in entries], now, grace_seconds, leases)
+        record_tick("scan", started, len(index), fired, clock)
+        last_tick = now
+        sleep_until_next_minute(clock)
+
+def run_event_scheduler(cache=None, sync_seconds=None, leases=None, dispatcher=None, ledger=None, clock=None, until=None):
+    """Sleep until the earliest armed activity is due instead of rescanning every tick.
+
+    Activities are loaded once into an ActivityCache; after that only the inserts,
+    updates and deletes it reports are re-armed, every SCHEDULER_SYNC_SECONDS.
+    clock and until work as in run_scheduler.
+    """
+    clock = clock or get_clock()
+    if sync_seconds is None:
+        sync_seconds = float(os.getenv("SCHEDULER_SYNC_SECONDS", "5"))
+    log(logger, INFO, "starting job scheduler", mode="event")
+    if cache is None:
+        cache = ActivityCache()
+    engine = Scheduler()
+    if ledger is None:
+        ledger = DedupeLedger(get_collection("fired_jobs"))
+    dispatcher = dispatcher or Dispatcher(execute_scheduled_job, clock=clock)
+    grace_seconds = get_grace_seconds()
+    engine.load(cache.load(), clock.now())
+    log(logger, INFO, "armed activities", armed=len(engine), total=len(cache))
+    while until is None or clock.now() < until:
+        try:
+            for op, key, activity in cache.sync():
+                payload_cache.discard(key)
+                if op == "delete":
+                    engine.disarm(key)
+                else:
+                    engine.arm(activity, clock.now())
+        except Exception as e:
+            log(logger, ERROR, "could not sync activities", error=e)
+        started = time.perf_counter()
+        now = clock.now()
+        popped = engine.pop_due(now)
+        due = [
+            (fire_at, activity) for fire_at, activity in popped
+            if (leases is None or leases.owns(activity))
+            and within_grace(fire_at, now, grace_seconds) and ledger.claim(activity_key(activity), fire_at)
+        ]
+        for fire_at, activity in due:
+            log(logger, DEBUG, "matched", activity=activity.get("name", activity.get("_id", "unknown")), fire_at=fire_at)
+        metrics.ACTIVITIES_SCANNED.inc(len(popped), mode="event")
+        metrics.JOBS_DUE.inc(len(due), mode="event")
+        dispatch_jobs(due, dispatcher)
+        if isinstance(dispatcher, Dispatcher):
+            prerender_upcoming(engine.upcoming(now + timedelta(seconds=get_prerender_seconds())), now, grace_seconds, leases)
+        record_tick("event", started, len(engine), len(due), clock)
+        sleep_for = sync_seconds
+        next_due = engine.next_due_at()
+        if next_due is not None:
+            sleep_for = min(sleep_for, (next_due - clock.now()).total_seconds())
+        clock.sleep(max(sleep_for, 0.5))
+
+def run_due_scheduler(lookahead_seconds=None, backfill_seconds=None, leases=None, dispatcher=None, ledger=None):
+    """Let MongoDB filter due activities through the indexed next_fire_at field.
+
+    Each loop only reads activities due within the lookahead window, with a projection
+    limited to the fields needed to place the call. After firing, next_fire_at is
+    advanced to the following occurrence.
+    """
+    if lookahead_seconds is None:
+        lookahead_seconds = float(os.getenv("SCHEDULER_LOOKAHEAD_SECONDS", "60"))
+    if backfill_seconds is None:
+        backfill_seconds = float(os.getenv("SCHEDULER_BACKFILL_SECONDS", "30"))
+    log(logger, INFO, "starting job scheduler", mode="due")
+    ensure_indexes()
+    if ledger is None:
+        ledger = DedupeLedger(get_collection("fired_jobs"))
+    dispatcher = dispatcher or Dispatcher(execute_scheduled_job)
+    grace_seconds = get_grace_seconds()
+    next_backfill = 0
+    # The first backfill checks every activity; later ones only read recent edits through the updatedAt index
+    backfill_since = None
+    overlap = timedelta(seconds=get_backfill_overlap_seconds())
+    while True:
+        started = time.perf_counter()
+        now = datetime.now()
+        if time.monotonic() >= next_backfill:
+            try:
+                checked_at = datetime.utcnow()
+                updated = backfill_next_fire_at(now, backfill_since)
+                backfill_since = checked_at - overlap
+                if updated:
+                    log(logger, INFO, "computed next_fire_at", activities=updated)
+            except Exception as e:
+                log(logger, ERROR, "could not backfill next_fire_at", error=e)
+            next_backfill = time.monotonic() + backfill_seconds
+        try:
+            due = fetch_due_activities(now + timedelta(seconds=lookahead_seconds))
+        except Exception as e:
+            log(logger, ERROR, "could not fetch due activities", error=e)
+            due = []
+        oldest = (now - timedelta(seconds=grace_seconds)).replace(second=0, microsecond=0)
+        sleep_for = min(lookahead_seconds, next_backfill - time.monotonic())
+        jobs = []
+        for activity in due:
+            fire_at = activity["next_fire_at"]
+            if fire_at > now:
+                sleep_for = min(sleep_for, (fire_at - now).total_seconds())
+                break
+            if leases is not None and not leases.owns(activity):
+                continue
+            if within_grace(fire_at, now, grace_seconds) and ledger.claim(activity["_id"], fire_at):
+                log(logger, DEBUG, "matched", activity=activity.get("name", activity.get("_id", "unknown")), fire_at=fire_at)
+                jobs.append((fire_at, activity))
+            try:
+                set_next_fire_at(activity, max(fire_at + timedelta(minutes=1), oldest), previous=fire_at)
+            except Exception as e:
+                # Still due next loop, where the ledger keeps it from firing twice
+                log(logger, ERROR, "could not advance next_fire_at", sample=get_sample_every(),
+                    activity=activity.get("_id", "unknown"), error=e)
+        metrics.ACTIVITIES_SCANNED.inc(len(due), mode="due")
+        metrics.JOBS_DUE.inc(len(jobs), mode="due")
+        dispatch_jobs(jobs, dispatcher)
+        if isinstance(dispatcher, Dispatcher):
+            horizon = now + timedelta(seconds=get_prerender_seconds())
+            upcoming = [(activity["next_fire_at"], activity) for activity in due if now < activity["next_fire_at"] <= horizon]
+            prerender_upcoming(upcoming, now, grace_seconds, leases)
+        record_tick("due", started, len(due), len(jobs))
+        time.sleep(max(sleep_for, 0.5))
+
+def run_outbox_dispatcher(outbox=None, dispatcher=None, idle_seconds=None):
+    """Drain the outbox forever, placing calls with retries independently of the scheduler loop."""
+    if idle_seconds is None:
+        idle_seconds = float(os.getenv("OUTBOX_IDLE_SECONDS", "1"))
+    log(logger, INFO, "starting outbox dispatcher")
+    outbox = outbox or Outbox(get_collection("call_outbox"))
+    dispatcher = dispatcher or Dispatcher(execute_scheduled_job)
+    while True:
+        try:
+            processed = drain(outbox, dispatcher)
+        except Exception as e:
+            log(logger, ERROR, "could not drain outbox", error=e)
+            processed = 0
+        if not processed:
+            time.sleep(idle_seconds)
+
+def run_archiver(interval_seconds=None, grace_hours=None, batch_size=None):
+    """Move expired activities out of the activities collection and report the active set.
+
+    Scheduling already ignores expired activities; archiving them keeps the collection,
+    the activity cache and every scan proportional to live reminders. Activities stay
+    in place for ARCHIVE_GRACE_HOURS (default 24) after expiring so they can be extended.
+    """
+    if interval_seconds is None:
+        interval_seconds = float(os.getenv("ARCHIVE_INTERVAL_SECONDS", "600"))
+    if grace_hours is None:
+        grace_hours = float(os.getenv("ARCHIVE_GRACE_HOURS", "24"))
+    if batch_size is None:
+        batch_size = int(os.getenv("ARCHIVE_BATCH_SIZE", "500"))
+    retention_days = float(os.getenv("ARCHIVE_RETENTION_DAYS", "0"))
+    log(logger, INFO, "starting activity archiver", grace_hours=grace_hours, retention_days=retention_days or None)
+    ensure_indexes()
+    ensure_archive_indexes(retention_days)
+    previous = None
+    backfill_since = None
+    overlap = timedelta(seconds=get_backfill_overlap_seconds())
+    while True:
+        now = datetime.now()
+        try:
+            # Stamps expires_at on new and edited activities
+            checked_at = datetime.utcnow()
+            backfill_next_fire_at(now, backfill_since)
+            backfill_since = checked_at - overlap
+            archived = archive_expired_activities(now - timedelta(hours=grace_hours), batch_size)
+            metrics.ACTIVITIES_ARCHIVED.inc(archived)
+            sizes = count_activity_sets(now)
+            for state, size in sizes.items():
+                metrics.ACTIVITY_SET_SIZE.set(size, state=state)
+            change = sizes["active"] - previous["active"] if previous else 0
+            log(logger, INFO, "active set", archived_now=archived, change=change, **sizes)
+            previous = sizes
+        except Exception as e:
+            log(logger, ERROR, "could not archive expired activities", error=e)
+        time.sleep(interval_seconds)
+
+def run_worker(mode="event", worker_id=None, use_outbox=False, metrics_port=None):
+    """Run one scheduler, sharded by lease when a worker id is given.
+
+    With use_outbox the scheduler only enqueues due calls; run mode "drain" to place them.
+    Metrics are served on metrics_port (default METRICS_PORT); pass -1 to disable.
+    """
+    if metrics_port != -1:
+        try:
+            server = metrics.start_server(metrics_port)
+            log(logger, INFO, "serving metrics", address=f"http://{server.server_address[0]}:{server.server_address[1]}/metrics")
+        except OSError as e:
+            log(logger, ERROR, "could not serve metrics", port=metrics_port, error=e)
+    if mode == "drain":
+        run_outbox_dispatcher()
+        return
+    if mode == "archive":
+        run_archiver()
+        return
+    dispatcher = ledger = None
+    if use_outbox:
+        # Shared, so a fire the outbox can't enqueue is released from the ledger the scheduler claims in
+        ledger = DedupeLedger(get_collection("fired_jobs"))
+        dispatcher = Outbox(get_collection("call_outbox"), ledger=ledger)
+    leases = None
+    if worker_id:
+        leases = LeaseManager(get_collection("scheduler_leases"), get_collection("scheduler_workers"), worker_id=worker_id).start()
+    try:
+        if mode == "scan":
+            run_scheduler(leases=leases, dispatcher=dispatcher, ledger=ledger)
+        elif mode == "due":
+            run_due_scheduler(leases=leases, dispatcher=dispatcher, ledger=ledger)
         else:
-            time.sleep(10)  # Otherwise, check again in 10 seconds
+            run_event_scheduler(leases=leases, dispatcher=dispatcher, ledger=ledger)
+    finally:
+        if leases is not None:
+            leases.stop()
 
 if __name__ == "__main__":
-    run_scheduler()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="TingTing job scheduler")
+    parser.add_argument("--mode", choices=["event", "scan", "due", "drain", "archive"], default=os.getenv("SCHEDULER_MODE", "event"))
+    parser.add_argument("--outbox", action="store_true", default=os.getenv("SCHEDULER_OUTBOX") == "1",
+                        help="Enqueue due calls in the outbox instead of placing them inline")
+    parser.add_argument("--worker-id", default=os.getenv("SCHEDULER_WORKER_ID"),
+                        help="Join the sharded worker pool under this id")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Spawn this many local sharded worker processes")
+    parser.add_argument("--metrics-port", type=int, default=int(os.getenv("METRICS_PORT", "9464")),
+                        help="Serve Prometheus metrics on this local port (-1 disables); worker i uses port + i")
+    args = parser.parse_args()
+    if args.workers > 1:
+        # MongoClient is not fork-safe, so each worker starts from a fresh interpreter
+        context = multiprocessing.get_context("spawn")
+        processes = [
+            context.Process(target=run_worker, args=(args.mode, f"{socket.gethostname()}-w{i}", args.outbox,
+                                                     args.metrics_port + i if args.metrics_port != -1 else -1))
+            for i in range(args.workers)
+        ]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+    else:
+        run_worker(args.mode, args.worker_id, args.outbox, args.metrics_port)
@@ -0,0 +1,124 @@
+import math
+import os
+import socket
+import threading
+import zlib
+from datetime import datetime, timedelta
+from pymongo.errors import DuplicateKeyError
+from logs import get_logger, log, INFO, ERROR
+
+logger = get_logger("leases")
+
+
+def partition_of(activity, partitions, shard_key="user_id"):
+    """Map an activity to a partition by hashing its shard key, falling back to _id."""
+    value = activity.get(shard_key) or activity.get("_id") or activity.get("name", "")
+    return zlib.crc32(str(value).encode()) % partitions
+
+
+class LeaseManager:
+    """Splits activity partitions between scheduler workers using renewable leases.
+
+    Each partition has a lease document {_id: partition, owner, expires_at}. Workers
+    heartbeat into a registry, take expired or unowned partitions up to their fair
+    share, and release extras when new workers join. A worker that stops renewing
+    loses its partitions once the leases expire.
+
+    Args:
+        leases: Collection holding one lease document per partition
+        workers: Collection holding worker heartbeats
+        worker_id: Unique name for this worker; defaults to host-pid
+        partitions: Number of partitions; defaults to SCHEDULER_PARTITIONS or 16
+        lease_seconds: Lease lifetime; defaults to SCHEDULER_LEASE_SECONDS or 30
+    """
+
+    def __init__(self, leases, workers, worker_id=None, partitions=None, lease_seconds=None, shard_key=None):
+        self.leases = leases
+        self.workers = workers
+        self.worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}"
+        self.partitions = partitions or int(os.getenv("SCHEDULER_PARTITIONS", "16"))
+        self.lease_seconds = lease_seconds or float(os.getenv("SCHEDULER_LEASE_SECONDS", "30"))
+        self.shard_key = shard_key or os.getenv("SCHEDULER_SHARD_KEY", "user_id")
+        self.owned = frozenset()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def owns(self, activity):
+        return partition_of(activity, self.partitions, self.shard_key) in self.owned
+
+    def _fair_share(self, now):
+        live = self.workers.count_documents({"expires_at": {"$gt": now}})
+        return math.ceil(self.partitions / max(live, 1))
+
+    def renew(self):
+        """Heartbeat, renew held leases, then rebalance towards a fair share.
+
+        Returns:
+            The set of partitions this worker owns afterwards
+        """
+        now = datetime.utcnow()
+        expires_at = now + timedelta(seconds=self.lease_seconds)
+        owned = set(self.owned)
+        self.workers.update_one({"_id": self.worker_id}, {"$set": {"expires_at": expires_at}}, upsert=True)
+        for partition in list(owned):
+            result = self.leases.update_one(
+                {"_id": partition, "owner": self.worker_id},
+                {"$set": {"expires_at": expires_at}},
+            )
+            if result.matched_count == 0:
+                log(logger, INFO, "lost partition", worker=self.worker_id, partition=partition)
+                owned.discard(partition)
+        share = self._fair_share(now)
+        while len(owned) > share:
+            partition = max(owned)
+            owned.discard(partition)
+            self.owned = frozenset(owned)
+            self.leases.update_one({"_id": partition, "owner": self.worker_id}, {"$set": {"owner": None, "expires_at": now}})
+        for partition in range(self.partitions):
+            if len(owned) >= share:
+                break
+            if partition in owned:
+                continue
+            try:
+                result = self.leases.update_one(
+                    {"_id": partition, "$or": [{"owner": None}, {"expires_at": {"$lte": now}}]},
+                    {"$set": {"owner": self.worker_id, "expires_at": expires_at}},
+                    upsert=True,
+                )
+            except DuplicateKeyError:
+                continue
+            if result.matched_count or result.upserted_id is not None:
+                owned.add(partition)
+        self.owned = frozenset(owned)
+        return self.owned
+
+    def _run(self):
+        while not self._stop.wait(self.lease_seconds / 3):
+            self._renew_logged()
+
+    def _renew_logged(self):
+        before = self.owned
+        try:
+            self.renew()
+        except Exception as e:
+            log(logger, ERROR, "could not renew leases", worker=self.worker_id, error=e)
+            self.owned = frozenset()
+        if before != self.owned:
+            log(logger, INFO, "owned partitions changed", worker=self.worker_id, partitions=sorted(self.owned))
+
+    def start(self):
+        """Take an initial share, then keep renewing every third of the lease lifetime in the background."""
+        self._renew_logged()
+        self._thread = threading.Thread(target=self._run, name=f"lease-{self.worker_id}", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """Stop renewing and give up every lease so other workers take over at once."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.owned = frozenset()
+        now = datetime.utcnow()
+        self.leases.update_many({"owner": self.worker_id}, {"$set": {"owner": None, "expires_at": now}})
+        self.workers.delete_one({"_id": self.worker_id})
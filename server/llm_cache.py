@@ -0,0 +1,108 @@
+import copy
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from datetime import datetime
+
+# Inputs like "in 5 minutes" resolve against the current minute, not just the date
+RELATIVE_TIME_RE = re.compile(r"\b(?:in\s+(?:\d+|an?|one)\s*(?:minutes?|mins?|hours?|hrs?)|now|right away)\b", re.I)
+
+
+def normalize_query(text):
+    """Lowercase, collapse whitespace and drop trailing punctuation so equivalent inputs share a key."""
+    return re.sub(r"\s+", " ", text.strip().lower()).strip(" .!?")
+
+
+def extraction_key(input_str, now=None):
+    """Cache key for an extraction: normalized input plus the reference date (or minute)."""
+    now = now or datetime.now()
+    normalized = normalize_query(input_str)
+    if RELATIVE_TIME_RE.search(normalized):
+        return normalized, now.strftime("%Y-%m-%dT%H:%M")
+    return normalized, now.strftime("%Y-%m-%d")
+
+
+class ExtractionCache:
+    """Bounded LRU cache with TTL and single-flight for LLM extraction results.
+
+    Concurrent callers asking for the same key share one in-flight computation.
+    Failed extractions (None or an exception) are not cached.
+
+    Args:
+        max_size: Maximum cached entries; defaults to LLM_CACHE_SIZE or 1024
+        ttl_seconds: Entry lifetime; defaults to LLM_CACHE_TTL_SECONDS or 3600
+    """
+
+    def __init__(self, max_size=None, ttl_seconds=None):
+        self.max_size = max_size or int(os.getenv("LLM_CACHE_SIZE", "1024"))
+        self.ttl_seconds = ttl_seconds or float(os.getenv("LLM_CACHE_TTL_SECONDS", "3600"))
+        self._entries = OrderedDict()
+        self._in_flight = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _lookup(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires, value = entry
+        if expires <= time.monotonic():
+            del self._entries[key]
+            self.evictions += 1
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    def get_or_compute(self, key, compute):
+        """Return the cached value for key, or run compute() once for all concurrent callers."""
+        with self._lock:
+            value = self._lookup(key)
+            if value is not None:
+                self.hits += 1
+                return copy.deepcopy(value)
+            future = self._in_flight.get(key)
+            if future is not None:
+                self.coalesced += 1
+                leader = False
+            else:
+                self.misses += 1
+                future = self._in_flight[key] = Future()
+                leader = True
+        if not leader:
+            return copy.deepcopy(future.result())
+        try:
+            value = compute()
+        except BaseException as e:
+            with self._lock:
+                self._in_flight.pop(key, None)
+            future.set_exception(e)
+            raise
+        with self._lock:
+            self._in_flight.pop(key, None)
+            if value is not None:
+                self._entries[key] = (time.monotonic() + self.ttl_seconds, value)
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_size:
+                    self._entries.popitem(last=False)
+                    self.evictions += 1
+        future.set_result(value)
+        return copy.deepcopy(value)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "size": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "coalesced": self.coalesced,
+                "evictions": self.evictions,
+            }
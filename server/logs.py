@@ -0,0 +1,129 @@
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import threading
+from collections import defaultdict
+from datetime import datetime
+
+DEBUG = logging.DEBUG
+INFO = logging.INFO
+WARNING = logging.WARNING
+ERROR = logging.ERROR
+
+_configured = False
+_configure_lock = threading.Lock()
+_listener = None
+
+
+class StructuredFormatter(logging.Formatter):
+    """One line per record: `[INFO] scheduler: tick due=3 took=0.012` or, with json=True, a JSON object."""
+
+    def __init__(self, json_lines=False):
+        super().__init__()
+        self.json_lines = json_lines
+
+    def format(self, record):
+        fields = getattr(record, "fields", None) or {}
+        if self.json_lines:
+            line = {
+                "ts": datetime.fromtimestamp(record.created).isoformat(timespec="milliseconds"),
+                "level": record.levelname.lower(),
+                "logger": record.name,
+                "msg": record.getMessage(),
+            }
+            line.update(fields)
+            if record.exc_info:
+                line["exc"] = self.formatException(record.exc_info)
+            return json.dumps(line, default=str)
+        parts = [f"[{record.levelname}] {record.name}: {record.getMessage()}"]
+        parts.extend(f"{key}={_text(value)}" for key, value in fields.items())
+        text = " ".join(parts)
+        if record.exc_info:
+            text += "\n" + self.formatException(record.exc_info)
+        return text
+
+
+def _text(value):
+    if isinstance(value, float):
+        return f"{value:.4g}"
+    text = str(value)
+    return json.dumps(text) if " " in text or not text else text
+
+
+class Sampler:
+    """Keeps the first record for a key and then one in every N after it."""
+
+    def __init__(self):
+        self._counts = defaultdict(int)
+        self._lock = threading.Lock()
+
+    def keep(self, key, every):
+        with self._lock:
+            count = self._counts[key]
+            self._counts[key] = count + 1
+        return count % every == 0
+
+
+_sampler = Sampler()
+
+
+def configure():
+    """Install the structured handler once per process.
+
+    LOG_LEVEL (default INFO) filters records, LOG_FORMAT=json switches to JSON lines,
+    and unless LOG_ASYNC=0 records are written by a background thread so the
+    scheduler loop never blocks on stdout.
+    """
+    global _configured, _listener
+    with _configure_lock:
+        if _configured:
+            return
+        handler = logging.StreamHandler(sys.stdout)
+        handler.setFormatter(StructuredFormatter(json_lines=os.getenv("LOG_FORMAT", "text") == "json"))
+        root = logging.getLogger("tingting")
+        root.setLevel(os.getenv("LOG_LEVEL", "INFO").upper())
+        root.propagate = False
+        if os.getenv("LOG_ASYNC", "1") != "0":
+            records = queue.SimpleQueue()
+            _listener = logging.handlers.QueueListener(records, handler)
+            _listener.start()
+            atexit.register(_listener.stop)
+            root.addHandler(logging.handlers.QueueHandler(records))
+        else:
+            root.addHandler(handler)
+        _configured = True
+
+
+def get_logger(name):
+    """Return the `tingting.<name>` logger, configuring output on first use."""
+    configure()
+    return logging.getLogger(f"tingting.{name}")
+
+
+def get_sample_every():
+    """Per-activity records are kept 1 in LOG_SAMPLE_EVERY (default 100)."""
+    return max(int(os.getenv("LOG_SAMPLE_EVERY", "100")), 1)
+
+
+def log(logger, level, message, sample=None, exc_info=False, **fields):
+    """Log message with key=value fields.
+
+    Args:
+        logger: Logger from get_logger
+        level: logging level, e.g. logs.INFO
+        message: Static event text; also the sampling key, so keep variable data in fields
+        sample: Keep only 1 in this many records for message; None keeps all
+        exc_info: Attach the current exception's traceback
+        **fields: Structured context rendered as key=value or JSON keys
+    """
+    if not logger.isEnabledFor(level):
+        return
+    if sample and sample > 1 and not _sampler.keep((logger.name, message), sample):
+        return
+    if sample and sample > 1:
+        fields["sampled"] = f"1/{sample}"
+    logger.log(level, message, exc_info=exc_info, extra={"fields": fields})
@@ -0,0 +1,218 @@
+import bisect
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+def _labels(names, values):
+    if not names:
+        return ""
+    pairs = ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values))
+    return "{" + pairs + "}"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _number(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            lines.extend(self._samples(key, value))
+        return lines
+
+    def _samples(self, key, value):
+        return [f"{self.name}{_labels(self.labelnames, key)} {_number(value)}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def get(self, **labels):
+        """Current count for labels, 0 if never incremented."""
+        key = self._key(labels)
+        with self._lock:
+            return self._values.get(key, 0)
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    def _samples(self, key, state):
+        counts, total, count = state
+        names = self.labelnames + ("le",)
+        lines = []
+        cumulative = 0
+        for bound, bucket in zip(self.buckets + (float("inf"),), counts):
+            cumulative += bucket
+            lines.append(f"{self.name}_bucket{_labels(names, key + (_number(bound),))} {cumulative}")
+        labels = _labels(self.labelnames, key)
+        lines.append(f"{self.name}_sum{labels} {_number(total)}")
+        lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+class Registry:
+    """Named metrics rendered together in the Prometheus text exposition format."""
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _register(self, cls, name, help, labelnames=(), **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, help, labelnames, **kwargs)
+            return metric
+
+    def counter(self, name, help, labelnames=()):
+        return self._register(Counter, name, help, labelnames)
+
+    def gauge(self, name, help, labelnames=()):
+        return self._register(Gauge, name, help, labelnames)
+
+    def histogram(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram, name, help, labelnames, buckets=buckets)
+
+    def render(self):
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+# Scheduler
+TICK_SECONDS = REGISTRY.histogram("scheduler_tick_seconds", "Time spent in one scheduler loop iteration", ["mode"])
+ACTIVITIES_SCANNED = REGISTRY.counter("scheduler_activities_scanned_total", "Activities examined while looking for due fires", ["mode"])
+ACTIVITIES_INDEXED = REGISTRY.gauge("scheduler_activities_indexed", "Activities currently held by the scheduler", ["mode"])
+JOBS_DUE = REGISTRY.counter("scheduler_jobs_due_total", "Fires claimed and handed to dispatch", ["mode"])
+JOBS_SKIPPED = REGISTRY.counter("scheduler_jobs_skipped_total", "Fires not placed", ["reason"])
+LAST_TICK = REGISTRY.gauge("scheduler_last_tick_timestamp_seconds", "Unix time the last scheduler iteration finished", ["mode"])
+
+ACTIVITY_SET_SIZE = REGISTRY.gauge("activities_set_size", "Activities by lifecycle state (active, expired, archived)", ["state"])
+ACTIVITIES_ARCHIVED = REGISTRY.counter("activities_archived_total", "Expired activities moved to the archive")
+
+# Dispatch
+DISPATCH_LAG_SECONDS = REGISTRY.histogram("dispatch_lag_seconds", "Time between a fire's scheduled minute and its call completing",
+                                          buckets=(0.5, 1, 2, 5, 10, 15, 30, 60, 120, 300, 600))
+DISPATCH_SECONDS = REGISTRY.histogram("dispatch_request_seconds", "Duration of one scheduled job")
+VAPI_RESPONSES = REGISTRY.counter("vapi_responses_total", "VAPI call responses by HTTP status code", ["status"])
+
+# Rollups
+ROLLUP_RECORDS = REGISTRY.counter("rollup_records_total", "Call records folded into the adherence counters")
+ROLLUP_LAG_SECONDS = REGISTRY.gauge("rollup_lag_seconds", "Age of the newest record applied to the adherence counters")
+
+# Outcome ingestion
+OUTCOMES_RECEIVED = REGISTRY.counter("outcomes_received_total", "Call outcomes posted to /outcomes by result (queued, duplicate, full)", ["result"])
+OUTCOMES_WRITTEN = REGISTRY.counter("outcomes_written_total", "Call outcomes written to records")
+OUTCOME_BUFFER_DEPTH = REGISTRY.gauge("outcome_buffer_depth", "Call outcomes waiting for the next flush")
+OUTCOME_FLUSH_SECONDS = REGISTRY.histogram("outcome_flush_seconds", "Duration of one bulk write of buffered outcomes",
+                                           buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5))
+OUTCOME_FLUSH_FAILURES = REGISTRY.counter("outcome_flush_failures_total", "Flushes that failed and were left in the buffer to retry")
+
+# LLM
+AGENT_QUERIES_DROPPED = REGISTRY.counter("agent_queries_dropped_total", "Agent queries not run because no agent freed up or the caller gave up", ["reason"])
+LLM_SECONDS = REGISTRY.histogram("llm_request_seconds", "LLM latency by the tool that called it", ["tool"],
+                                 buckets=(0.1, 0.25, 0.5, 1, 2, 4, 8, 15, 30, 60))
+
+# Research agent
+RESEARCH_LOOKUPS = REGISTRY.counter("research_lookups_total", "Research tool lookups by whether the disk cache answered", ["tool", "cache"])
+RESEARCH_LOOKUP_SECONDS = REGISTRY.histogram("research_lookup_seconds", "Latency of research lookups that missed the cache", ["tool"],
+                                             buckets=(0.1, 0.25, 0.5, 1, 2, 4, 8, 15, 30))
+
+
+def render():
+    return REGISTRY.render()
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?", 1)[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = render().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_server(port=None, host=None):
+    """Serve /metrics from a daemon thread.
+
+    Args:
+        port: Defaults to METRICS_PORT or 9464; 0 picks a free port
+        host: Defaults to METRICS_HOST or 127.0.0.1 so metrics stay local
+
+    Returns:
+        The running ThreadingHTTPServer
+    """
+    if port is None:
+        port = int(os.getenv("METRICS_PORT", "9464"))
+    server = ThreadingHTTPServer((host or os.getenv("METRICS_HOST", "127.0.0.1"), port), _Handler)
+    threading.Thread(target=server.serve_forever, name="metrics", daemon=True).start()
+    return server
@@ -1,18 +1,234 @@
-from pymongo import MongoClient
+from pymongo import MongoClient, ASCENDING, DESCENDING
 from dotenv import load_dotenv
+from datetime import datetime
+from pymongo.errors import BulkWriteError
+from scheduler import next_fire_time, activity_expiry
 import os
+import threading
 
 load_dotenv()
 
 MONGODB_URI=os.getenv('MONGODB_URI')
-client = MongoClient(MONGODB_URI)
+COLLECTIONS = ("activities", "activities_archive", "records", "fired_jobs", "call_outbox", "scheduler_leases", "scheduler_workers")
 
-db = client["tingting"]
-activities = db["activities"]
+_client = None
+_client_lock = threading.Lock()
+
+def get_client():
+    """Return the shared MongoClient, connecting on first use rather than at import."""
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = MongoClient(MONGODB_URI)
+    return _client
+
+def set_client(client):
+    """Point every helper at another client, e.g. a mongomock client in benchmarks."""
+    global _client
+    with _client_lock:
+        _client = client
+
+def get_db():
+    return get_client()[os.getenv("MONGODB_DB", "tingting")]
+
+def get_collection(name):
+    return get_db()[name]
+
+def __getattr__(name):
+    # Resolve db and collections on first attribute access so importing this module stays offline
+    if name == "client":
+        return get_client()
+    if name == "db":
+        return get_db()
+    if name in COLLECTIONS:
+        return get_collection(name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+# Only the fields the scheduler, execute_scheduled_job and call() read, plus updatedAt to spot stale pre-renders
+DUE_PROJECTION = {
+    "name": 1, "user_id": 1, "description": 1, "detailed_description": 1,
+    "type": 1, "tags": 1, "timestamp": 1, "days": 1, "recurringTimes": 1,
+    "frequency.time": 1, "form.name": 1, "form.description": 1,
+    "form.days": 1, "form.recurringTimes": 1, "metadata.method": 1,
+    "metadata.form_data.days": 1, "metadata.form_data.recurringTimes": 1,
+    "expiry": 1, "expiry_date": 1, "expiryDate": 1, "next_fire_at": 1,
+    "updatedAt": 1,
+}
+
+# What the agent sees about a user's activity
+SUMMARY_PROJECTION = {
+    "name": 1, "description": 1, "type": 1, "tags": 1, "timestamp": 1,
+    "days": 1, "recurringTimes": 1, "frequency.type": 1, "frequency.pattern": 1,
+    "frequency.time": 1, "expiry": 1,
+}
 
 def fetch_all_activities():
     """Fetch all activities from the activities collection."""
-    return list(activities.find())
+    return list(get_collection("activities").find())
+
+def insert_activities(docs):
+    """Insert many activities in one unordered bulk write and return their ids."""
+    return get_collection("activities").insert_many(docs, ordered=False).inserted_ids
+
+def ensure_indexes():
+    """Create the indexes the due-window scheduler and activity lookups rely on."""
+    get_collection("activities").create_index([("next_fire_at", ASCENDING)])
+    get_collection("activities").create_index([("expires_at", ASCENDING)])
+    get_collection("activities").create_index([("next_fire_computed_at", ASCENDING)])
+    get_collection("activities").create_index([("updatedAt", ASCENDING)])
+    get_collection("activities").create_index([("user_id", ASCENDING), ("_id", ASCENDING)])
+    get_collection("records").create_index([("activityId", ASCENDING), ("createdAt", DESCENDING)])
+
+def fetch_user_activities(user_id, after=None, limit=50, projection=None):
+    """Fetch one page of a user's activities in _id order.
+
+    Args:
+        user_id: Owner of the activities
+        after: _id of the last activity on the previous page; None starts from the beginning
+        limit: Page size
+        projection: Fields to return; defaults to SUMMARY_PROJECTION
+
+    Returns:
+        Up to limit activities; pass the last one's _id as after to get the next page
+    """
+    query = {"user_id": user_id}
+    if after is not None:
+        query["_id"] = {"$gt": after}
+    cursor = get_collection("activities").find(query, projection or SUMMARY_PROJECTION)
+    return list(cursor.sort("_id", ASCENDING).limit(limit))
+
+def count_user_activities(user_id):
+    return get_collection("activities").count_documents({"user_id": user_id})
+
+def summarize_records(activity_ids, since):
+    """Count completion records per activity since a given time.
+
+    Args:
+        activity_ids: Activity ids as stored in records.activityId (strings)
+        since: Only records created at or after this datetime are counted
+
+    Returns:
+        Dictionary of activityId -> {"total", "completed", "last_at", "last_completed"}
+    """
+    cursor = get_collection("records").find(
+        {"activityId": {"$in": list(activity_ids)}, "createdAt": {"$gte": since}},
+        {"_id": 0, "activityId": 1, "createdAt": 1, "completed": 1},
+    ).sort([("activityId", ASCENDING), ("createdAt", DESCENDING)])
+    summary = {}
+    for record in cursor:
+        stats = summary.get(record["activityId"])
+        if stats is None:
+            # Newest first within each activity, so the first record seen is the latest
+            stats = summary[record["activityId"]] = {
+                "total": 0, "completed": 0,
+                "last_at": record["createdAt"], "last_completed": record.get("completed") is True,
+            }
+        stats["total"] += 1
+        stats["completed"] += record.get("completed") is True
+    return summary
+
+def fetch_due_activities(until):
+    """Fetch activities whose next_fire_at is at or before until, soonest first."""
+    return list(get_collection("activities").find({"next_fire_at": {"$lte": until}}, DUE_PROJECTION).sort("next_fire_at", ASCENDING))
+
+def set_next_fire_at(activity, not_before, previous=None):
+    """Recompute and store an activity's next_fire_at and expires_at.
+
+    Args:
+        activity: Activity document (a DUE_PROJECTION projection is enough)
+        not_before: Earliest instant the next fire may be scheduled for
+        previous: If given, only update when next_fire_at still holds this value
+
+    Returns:
+        The new next_fire_at, or None if the activity will not fire again
+    """
+    next_fire_at = next_fire_time(activity, not_before)
+    query = {"_id": activity["_id"]}
+    if previous is not None:
+        query["next_fire_at"] = previous
+    get_collection("activities").update_one(query, {"$set": {
+        "next_fire_at": next_fire_at,
+        "expires_at": activity_expiry(activity),
+        # UTC, like the updatedAt the client writes, so backfill can compare the two
+        "next_fire_computed_at": datetime.utcnow(),
+    }})
+    return next_fire_at
+
+def backfill_next_fire_at(now=None, since=None):
+    """Compute next_fire_at for activities that are new or were edited since it was last set.
+
+    Args:
+        now: Earliest instant the next fire may be scheduled for
+        since: UTC time edits are looked for from, normally the previous backfill's start
+            minus some overlap. Both conditions are then indexed: activities never computed
+            have no next_fire_computed_at, and edits have a newer updatedAt. None compares
+            updatedAt on every activity, a collection scan meant for a worker's first pass
+
+    Returns:
+        Number of activities updated
+    """
+    now = now or datetime.now()
+    conditions = [{"next_fire_computed_at": {"$exists": False}}]
+    if since is None:
+        conditions += [
+            {"expires_at": {"$exists": False}},
+            {"$expr": {"$gt": ["$updatedAt", "$next_fire_computed_at"]}},
+        ]
+    else:
+        conditions.append({"updatedAt": {"$gte": since}})
+    stale = get_collection("activities").find({"$or": conditions}, dict(DUE_PROJECTION, expires_at=1, next_fire_computed_at=1))
+    count = 0
+    for activity in stale:
+        computed, updated = activity.get("next_fire_computed_at"), activity.get("updatedAt")
+        # The overlap re-reads edits that were already picked up
+        if computed is not None and "expires_at" in activity and (updated is None or updated < computed):
+            continue
+        set_next_fire_at(activity, now)
+        count += 1
+    return count
+
+def archive_expired_activities(cutoff, batch_size=500):
+    """Move activities whose expires_at is at or before cutoff into activities_archive.
+
+    Each batch is copied before it is deleted, so a run that stops halfway only
+    leaves documents in both collections, and the next run finishes the move.
+
+    Returns:
+        Number of activities archived
+    """
+    activities = get_collection("activities")
+    archive = get_collection("activities_archive")
+    moved = 0
+    while True:
+        batch = list(activities.find({"expires_at": {"$lte": cutoff}}).limit(batch_size))
+        if not batch:
+            return moved
+        archived_at = datetime.now()
+        for doc in batch:
+            doc["archived_at"] = archived_at
+        try:
+            archive.insert_many(batch, ordered=False)
+        except BulkWriteError as e:
+            # Duplicates were copied by an earlier run that stopped before deleting
+            if any(error.get("code") != 11000 for error in e.details.get("writeErrors", [])):
+                raise
+        activities.delete_many({"_id": {"$in": [doc["_id"] for doc in batch]}, "expires_at": {"$lte": cutoff}})
+        moved += len(batch)
+        if len(batch) < batch_size:
+            return moved
+
+def ensure_archive_indexes(retention_days=None):
+    """Index archived activities by user; with retention_days, let a TTL index drop old ones."""
+    archive = get_collection("activities_archive")
+    archive.create_index([("user_id", ASCENDING)])
+    if retention_days:
+        archive.create_index("archived_at", expireAfterSeconds=int(retention_days * 24 * 3600))
 
-print("Connected ✅")
-print(activities.find_one())
+def count_activity_sets(now):
+    """Sizes of the live set, the expired-but-not-archived set and the archive."""
+    activities = get_collection("activities")
+    return {
+        "active": activities.count_documents({"$or": [{"expires_at": None}, {"expires_at": {"$gt": now}}]}),
+        "expired": activities.count_documents({"expires_at": {"$lte": now}}),
+        "archived": get_collection("activities_archive").estimated_document_count(),
+    }
@@ -0,0 +1,195 @@
+import os
+import random
+from datetime import datetime, timedelta
+from pymongo import ASCENDING, ReturnDocument
+from pymongo.errors import PyMongoError
+from call import categorize_activity
+from scheduler import activity_key
+from logs import get_logger, log, WARNING, ERROR
+import metrics
+
+logger = get_logger("outbox")
+
+# Lower drains first: missing a dose matters more than missing a study reminder
+CATEGORY_PRIORITY = {
+    "medication": 0,
+    "appointment": 1,
+    "sleep": 2,
+    "exercise": 3,
+    "meal": 4,
+    "study": 4,
+    "other": 5,
+}
+
+PENDING = "pending"
+IN_FLIGHT = "in_flight"
+SENT = "sent"
+DEAD = "dead"
+
+
+def activity_priority(activity):
+    name = activity.get("description") or (activity.get("form") or {}).get("name") or activity.get("name", "")
+    return CATEGORY_PRIORITY[categorize_activity(name)]
+
+
+class Outbox:
+    """Durable queue of reminder calls waiting to be placed.
+
+    The scheduler enqueues one document per (activity, fire instant); a separate
+    drainer claims them in priority order, retries failures with exponential backoff
+    and moves them to a dead-letter state after max_attempts. Every claim counts as
+    an attempt, so a job whose drainer keeps crashing is dead-lettered too, and jobs
+    claimed more than grace_seconds after their fire instant are dead-lettered
+    instead of dialed.
+
+    Args:
+        collection: Mongo collection backing the outbox
+        max_attempts: Attempts before a job is dead-lettered; defaults to OUTBOX_MAX_ATTEMPTS or 5
+        base_delay: First retry delay in seconds, doubled per attempt; defaults to OUTBOX_BASE_DELAY or 15
+        visibility_seconds: How long a claimed job stays invisible before another drainer may retry it
+        grace_seconds: How late a call may still be placed; defaults to SCHEDULER_GRACE_SECONDS or 300
+        ledger: DedupeLedger the scheduler claims fires in; a fire that can't be enqueued is released from it
+    """
+
+    def __init__(self, collection, max_attempts=None, base_delay=None, visibility_seconds=None, grace_seconds=None,
+                 ledger=None):
+        self.collection = collection
+        self.ledger = ledger
+        # (fire_at, activity) pairs Mongo refused, tried again on the next dispatch
+        self.unqueued = []
+        self.max_attempts = max_attempts or int(os.getenv("OUTBOX_MAX_ATTEMPTS", "5"))
+        self.base_delay = base_delay or float(os.getenv("OUTBOX_BASE_DELAY", "15"))
+        self.max_delay = float(os.getenv("OUTBOX_MAX_DELAY", "900"))
+        self.visibility_seconds = visibility_seconds or float(os.getenv("OUTBOX_VISIBILITY_SECONDS", "120"))
+        self.grace_seconds = grace_seconds or float(os.getenv("SCHEDULER_GRACE_SECONDS", "300"))
+        collection.create_index([("status", ASCENDING), ("priority", ASCENDING), ("next_attempt_at", ASCENDING)])
+        collection.create_index("completed_at", expireAfterSeconds=7 * 24 * 3600)
+
+    def enqueue(self, activity, fire_at):
+        """Add a call for the activity's fire instant; enqueueing the same fire twice is a no-op."""
+        now = datetime.now()
+        self.collection.update_one(
+            {"_id": f"{activity['_id']}:{fire_at.isoformat()}"},
+            {"$setOnInsert": {
+                "activity": activity,
+                "fire_at": fire_at,
+                "priority": activity_priority(activity),
+                "status": PENDING,
+                "attempts": 0,
+                "next_attempt_at": now,
+                "created_at": now,
+            }},
+            upsert=True,
+        )
+
+    def dispatch(self, jobs):
+        """Enqueue (fire_at, activity) pairs; lets the scheduler use an Outbox in place of a Dispatcher.
+
+        The scheduler has already claimed these fires, so an enqueue Mongo refuses must
+        not lose the call: the job is kept and tried again on the next dispatch until it
+        leaves the grace window, and its claim is released so a scheduler that still
+        finds the fire due can claim it again.
+
+        Returns:
+            Number of jobs enqueued
+        """
+        oldest = datetime.now() - timedelta(seconds=self.grace_seconds)
+        retries = [job for job in self.unqueued if job[0] >= oldest]
+        if len(retries) < len(self.unqueued):
+            metrics.JOBS_SKIPPED.inc(len(self.unqueued) - len(retries), reason="late")
+        self.unqueued = []
+        enqueued = 0
+        for fire_at, activity in retries + list(jobs):
+            try:
+                self.enqueue(activity, fire_at)
+                enqueued += 1
+            except PyMongoError as e:
+                log(logger, ERROR, "could not enqueue call, will retry", activity=activity.get("_id", "unknown"),
+                    fire_at=fire_at, error=e)
+                self.unqueued.append((fire_at, activity))
+                if self.ledger is not None:
+                    self.ledger.release(activity_key(activity), fire_at)
+        return enqueued
+
+    def claim(self, limit):
+        """Claim up to limit ready jobs, most urgent first.
+
+        Jobs past their grace window, or reclaimed after max_attempts claims that never
+        reported back, are dead-lettered here and not returned.
+        """
+        now = datetime.now()
+        oldest = now - timedelta(seconds=self.grace_seconds)
+        claimed = []
+        while len(claimed) < limit:
+            job = self.collection.find_one_and_update(
+                {"$or": [
+                    {"status": PENDING, "next_attempt_at": {"$lte": now}},
+                    {"status": IN_FLIGHT, "next_attempt_at": {"$lte": now}},
+                ]},
+                {
+                    "$set": {"status": IN_FLIGHT, "next_attempt_at": now + timedelta(seconds=self.visibility_seconds)},
+                    "$inc": {"attempts": 1},
+                },
+                sort=[("priority", ASCENDING), ("fire_at", ASCENDING)],
+                return_document=ReturnDocument.AFTER,
+            )
+            if job is None:
+                break
+            if job["fire_at"] < oldest:
+                metrics.JOBS_SKIPPED.inc(reason="late")
+                log(logger, WARNING, "dead-lettered late outbox job", job=job["_id"], fire_at=job["fire_at"],
+                    grace_seconds=self.grace_seconds)
+                self._dead_letter(job, "missed grace window")
+                continue
+            if job["attempts"] > self.max_attempts:
+                log(logger, ERROR, "dead-lettered outbox job", job=job["_id"], attempts=job["attempts"],
+                    error="claimed without reporting back")
+                self._dead_letter(job, "claimed without reporting back")
+                continue
+            claimed.append(job)
+        return claimed
+
+    def _dead_letter(self, job, error):
+        self.collection.update_one({"_id": job["_id"]}, {"$set": {"status": DEAD, "last_error": error}})
+
+    def mark_sent(self, job):
+        self.collection.update_one({"_id": job["_id"]}, {"$set": {"status": SENT, "completed_at": datetime.utcnow()}})
+
+    def mark_failed(self, job, error):
+        """Schedule a retry with exponential backoff, or dead-letter the job."""
+        # claim() already counted this attempt
+        attempts = job["attempts"]
+        update = {"last_error": error}
+        if attempts >= self.max_attempts:
+            update["status"] = DEAD
+            log(logger, ERROR, "dead-lettered outbox job", job=job["_id"], attempts=attempts, error=error)
+        else:
+            delay = min(self.base_delay * 2 ** (attempts - 1), self.max_delay)
+            update["status"] = PENDING
+            update["next_attempt_at"] = datetime.now() + timedelta(seconds=delay * random.uniform(0.8, 1.2))
+        self.collection.update_one({"_id": job["_id"]}, {"$set": update})
+
+    def stats(self):
+        """Return the number of jobs in each state."""
+        counts = {PENDING: 0, IN_FLIGHT: 0, SENT: 0, DEAD: 0}
+        for row in self.collection.aggregate([{"$group": {"_id": "$status", "count": {"$sum": 1}}}]):
+            counts[row["_id"]] = row["count"]
+        return counts
+
+
+def drain(outbox, dispatcher, limit=None):
+    """Claim one batch of ready jobs, place the calls concurrently and record the outcomes.
+
+    Returns:
+        Number of jobs processed
+    """
+    limit = limit or dispatcher.max_workers
+    jobs = outbox.claim(limit)
+    futures = [(job, dispatcher.submit(job["activity"], job["fire_at"])) for job in jobs]
+    for job, future in futures:
+        ok, error = future.result()
+        if ok:
+            outbox.mark_sent(job)
+        else:
+            outbox.mark_failed(job, error)
+    return len(jobs)
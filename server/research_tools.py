@@ -0,0 +1,252 @@
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import datetime
+from llm_cache import normalize_query
+from logs import get_logger, log, DEBUG, WARNING
+import metrics
+
+logger = get_logger("research")
+
+
+class DiskCache:
+    """Tool results on disk, one JSON file per (tool, normalized query), with TTL.
+
+    Entries survive restarts and are shared by every process pointed at the same
+    directory. Within a process, concurrent callers asking for the same key share
+    one in-flight lookup. Errors and empty results are not cached.
+
+    Args:
+        directory: Where entries are stored; defaults to RESEARCH_CACHE_DIR or
+            .research_cache next to this module
+        ttl_seconds: Entry lifetime; defaults to RESEARCH_CACHE_TTL_SECONDS or 1 day
+    """
+
+    def __init__(self, directory=None, ttl_seconds=None):
+        self.directory = directory or os.getenv("RESEARCH_CACHE_DIR") or os.path.join(os.path.dirname(os.path.abspath(__file__)), ".research_cache")
+        self.ttl_seconds = ttl_seconds or float(os.getenv("RESEARCH_CACHE_TTL_SECONDS", str(24 * 3600)))
+        self._in_flight = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+    def _path(self, tool, query):
+        digest = hashlib.sha256(f"{tool}\0{normalize_query(query)}".encode()).hexdigest()
+        return os.path.join(self.directory, f"{tool}-{digest[:32]}.json")
+
+    def get(self, tool, query):
+        """Return the cached result, or None if missing or expired."""
+        path = self._path(tool, query)
+        try:
+            with open(path, encoding="utf-8") as entry:
+                stored = json.load(entry)
+        except (OSError, ValueError):
+            return None
+        if stored.get("expires_at", 0) <= time.time():
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            return None
+        return stored.get("value")
+
+    def set(self, tool, query, value):
+        """Store a result, replacing the file atomically so readers never see half of it."""
+        os.makedirs(self.directory, exist_ok=True)
+        stored = {
+            "tool": tool,
+            "query": normalize_query(query),
+            "stored_at": datetime.now().isoformat(timespec="seconds"),
+            "expires_at": time.time() + self.ttl_seconds,
+            "value": value,
+        }
+        handle, temporary = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(handle, "w", encoding="utf-8") as entry:
+                json.dump(stored, entry)
+            os.replace(temporary, self._path(tool, query))
+        except BaseException:
+            try:
+                os.remove(temporary)
+            except OSError:
+                pass
+            raise
+
+    def get_or_compute(self, tool, query, compute):
+        """Return the cached result for (tool, query), or run compute() once for all concurrent callers."""
+        key = (tool, normalize_query(query))
+        with self._lock:
+            future = self._in_flight.get(key)
+            leader = future is None
+            if leader:
+                future = self._in_flight[key] = Future()
+            else:
+                self.coalesced += 1
+        if not leader:
+            return future.result()
+        try:
+            value = self.get(tool, query)
+            if value is not None:
+                with self._lock:
+                    self.hits += 1
+                metrics.RESEARCH_LOOKUPS.inc(tool=tool, cache="hit")
+            else:
+                with self._lock:
+                    self.misses += 1
+                metrics.RESEARCH_LOOKUPS.inc(tool=tool, cache="miss")
+                started = time.perf_counter()
+                value = compute()
+                metrics.RESEARCH_LOOKUP_SECONDS.observe(time.perf_counter() - started, tool=tool)
+                if value:
+                    try:
+                        self.set(tool, query, value)
+                    except OSError as e:
+                        log(logger, WARNING, "could not write research cache", tool=tool, error=e)
+        except BaseException as e:
+            with self._lock:
+                self._in_flight.pop(key, None)
+            future.set_exception(e)
+            raise
+        with self._lock:
+            self._in_flight.pop(key, None)
+        future.set_result(value)
+        return value
+
+    def stats(self):
+        with self._lock:
+            return {"directory": self.directory, "hits": self.hits, "misses": self.misses, "coalesced": self.coalesced}
+
+
+research_cache = DiskCache()
+
+_clients = {}
+_clients_lock = threading.Lock()
+_pool = None
+
+
+def _client(name):
+    """Build the LangChain search and Wikipedia runners on first use."""
+    with _clients_lock:
+        if name not in _clients:
+            if name == "search":
+                from langchain_community.tools import DuckDuckGoSearchRun
+                _clients[name] = DuckDuckGoSearchRun()
+            else:
+                from langchain_community.tools import WikipediaQueryRun
+                from langchain_community.utilities import WikipediaAPIWrapper
+                wrapper = WikipediaAPIWrapper(top_k_results=1, doc_content_chars_max=int(os.getenv("RESEARCH_WIKI_CHARS", "2000")))
+                _clients[name] = WikipediaQueryRun(api_wrapper=wrapper)
+        return _clients[name]
+
+
+def web_search(query: str):
+    """Search the web for the query, answering from the research cache when possible."""
+    return research_cache.get_or_compute("search", query, lambda: _client("search").run(query))
+
+
+def wiki_lookup(query: str):
+    """Look the query up on Wikipedia, answering from the research cache when possible."""
+    return research_cache.get_or_compute("wiki", query, lambda: _client("wiki").run(query))
+
+
+def save_to_txt(data: str, filename: str = "research_output.txt"):
+    """Append research output to a text file with a timestamp header."""
+    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    with open(filename, "a", encoding="utf-8") as out:
+        out.write(f"--- Research Output ---\nTimestamp: {timestamp}\n\n{data}\n\n")
+    return f"Data successfully saved to {filename}"
+
+
+def fetch_user_activities(user_id: str):
+    """The activity fetcher from tools, so research can look at a user's reminders."""
+    from tools import fetch_activites
+    return fetch_activites(user_id)
+
+
+# Independent lookups that can run side by side for the same query
+LOOKUPS = {"search": web_search, "wiki": wiki_lookup}
+
+
+def get_pool():
+    """Shared thread pool for lookups, sized by RESEARCH_LOOKUP_CONCURRENCY (default 8)."""
+    global _pool
+    with _clients_lock:
+        if _pool is None:
+            _pool = ThreadPoolExecutor(max_workers=int(os.getenv("RESEARCH_LOOKUP_CONCURRENCY", "8")),
+                                       thread_name_prefix="research")
+    return _pool
+
+
+def lookup_all(query, sources=None, timeout=None):
+    """Run the independent lookups for a query concurrently.
+
+    Args:
+        query: Research query
+        sources: Names from LOOKUPS to run; defaults to all of them
+        timeout: Seconds to wait for each lookup; defaults to RESEARCH_LOOKUP_TIMEOUT or 30
+
+    Returns:
+        Dictionary of source name to result text; failed lookups are left out
+    """
+    if timeout is None:
+        timeout = float(os.getenv("RESEARCH_LOOKUP_TIMEOUT", "30"))
+    names = list(sources or LOOKUPS)
+    futures = {name: get_pool().submit(LOOKUPS[name], query) for name in names}
+    results = {}
+    for name, future in futures.items():
+        try:
+            value = future.result(timeout=timeout)
+        except Exception as e:
+            log(logger, WARNING, "research lookup failed", tool=name, query=query, error=e)
+            continue
+        if value:
+            results[name] = value
+    log(logger, DEBUG, "research lookups", query=query, found=list(results))
+    return results
+
+
+_tools = None
+
+
+def get_research_tools():
+    """Return the LangChain tools for the research agent, importing LangChain on first use."""
+    global _tools
+    with _clients_lock:
+        if _tools is None:
+            from langchain_core.tools import Tool
+
+            _tools = {
+                "search_tool": Tool(
+                    name="search",
+                    func=web_search,
+                    description="Search the web for information. Input should be a search query."
+                ),
+                "wiki_tool": Tool(
+                    name="wikipedia",
+                    func=wiki_lookup,
+                    description="Look up a topic on Wikipedia. Input should be a topic or title."
+                ),
+                "save_tool": Tool(
+                    name="save_text_to_file",
+                    func=save_to_txt,
+                    description="Saves structured research data to a text file."
+                ),
+                "fetch_tool": Tool(
+                    name="UserActivityFetcher",
+                    func=fetch_user_activities,
+                    description="Use this tool to fetch user activity logs. Input should be a user ID string."
+                ),
+            }
+    return list(_tools.values())
+
+
+def __getattr__(name):
+    if name in ("search_tool", "wiki_tool", "save_tool", "fetch_tool"):
+        get_research_tools()
+        return _tools[name]
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,351 @@
+import argparse
+import os
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from pymongo import ASCENDING, UpdateOne
+from logs import get_logger, log, INFO, ERROR
+import metrics
+
+logger = get_logger("rollups")
+
+STATE_ID = "records"
+COMPLETED_VALUES = (True, 1, "true", "True", "yes", "1")
+
+
+def is_completed(record):
+    return record.get("completed") in COMPLETED_VALUES
+
+
+def day_of(moment):
+    """UTC calendar day of a record; createdAt is stored in UTC by save-response."""
+    return moment.strftime("%Y-%m-%d")
+
+
+def _after(position, other):
+    """Whether (createdAt, _id) position comes after other; a None _id stands for the end of that instant."""
+    if position[0] != other[0]:
+        return position[0] > other[0]
+    if position[1] is None:
+        return other[1] is not None
+    return other[1] is not None and position[1] > other[1]
+
+
+class RecordFeed:
+    """New call records, tailing a change stream when possible.
+
+    Records come from several writers (save-response, the ingest buffer), so one can
+    commit after a record with a later createdAt has already been read. Polling
+    therefore only reads records older than safety_lag, in (createdAt, _id) order,
+    and the checkpoint never moves closer to now than safety_lag. Records applied
+    beyond it, which the change stream delivers as they commit, are remembered by
+    _id so a catch-up never applies them twice; a stream event is only skipped if
+    its _id was already applied, never for being older than the checkpoint. A record
+    committing more than safety_lag after its createdAt may still be missed.
+
+    On start the feed catches up from its checkpoint by polling; once caught up it
+    opens a change stream of inserts, catches up once more to cover what committed
+    in between, and drops back to polling if the stream breaks.
+
+    A batch stays pending until it is committed: poll() returns it again rather
+    than reading on, so records consumed from the stream are not lost when applying
+    them fails.
+
+    Args:
+        records: The records collection
+        state: Collection the checkpoint is stored in; None keeps it in memory
+        batch_size: Maximum records returned by one poll
+        use_change_stream: Set False to only ever poll
+        max_await_ms: How long a change stream poll may wait on the server
+        safety_lag: Seconds a record may take to commit after its createdAt;
+            defaults to ROLLUP_SAFETY_LAG_SECONDS or 60
+    """
+
+    def __init__(self, records, state=None, batch_size=500, use_change_stream=True, max_await_ms=1000, safety_lag=None):
+        self.records = records
+        self.state = state
+        self.batch_size = batch_size
+        self.use_change_stream = use_change_stream
+        self.max_await_ms = max_await_ms
+        if safety_lag is None:
+            safety_lag = float(os.getenv("ROLLUP_SAFETY_LAG_SECONDS", "60"))
+        self.safety_lag = timedelta(seconds=safety_lag)
+        self.watermark = None
+        # _id -> createdAt of applied records past the watermark
+        self._applied = {}
+        # _ids read by the catch-up that overlaps the freshly opened stream
+        self._overlap = set()
+        self._stream = None
+        self._catching_up = False
+        self._drained = False
+        self._pending = None
+        if state is not None:
+            saved = state.find_one({"_id": STATE_ID})
+            if saved and saved.get("created_at") is not None:
+                self.watermark = (saved["created_at"], saved.get("record_id"))
+                self._applied = {entry["_id"]: entry["createdAt"] for entry in saved.get("applied", [])}
+
+    def _catch_up(self, cutoff=None):
+        conditions = [{"createdAt": {"$exists": True}}]
+        if self.watermark is not None:
+            created_at, record_id = self.watermark
+            if record_id is None:
+                conditions.append({"createdAt": {"$gt": created_at}})
+            else:
+                conditions.append({"$or": [
+                    {"createdAt": {"$gt": created_at}},
+                    {"createdAt": created_at, "_id": {"$gt": record_id}},
+                ]})
+        if cutoff is not None:
+            conditions.append({"createdAt": {"$lte": cutoff}})
+        if self._applied:
+            conditions.append({"_id": {"$nin": list(self._applied)}})
+        cursor = self.records.find({"$and": conditions}).sort([("createdAt", ASCENDING), ("_id", ASCENDING)])
+        return list(cursor.limit(self.batch_size))
+
+    def _open_stream(self):
+        try:
+            self._stream = self.records.watch([{"$match": {"operationType": "insert"}}],
+                                              max_await_time_ms=self.max_await_ms)
+            self._catching_up = True
+            self._overlap = set()
+        except Exception as e:
+            log(logger, INFO, "change streams unavailable, polling records instead", error=e)
+            self.use_change_stream = False
+
+    def poll(self):
+        """Return records not yet applied, oldest first; empty when caught up.
+
+        Until commit() is called with it, the same batch is returned again.
+        """
+        if self._pending is not None:
+            # The stream may have moved on while the batch waited, so it no longer counts as drained
+            self._drained = False
+            return self._pending
+        batch = self._read()
+        self._pending = batch or None
+        return batch
+
+    def _read(self):
+        if self._stream is None or self._catching_up:
+            # Without a stream, only records old enough that nothing before them can still commit
+            batch = self._catch_up(None if self._catching_up else datetime.utcnow() - self.safety_lag)
+            if self._catching_up:
+                self._overlap.update(record["_id"] for record in batch)
+            if len(batch) >= self.batch_size:
+                return batch
+            if self._catching_up:
+                # Inserts made before the stream opened are covered now; the stream has the rest
+                self._catching_up = False
+            elif self.use_change_stream:
+                self._open_stream()
+            return batch
+        batch = []
+        seen = set()
+        self._drained = False
+        try:
+            while len(batch) < self.batch_size:
+                event = self._stream.try_next()
+                if event is None:
+                    self._drained = True
+                    break
+                record = event.get("fullDocument")
+                if (record and record.get("createdAt") is not None and record["_id"] not in seen
+                        and record["_id"] not in self._applied and record["_id"] not in self._overlap):
+                    # A resumed stream can deliver an event twice, even within one batch
+                    seen.add(record["_id"])
+                    batch.append(record)
+        except Exception as e:
+            log(logger, ERROR, "records change stream interrupted, catching up by polling", error=e)
+            self._stream = None
+        batch.sort(key=lambda record: (record["createdAt"], record["_id"]))
+        return batch
+
+    def commit(self, batch):
+        """Record an applied batch and advance the checkpoint as far as is safe."""
+        if not batch:
+            return
+        self._pending = None
+        settled = datetime.utcnow() - self.safety_lag
+        for record in batch:
+            self._applied[record["_id"]] = record["createdAt"]
+        candidates = [(record["createdAt"], record["_id"]) for record in batch if record["createdAt"] <= settled]
+        if self._stream is not None and not self._catching_up and self._drained:
+            # Everything created before settled has committed and the stream has delivered it
+            candidates.append((settled, None))
+        for position in candidates:
+            if self.watermark is None or _after(position, self.watermark):
+                self.watermark = position
+        if self.watermark is not None:
+            self._applied = {record_id: created_at for record_id, created_at in self._applied.items()
+                             if _after((created_at, record_id), self.watermark)}
+        if self.state is not None and self.watermark is not None:
+            self.state.update_one({"_id": STATE_ID}, {"$set": {
+                "created_at": self.watermark[0],
+                "record_id": self.watermark[1],
+                "applied": [{"_id": record_id, "createdAt": created_at} for record_id, created_at in self._applied.items()],
+                "updated_at": datetime.utcnow(),
+            }}, upsert=True)
+
+
+class AdherenceRollups:
+    """Per-activity and per-user daily completion counters, updated in place.
+
+    Each counter document covers one (scope, key, day) with total, completed and
+    missed counts, so an adherence view reads one document per day instead of
+    every record.
+
+    Args:
+        counters: Collection holding the counter documents
+        activities: Activities collection, used to find each activity's user
+        owner_cache_size: How many activity -> user_id lookups to keep
+    """
+
+    def __init__(self, counters, activities, owner_cache_size=None):
+        self.counters = counters
+        self.activities = activities
+        self.owner_cache_size = owner_cache_size or int(os.getenv("ROLLUP_OWNER_CACHE_SIZE", "10000"))
+        self._owners = OrderedDict()
+
+    def owners(self, activity_ids):
+        """Map activity ids to user ids with one query for everything not cached."""
+        from bson import ObjectId
+
+        missing = [activity_id for activity_id in set(activity_ids) if activity_id not in self._owners]
+        if missing:
+            ids = list(missing) + [ObjectId(activity_id) for activity_id in missing if ObjectId.is_valid(activity_id)]
+            found = {str(doc["_id"]): doc.get("user_id") for doc in self.activities.find({"_id": {"$in": ids}}, {"user_id": 1})}
+            for activity_id in missing:
+                self._owners[activity_id] = found.get(activity_id)
+            while len(self._owners) > self.owner_cache_size:
+                self._owners.popitem(last=False)
+        return {activity_id: self._owners.get(activity_id) for activity_id in activity_ids}
+
+    def apply(self, records):
+        """Fold a batch of records into the counters with one bulk write.
+
+        Returns:
+            Number of counter documents touched
+        """
+        if not records:
+            return 0
+        owners = self.owners([str(record.get("activityId")) for record in records])
+        deltas = {}
+        for record in records:
+            activity_id = str(record.get("activityId"))
+            user_id = owners.get(activity_id)
+            day = day_of(record["createdAt"])
+            done = is_completed(record)
+            targets = [("activity", activity_id)]
+            if user_id:
+                targets.append(("user", user_id))
+            for scope, key in targets:
+                delta = deltas.get((scope, key, day))
+                if delta is None:
+                    delta = deltas[(scope, key, day)] = {"total": 0, "completed": 0, "last_at": record["createdAt"], "user_id": user_id}
+                delta["total"] += 1
+                delta["completed"] += done
+                delta["last_at"] = max(delta["last_at"], record["createdAt"])
+        operations = [
+            UpdateOne(
+                {"_id": f"{scope}:{key}:{day}"},
+                {
+                    "$inc": {"total": delta["total"], "completed": delta["completed"], "missed": delta["total"] - delta["completed"]},
+                    "$max": {"last_at": delta["last_at"]},
+                    "$setOnInsert": {"scope": scope, "key": key, "day": day, "user_id": delta["user_id"]},
+                },
+                upsert=True,
+            )
+            for (scope, key, day), delta in deltas.items()
+        ]
+        self.counters.bulk_write(operations, ordered=False)
+        return len(operations)
+
+
+def ensure_rollup_indexes(records, counters):
+    """Indexes for catching up on records and for reading a key's days in order."""
+    records.create_index([("createdAt", ASCENDING), ("_id", ASCENDING)])
+    counters.create_index([("scope", ASCENDING), ("key", ASCENDING), ("day", ASCENDING)])
+
+
+def read_adherence(counters, scope, key, days=30, today=None):
+    """Daily adherence for one activity or user over the last `days` UTC days.
+
+    Args:
+        counters: Counter collection written by AdherenceRollups
+        scope: "activity" or "user"
+        key: Activity id or user id
+        days: Number of days, ending today
+        today: Last day to include; defaults to the current UTC date
+
+    Returns:
+        Dictionary with per-day counts (zero-filled) and totals with a completion rate
+    """
+    today = today or datetime.utcnow().date()
+    first = today - timedelta(days=days - 1)
+    rows = counters.find(
+        {"scope": scope, "key": key, "day": {"$gte": first.isoformat(), "$lte": today.isoformat()}},
+        {"_id": 0, "day": 1, "total": 1, "completed": 1, "missed": 1},
+    )
+    by_day = {row["day"]: row for row in rows}
+    series = []
+    total = completed = 0
+    for offset in range(days):
+        day = (first + timedelta(days=offset)).isoformat()
+        row = by_day.get(day, {})
+        entry = {"day": day, "total": row.get("total", 0), "completed": row.get("completed", 0), "missed": row.get("missed", 0)}
+        entry["rate"] = round(entry["completed"] / entry["total"], 4) if entry["total"] else None
+        total += entry["total"]
+        completed += entry["completed"]
+        series.append(entry)
+    return {
+        "scope": scope,
+        "key": key,
+        "total": total,
+        "completed": completed,
+        "missed": total - completed,
+        "rate": round(completed / total, 4) if total else None,
+        "days": series,
+    }
+
+
+def run_rollups(feed=None, rollups=None, idle_seconds=None):
+    """Apply new records to the counters forever, sleeping when caught up."""
+    from mongodb_utils import get_collection
+
+    if idle_seconds is None:
+        idle_seconds = float(os.getenv("ROLLUP_IDLE_SECONDS", "2"))
+    records = get_collection("records")
+    counters = get_collection("adherence_daily")
+    if feed is None or rollups is None:
+        ensure_rollup_indexes(records, counters)
+    feed = feed or RecordFeed(records, state=get_collection("rollup_state"))
+    rollups = rollups or AdherenceRollups(counters, get_collection("activities"))
+    log(logger, INFO, "starting adherence rollups", watermark=feed.watermark)
+    while True:
+        try:
+            batch = feed.poll()
+            if batch:
+                touched = rollups.apply(batch)
+                feed.commit(batch)
+                metrics.ROLLUP_RECORDS.inc(len(batch))
+                metrics.ROLLUP_LAG_SECONDS.set((datetime.utcnow() - batch[-1]["createdAt"]).total_seconds())
+                log(logger, INFO, "applied records", records=len(batch), counters=touched)
+                continue
+        except Exception as e:
+            # The feed hands the same batch back on the next poll
+            log(logger, ERROR, "could not apply records, will retry", error=e)
+        time.sleep(idle_seconds)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Keep daily adherence counters current from call records")
+    parser.add_argument("--metrics-port", type=int, default=int(os.getenv("ROLLUP_METRICS_PORT", "9470")),
+                        help="Serve Prometheus metrics on this local port (-1 disables)")
+    args = parser.parse_args()
+    if args.metrics_port != -1:
+        try:
+            metrics.start_server(args.metrics_port)
+        except OSError as e:
+            log(logger, ERROR, "could not serve metrics", port=args.metrics_port, error=e)
+    run_rollups()
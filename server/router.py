@@ -0,0 +1,38 @@
+import os
+import re
+from collections import namedtuple
+from fast_parser import USER_ID_RE
+
+Route = namedtuple("Route", ["intent", "user_id", "confidence"])
+
+FETCH_RE = re.compile(r"\b(?:fetch|get|show|list|view|see|display|what(?:'s| are| is)|history|logs?)\b", re.I)
+ADD_RE = re.compile(r"\b(?:add|create|schedule|remind|set(?:\s+up)?|new)\b", re.I)
+TIME_HINT_RE = re.compile(r"\b(?:\d{1,2}(?::\d{2})?\s*(?:am|pm)|\d{1,2}:\d{2}|noon|midnight|tomorrow|today|tonight|daily|every|in\s+\d+)\b", re.I)
+
+
+def route_query(query):
+    """Classify a /process query as "fetch" or "add" and pull out the user id cheaply.
+
+    Returns:
+        Route(intent, user_id, confidence); intent is None when no rule applies
+    """
+    match = USER_ID_RE.search(query)
+    user_id = match.group(1) if match else None
+    wants_fetch = bool(FETCH_RE.search(query))
+    wants_add = bool(ADD_RE.search(query)) or (not wants_fetch and bool(TIME_HINT_RE.search(query)))
+    if wants_fetch == wants_add:
+        return Route(None, user_id, 0.0)
+    intent = "fetch" if wants_fetch else "add"
+    confidence = 0.9 if user_id else 0.3
+    has_time = bool(TIME_HINT_RE.search(query))
+    if intent == "add" and not has_time:
+        confidence = min(confidence, 0.6)
+    if intent == "fetch" and has_time:
+        # "see the dentist at 3pm" reads as a fetch verb but is a reminder; let the agent decide
+        confidence = min(confidence, 0.5)
+    return Route(intent, user_id, confidence)
+
+
+def get_min_confidence():
+    """Routes below ROUTER_MIN_CONFIDENCE (default 0.8) go through the ReAct agent."""
+    return float(os.getenv("ROUTER_MIN_CONFIDENCE", "0.8"))
@@ -0,0 +1,359 @@
+import heapq
+import itertools
+from array import array
+from datetime import datetime, timedelta, timezone
+from logs import get_logger, log, get_sample_every, ERROR
+
+WEEKDAYS = ["Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun"]
+ONE_MINUTE = timedelta(minutes=1)
+EXPIRY_FIELDS = ("expiry", "expiry_date", "expiryDate")
+
+logger = get_logger("scheduler")
+
+
+def activity_key(activity):
+    return str(activity.get('_id', activity.get('name', 'unknown')))
+
+
+def is_one_time(activity):
+    """Return True if the activity should only fire once at its timestamp."""
+    tags = activity.get("tags", [])
+    metadata = activity.get("metadata", {})
+    return (
+        activity.get("type") == "one_time" or
+        (isinstance(tags, list) and "one_time" in tags) or
+        (isinstance(metadata, dict) and metadata.get("method") == "one_time")
+    )
+
+
+def get_days_and_times(activity):
+    """Look up days and recurringTimes at the top level, in form, then in metadata.form_data."""
+    days = activity.get("days")
+    recurring_times = activity.get("recurringTimes")
+    if not days or not recurring_times:
+        form = activity.get("form") or {}
+        days = days or form.get("days")
+        recurring_times = recurring_times or form.get("recurringTimes")
+    if not days or not recurring_times:
+        form_data = (activity.get("metadata") or {}).get("form_data") or {}
+        days = days or form_data.get("days")
+        recurring_times = recurring_times or form_data.get("recurringTimes")
+    return days or [], recurring_times or {}
+
+
+def parse_timestamp(timestamp_str):
+    """Parse a YYYY-MM-DDTHH:MM[:SS] timestamp down to the minute, or None if invalid."""
+    try:
+        date_part, time_part = timestamp_str.split('T')
+        return datetime.strptime(f"{date_part}T{time_part[:5]}", "%Y-%m-%dT%H:%M")
+    except Exception:
+        return None
+
+
+def parse_expiry(value):
+    """Parse an expiry into a naive local datetime, or None if it is missing or invalid.
+
+    Strings are ISO dates or datetimes; a bare date expires at the end of that day.
+    A trailing Z is ignored because add_activity writes local time with a Z suffix.
+    BSON dates come back from pymongo as naive UTC and are converted to local time.
+    """
+    if isinstance(value, datetime):
+        if value.tzinfo is None:
+            value = value.replace(tzinfo=timezone.utc)
+        return value.astimezone().replace(tzinfo=None)
+    if not isinstance(value, str) or not value.strip():
+        return None
+    text = value.strip().rstrip("Zz")
+    try:
+        if len(text) == 10:
+            return datetime.strptime(text, "%Y-%m-%d") + timedelta(days=1)
+        parsed = datetime.fromisoformat(text)
+    except ValueError:
+        return None
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone().replace(tzinfo=None)
+    return parsed
+
+
+def activity_expiry(activity):
+    """Return when the activity stops firing, or None if it never expires."""
+    for field in EXPIRY_FIELDS:
+        if activity.get(field):
+            return parse_expiry(activity[field])
+    return None
+
+
+def parse_minute(time_str):
+    """Convert an HH:MM string into minutes since midnight, or -1 if invalid."""
+    try:
+        hour, minute = (int(part) for part in time_str.split(':')[:2])
+        if 0 <= hour < 24 and 0 <= minute < 60:
+            return hour * 60 + minute
+    except Exception:
+        pass
+    return -1
+
+
+class ScheduleEntry:
+    """Compact, pre-parsed schedule for one activity.
+
+    One-time activities keep their fire instant; recurring ones keep an array of
+    seven minute-of-day slots indexed by weekday (Mon=0), -1 meaning no fire.
+    Nothing fires at or after expires_at.
+    """
+
+    __slots__ = ("key", "activity", "fire_at", "weekly", "expires_at")
+
+    def __init__(self, key, activity, fire_at=None, weekly=None, expires_at=None):
+        self.key = key
+        self.activity = activity
+        self.fire_at = fire_at
+        self.weekly = weekly
+        self.expires_at = expires_at
+
+    def expired(self, moment):
+        return self.expires_at is not None and moment >= self.expires_at
+
+    def next_fire(self, not_before):
+        """Return the first fire instant at or after not_before, or None."""
+        fire_at = self._next_fire(not_before.replace(second=0, microsecond=0))
+        if fire_at is None or self.expired(fire_at):
+            return None
+        return fire_at
+
+    def _next_fire(self, not_before):
+        if self.weekly is None:
+            if self.fire_at is not None and self.fire_at >= not_before:
+                return self.fire_at
+            return None
+        midnight = not_before.replace(hour=0, minute=0)
+        for offset in range(8):
+            day = midnight + timedelta(days=offset)
+            minute = self.weekly[day.weekday()]
+            if minute < 0:
+                continue
+            fire_at = day + timedelta(minutes=minute)
+            if fire_at >= not_before:
+                return fire_at
+        return None
+
+
+def normalize_activity(activity):
+    """Turn a raw activity document into a ScheduleEntry, or None if it never fires."""
+    key = activity_key(activity)
+    if is_one_time(activity):
+        fire_at = parse_timestamp(activity.get("timestamp") or "")
+        if fire_at is None:
+            log(logger, ERROR, "invalid timestamp format", sample=get_sample_every(),
+                activity=activity.get("name", activity.get("_id", "unknown")), timestamp=activity.get("timestamp"))
+            return None
+        return ScheduleEntry(key, activity, fire_at=fire_at, expires_at=activity_expiry(activity))
+    if activity.get("type") != "recurring":
+        return None
+    days, recurring_times = get_days_and_times(activity)
+    weekly = array('h', [-1] * 7)
+    for index, weekday in enumerate(WEEKDAYS):
+        if weekday in days and recurring_times.get(weekday):
+            weekly[index] = parse_minute(recurring_times[weekday])
+    if max(weekly) < 0:
+        return None
+    return ScheduleEntry(key, activity, weekly=weekly, expires_at=activity_expiry(activity))
+
+
+def next_fire_time(activity, not_before):
+    """Work out the first instant at or after not_before when the activity is due.
+
+    Args:
+        activity: Raw activity document
+        not_before: Naive local datetime, compared at minute resolution
+
+    Returns:
+        The next fire datetime, or None if the activity will never fire again
+    """
+    entry = normalize_activity(activity)
+    return entry.next_fire(not_before) if entry else None
+
+
+class ScheduleIndex:
+    """Lookup of schedule entries by (weekday, minute) and by (date, minute).
+
+    Entries are normalized once per change, so finding what is due in a minute is
+    two dictionary lookups instead of re-reading every activity document.
+    """
+
+    def __init__(self, activities=()):
+        self._entries = {}
+        self._weekly = {}
+        self._dated = {}
+        self._expiries = []
+        self._counter = itertools.count()
+        for activity in activities:
+            self.upsert(activity)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _slots(self, entry):
+        if entry.weekly is None:
+            yield self._dated, (entry.fire_at.date(), entry.fire_at.hour * 60 + entry.fire_at.minute)
+        else:
+            for weekday, minute in enumerate(entry.weekly):
+                if minute >= 0:
+                    yield self._weekly, (weekday, minute)
+
+    def upsert(self, activity):
+        """Normalize the activity and (re)index it; returns its entry or None."""
+        key = activity_key(activity)
+        self.remove(key)
+        entry = normalize_activity(activity)
+        if entry is None:
+            return None
+        self._entries[key] = entry
+        for table, slot in self._slots(entry):
+            table.setdefault(slot, {})[key] = entry
+        if entry.expires_at is not None:
+            heapq.heappush(self._expiries, (entry.expires_at, next(self._counter), key))
+        return entry
+
+    def remove(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        for table, slot in self._slots(entry):
+            bucket = table.get(slot)
+            if bucket is not None:
+                bucket.pop(key, None)
+                if not bucket:
+                    del table[slot]
+
+    def due(self, moment):
+        """Return the unexpired entries scheduled for the minute containing moment."""
+        minute = moment.hour * 60 + moment.minute
+        due = list(self._weekly.get((moment.weekday(), minute), {}).values())
+        due.extend(self._dated.get((moment.date(), minute), {}).values())
+        return [entry for entry in due if not entry.expired(moment)]
+
+    def prune(self, now):
+        """Unschedule entries that expired at or before now; returns how many were removed."""
+        removed = 0
+        while self._expiries and self._expiries[0][0] <= now:
+            expires_at, _, key = heapq.heappop(self._expiries)
+            entry = self._entries.get(key)
+            if entry is not None and entry.expires_at == expires_at:
+                self.remove(key)
+                removed += 1
+        if len(self._expiries) > 2 * len(self._entries) + 64:
+            self._expiries = [(entry.expires_at, next(self._counter), key)
+                              for key, entry in self._entries.items() if entry.expires_at is not None]
+            heapq.heapify(self._expiries)
+        return removed
+
+    def due_between(self, since, until):
+        """Yield (minute, entries) for every minute in the window (since, until]."""
+        moment = since.replace(second=0, microsecond=0) + ONE_MINUTE
+        while moment <= until:
+            entries = self.due(moment)
+            if entries:
+                yield moment, entries
+            moment += ONE_MINUTE
+
+
+class Scheduler:
+    """Min-heap of activities ordered by their next fire time.
+
+    Each activity is armed once with its next fire time. Popping due entries only
+    touches the jobs that are due, and recurring activities are re-armed for their
+    following occurrence after they fire.
+    """
+
+    def __init__(self):
+        self._heap = []
+        self._armed = {}
+        self._last_fired = {}
+        self._counter = itertools.count()
+
+    def __len__(self):
+        return len(self._armed)
+
+    def arm(self, activity, not_before):
+        """Schedule the activity's next occurrence, replacing any previous one."""
+        entry = normalize_activity(activity)
+        if entry is None:
+            self._armed.pop(activity_key(activity), None)
+            return None
+        return self._arm_entry(entry, not_before)
+
+    def _arm_entry(self, entry, not_before):
+        key = entry.key
+        last_fired = self._last_fired.get(key)
+        if last_fired and last_fired + ONE_MINUTE > not_before:
+            not_before = last_fired + ONE_MINUTE
+        fire_at = entry.next_fire(not_before)
+        if fire_at is None:
+            self._armed.pop(key, None)
+            return None
+        seq = next(self._counter)
+        self._armed[key] = (fire_at, seq, entry)
+        heapq.heappush(self._heap, (fire_at, seq, key))
+        return fire_at
+
+    def disarm(self, key):
+        """Drop an activity; its stale heap entry is skipped when popped."""
+        self._armed.pop(key, None)
+        self._last_fired.pop(key, None)
+
+    def load(self, activities, now):
+        """Re-arm the scheduler from a full snapshot of activities."""
+        keys = set()
+        for activity in activities:
+            keys.add(activity_key(activity))
+            self.arm(activity, now)
+        for key in list(self._armed):
+            if key not in keys:
+                self.disarm(key)
+        for key in list(self._last_fired):
+            if key not in keys:
+                del self._last_fired[key]
+        if len(self._heap) > 2 * len(self._armed) + 64:
+            self._heap = [(fire_at, seq, key) for key, (fire_at, seq, _) in self._armed.items()]
+            heapq.heapify(self._heap)
+
+    def next_due_at(self):
+        """Return the earliest armed fire time, or None if nothing is armed."""
+        while self._heap:
+            fire_at, seq, key = self._heap[0]
+            armed = self._armed.get(key)
+            if armed and armed[1] == seq:
+                return fire_at
+            heapq.heappop(self._heap)
+        return None
+
+    def upcoming(self, until):
+        """Return (fire_at, activity) for armed entries due at or before until, without popping them."""
+        found = []
+        stack = [0] if self._heap else []
+        while stack:
+            position = stack.pop()
+            fire_at, seq, key = self._heap[position]
+            if fire_at > until:
+                continue
+            armed = self._armed.get(key)
+            if armed and armed[1] == seq:
+                found.append((fire_at, armed[2].activity))
+            stack.extend(child for child in (2 * position + 1, 2 * position + 2) if child < len(self._heap))
+        return found
+
+    def pop_due(self, now):
+        """Remove and return (fire_at, activity) for every entry due at or before now."""
+        due = []
+        while self._heap and self._heap[0][0] <= now:
+            fire_at, seq, key = heapq.heappop(self._heap)
+            armed = self._armed.get(key)
+            if not armed or armed[1] != seq:
+                continue
+            entry = armed[2]
+            del self._armed[key]
+            self._last_fired[key] = fire_at
+            due.append((fire_at, entry.activity))
+            self._arm_entry(entry, fire_at + ONE_MINUTE)
+        return due
@@ -0,0 +1,276 @@
+import argparse
+import csv
+import json
+import logging
+import os
+import time
+from array import array
+from collections import defaultdict
+from datetime import datetime, timedelta
+from activity_cache import ActivityCache
+from clock import VirtualClock
+from job import run_scheduler, run_event_scheduler
+import metrics
+
+HISTOGRAM_BUCKETS = (0, 1, 10, 100, 1000, 10000)
+
+
+class SnapshotSource:
+    """ActivityCache source over a fixed list of activities; nothing changes while simulating."""
+
+    def __init__(self, activities):
+        self.activities = activities
+
+    def load(self):
+        return self.activities
+
+    def poll(self):
+        return []
+
+
+class SimulationLedger:
+    """In-memory claims for the minutes that can still be fired, keyed by fire instant.
+
+    A week of fires would not fit in a DedupeLedger's TTL window without a lot of
+    memory, so claims are dropped once their minute is older than keep_seconds of
+    simulated time. A repeated claim is refused and counted as a duplicate.
+    """
+
+    def __init__(self, clock, keep_seconds):
+        self.clock = clock
+        self.keep = timedelta(seconds=keep_seconds)
+        self.duplicates = 0
+        self._claims = {}
+
+    def __len__(self):
+        return sum(len(keys) for keys in self._claims.values())
+
+    def claim(self, activity_id, fire_at):
+        oldest = self.clock.now() - self.keep
+        for minute in [minute for minute in self._claims if minute < oldest]:
+            del self._claims[minute]
+        keys = self._claims.setdefault(fire_at, set())
+        key = str(activity_id)
+        if key in keys:
+            self.duplicates += 1
+            return False
+        keys.add(key)
+        return True
+
+
+class FireRecorder:
+    """No-op dispatcher that records every fire's scheduled and simulated dispatch time.
+
+    Args:
+        clock: The simulation's clock; a batch is stamped with its now when handed over
+        since: Fires scheduled before this instant (the warm-up) are not recorded
+        fires_file: Optional open text file each fire is written to as a JSON line
+    """
+
+    def __init__(self, clock, since=None, fires_file=None):
+        self.clock = clock
+        self.since = since
+        self.fires_file = fires_file
+        self.fires = 0
+        self.per_minute = defaultdict(int)
+        self.max_delay = defaultdict(float)
+        self.delays = array("d")
+
+    def dispatch(self, jobs):
+        dispatched = self.clock.now()
+        for fire_at, activity in jobs:
+            if self.since is not None and fire_at < self.since:
+                continue
+            delay = (dispatched - fire_at).total_seconds()
+            self.fires += 1
+            self.per_minute[fire_at] += 1
+            self.delays.append(delay)
+            if delay > self.max_delay[fire_at]:
+                self.max_delay[fire_at] = delay
+            if self.fires_file is not None:
+                self.fires_file.write(json.dumps({
+                    "activity": str(activity.get("_id", activity.get("name", "unknown"))),
+                    "user": activity.get("user_id"),
+                    "scheduled": fire_at.isoformat(),
+                    "dispatched": dispatched.isoformat(timespec="milliseconds"),
+                    "delay_seconds": round(delay, 3),
+                }) + "\n")
+        return len(jobs)
+
+    def stats(self):
+        return {"fires": self.fires}
+
+
+def load_snapshot(path):
+    """Read activities from a JSON array or a JSON-lines export (mongoexport's default)."""
+    from bson import json_util
+
+    with open(path) as snapshot:
+        text = snapshot.read()
+    if text.lstrip().startswith("["):
+        return json_util.loads(text)
+    return [json_util.loads(line) for line in text.splitlines() if line.strip()]
+
+
+def _percentile(values, share):
+    return values[min(len(values) - 1, int(len(values) * share))] if values else 0
+
+
+def minute_histogram(counts):
+    """How many minutes had 0, 1-9, 10-99, ... fires."""
+    histogram = {}
+    for low, high in zip(HISTOGRAM_BUCKETS, HISTOGRAM_BUCKETS[1:] + (None,)):
+        if high is None:
+            label = f"{low}+"
+        elif high - low == 1:
+            label = str(low)
+        else:
+            label = f"{low}-{high - 1}"
+        histogram[label] = sum(1 for count in counts if count >= low and (high is None or count < high))
+    return histogram
+
+
+def build_report(recorder, ledger, start, end, activities, wall_seconds, skipped, top):
+    minutes = []
+    moment = start
+    while moment < end:
+        minutes.append(moment)
+        moment += timedelta(minutes=1)
+    counts = [recorder.per_minute.get(minute, 0) for minute in minutes]
+    busy = sorted(count for count in counts if count)
+    delays = sorted(recorder.delays)
+    by_hour = [0] * 24
+    for minute, count in recorder.per_minute.items():
+        by_hour[minute.hour] += count
+    peaks = sorted(recorder.per_minute.items(), key=lambda item: (-item[1], item[0]))[:top]
+    simulated = (end - start).total_seconds()
+    return {
+        "start": start.isoformat(),
+        "end": end.isoformat(),
+        "activities": activities,
+        "simulated_hours": round(simulated / 3600, 2),
+        "wall_seconds": round(wall_seconds, 2),
+        "speedup": round(simulated / wall_seconds) if wall_seconds else None,
+        "fires": recorder.fires,
+        "duplicates": ledger.duplicates,
+        "skipped": skipped,
+        "delay_seconds": {
+            "p50": round(_percentile(delays, 0.5), 3),
+            "p95": round(_percentile(delays, 0.95), 3),
+            "p99": round(_percentile(delays, 0.99), 3),
+            "max": round(delays[-1], 3) if delays else 0,
+        },
+        "per_minute": {
+            "minutes": len(counts),
+            "busy_minutes": len(busy),
+            "p50_busy": _percentile(busy, 0.5),
+            "p95_busy": _percentile(busy, 0.95),
+            "p99_busy": _percentile(busy, 0.99),
+            "max": busy[-1] if busy else 0,
+            "histogram": minute_histogram(counts),
+        },
+        "peak_minutes": [
+            {"minute": minute.isoformat(), "weekday": minute.strftime("%a"), "fires": count,
+             "max_delay_seconds": round(recorder.max_delay[minute], 3)}
+            for minute, count in peaks
+        ],
+        "by_hour_of_day": by_hour,
+    }
+
+
+def write_minutes(path, recorder, start, end):
+    """Per-minute load as CSV, one row for every minute in the range."""
+    with open(path, "w", newline="") as out:
+        writer = csv.writer(out)
+        writer.writerow(["minute", "fires", "max_delay_seconds"])
+        moment = start
+        while moment < end:
+            writer.writerow([moment.isoformat(), recorder.per_minute.get(moment, 0), round(recorder.max_delay.get(moment, 0.0), 3)])
+            moment += timedelta(minutes=1)
+
+
+def simulate(activities, start, end, mode="scan", compute_scale=1.0, sync_seconds=None, fires_file=None, warmup_minutes=5):
+    """Replay the scheduler over a snapshot between start and end on a virtual clock.
+
+    The real run_scheduler / run_event_scheduler loop runs unchanged; only the clock,
+    the ledger and the dispatcher are swapped for in-memory stand-ins, so fires are
+    recorded instead of dialed. The clock starts warmup_minutes early so loading the
+    snapshot doesn't show up as lateness in the first simulated minute.
+
+    Returns:
+        (FireRecorder, SimulationLedger, wall seconds taken, skipped fires by reason)
+    """
+    from job import get_grace_seconds
+
+    clock = VirtualClock(start - timedelta(minutes=warmup_minutes), compute_scale)
+    ledger = SimulationLedger(clock, get_grace_seconds() + 120)
+    recorder = FireRecorder(clock, start, fires_file)
+    cache = ActivityCache(SnapshotSource(activities))
+    before = {reason: metrics.JOBS_SKIPPED.get(reason=reason) for reason in ("late", "expired")}
+    started = time.perf_counter()
+    if mode == "event":
+        run_event_scheduler(cache=cache, sync_seconds=sync_seconds, dispatcher=recorder, ledger=ledger, clock=clock, until=end)
+    else:
+        run_scheduler(cache=cache, dispatcher=recorder, ledger=ledger, clock=clock, until=end)
+    wall_seconds = time.perf_counter() - started
+    skipped = {reason: metrics.JOBS_SKIPPED.get(reason=reason) - count for reason, count in before.items()}
+    return recorder, ledger, wall_seconds, skipped
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fast-forward the scheduler over an activity snapshot on a virtual clock")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--snapshot", help="JSON array or JSON-lines export of the activities collection")
+    source.add_argument("--from-db", action="store_true", help="Read the activities collection once as the snapshot")
+    source.add_argument("--synthetic", type=int, help="Generate this many activities like bench.py does")
+    parser.add_argument("--start", help="Simulated start, YYYY-MM-DD[THH:MM]; defaults to today's midnight "
+                                        "(the benchmark week for --synthetic)")
+    parser.add_argument("--days", type=float, default=7, help="How long to simulate")
+    parser.add_argument("--mode", choices=["scan", "event"], default="scan", help="Scheduler loop to replay")
+    parser.add_argument("--sync-seconds", type=float, default=None, help="Event mode sync interval")
+    parser.add_argument("--compute-scale", type=float, default=1.0,
+                        help="Simulated seconds per real second of scheduler work; 0 ignores tick cost")
+    parser.add_argument("--warmup-minutes", type=float, default=5,
+                        help="Start the clock this long before --start so loading the snapshot is not counted")
+    parser.add_argument("--top", type=int, default=20, help="How many peak minutes to list")
+    parser.add_argument("--fires", help="Write every fire as a JSON line to this file")
+    parser.add_argument("--minutes", help="Write the per-minute load to this CSV file")
+    parser.add_argument("--out", help="Also write the JSON report to this file")
+    args = parser.parse_args()
+
+    # Logs share stdout with the report, so only warnings get through unless LOG_LEVEL says otherwise
+    if "LOG_LEVEL" not in os.environ:
+        logging.getLogger("tingting").setLevel(logging.WARNING)
+    default_start = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+    if args.synthetic is not None:
+        from bench import BASE_WEEK, generate
+        activities = generate(args.synthetic)
+        default_start = BASE_WEEK
+    elif args.from_db:
+        from mongodb_utils import get_collection
+        activities = list(get_collection("activities").find())
+    else:
+        activities = load_snapshot(args.snapshot)
+    start = datetime.fromisoformat(args.start) if args.start else default_start
+    end = start + timedelta(days=args.days)
+
+    fires_file = open(args.fires, "w") if args.fires else None
+    try:
+        recorder, ledger, wall_seconds, skipped = simulate(activities, start, end, args.mode, args.compute_scale,
+                                                           args.sync_seconds, fires_file, args.warmup_minutes)
+    finally:
+        if fires_file is not None:
+            fires_file.close()
+    report = build_report(recorder, ledger, start, end, len(activities), wall_seconds, skipped, args.top)
+    report["mode"] = args.mode
+    if args.minutes:
+        write_minutes(args.minutes, recorder, start, end)
+    text = json.dumps(report, indent=2)
+    if args.out:
+        with open(args.out, "w") as out:
+            out.write(text + "\n")
+    print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+from datetime import datetime
+
+import mongomock
+from pymongo.errors import AutoReconnect
+from dedupe import DedupeLedger
+
+FIRE_AT = datetime(2026, 10, 19, 9, 0)
+
+
+def test_claim_is_idempotent():
+    ledger = DedupeLedger(mongomock.MongoClient().db.fired_jobs)
+    assert ledger.claim("a", FIRE_AT)
+    assert not ledger.claim("a", FIRE_AT)
+    assert ledger.claim("a", datetime(2026, 10, 19, 9, 1))
+    assert ledger.claim("b", FIRE_AT)
+
+
+def test_claims_survive_a_restart_and_are_shared_between_schedulers():
+    collection = mongomock.MongoClient().db.fired_jobs
+    assert DedupeLedger(collection).claim("a", FIRE_AT)
+    # A fresh ledger has nothing in memory, so only the unique index stops the second claim
+    assert not DedupeLedger(collection).claim("a", FIRE_AT)
+    assert collection.count_documents({}) == 1
+
+
+def test_ids_are_compared_as_strings():
+    ledger = DedupeLedger(mongomock.MongoClient().db.fired_jobs)
+    assert ledger.claim(7, FIRE_AT)
+    assert not ledger.claim("7", FIRE_AT)
+
+
+def test_release_lets_the_fire_be_claimed_again():
+    collection = mongomock.MongoClient().db.fired_jobs
+    ledger = DedupeLedger(collection)
+    ledger.claim("a", FIRE_AT)
+    ledger.release("a", FIRE_AT)
+    assert collection.count_documents({}) == 0
+    assert ledger.claim("a", FIRE_AT)
+
+
+def test_memory_only_when_mongo_fails():
+    collection = mongomock.MongoClient().db.fired_jobs
+    ledger = DedupeLedger(collection)
+
+    def down(*args, **kwargs):
+        raise AutoReconnect("down")
+
+    collection.insert_one = down
+    assert ledger.claim("a", FIRE_AT)
+    assert not ledger.claim("a", FIRE_AT)
+
+
+def test_claims_expire_from_memory(monkeypatch):
+    import dedupe
+
+    ledger = DedupeLedger(ttl_seconds=60)
+    clock = [1000.0]
+    monkeypatch.setattr(dedupe.time, "monotonic", lambda: clock[0])
+    ledger.claim("a", FIRE_AT)
+    assert len(ledger) == 1
+    clock[0] += 61
+    assert ("a", FIRE_AT) not in ledger
+    assert len(ledger) == 0
@@ -0,0 +1,114 @@
+from datetime import datetime
+
+import pytest
+from fast_parser import parse_activity, try_parse_activity, get_min_confidence
+
+# A Sunday
+NOW = datetime(2026, 10, 18, 8, 0)
+
+
+def parse(text):
+    return parse_activity(text, NOW)
+
+
+def test_simple_one_time_reminder():
+    data, confidence = parse("user_123 take medicine at 9:45 pm tomorrow")
+    assert confidence >= get_min_confidence()
+    assert data["user_id"] == "user_123"
+    assert data["description"] == "take medicine"
+    assert (data["date"], data["time"]) == ("2026-10-19", "21:45")
+    assert data["type"] == "one_time"
+    assert data["tags"] == ["medication"]
+
+
+def test_daily_recurrence():
+    data, confidence = parse("add for user_1 take medicine at 9pm every day")
+    assert confidence >= get_min_confidence()
+    assert data["type"] == "recurring"
+    assert data["pattern"] == ["mon", "tue", "wed", "thu", "fri", "sat", "sun"]
+
+
+def test_weekly_days():
+    data, confidence = parse("user_1 yoga at 7am every mon, wed and fri")
+    assert confidence >= get_min_confidence()
+    assert data["pattern"] == ["mon", "wed", "fri"]
+
+
+def test_relative_minutes():
+    data, confidence = parse("user_1 take a bath in 5 minutes")
+    assert confidence >= get_min_confidence()
+    assert data["time"] == "08:05"
+
+
+@pytest.mark.parametrize("text, time", [
+    ("user_1 take medicine at 9.30pm", "21:30"),
+    ("user_1 take medicine at 9:30 p.m.", "21:30"),
+    ("user_1 drink water at 18:30", "18:30"),
+    ("user_1 walk at 12am", "00:00"),
+    ("user_1 lunch at noon", "12:00"),
+])
+def test_clock_formats(text, time):
+    data, confidence = parse(text)
+    assert confidence >= get_min_confidence()
+    assert data["time"] == time
+    assert not any(char.isdigit() for char in data["description"])
+
+
+@pytest.mark.parametrize("text", [
+    "user_1 take medicine at 13pm",
+    "user_1 take medicine at 0am",
+])
+def test_impossible_clock_goes_to_the_llm(text):
+    _, confidence = parse(text)
+    assert confidence < get_min_confidence()
+
+
+@pytest.mark.parametrize("text, user_id", [
+    ("add activity for user 123 to take pills at 8am", "123"),
+    ("add activity for abc123 to take pills at 8am", "abc123"),
+    ("user-9 take pills at 8am", "user-9"),
+])
+def test_user_id_forms(text, user_id):
+    data, confidence = parse(text)
+    assert confidence >= get_min_confidence()
+    assert data["user_id"] == user_id
+
+
+@pytest.mark.parametrize("text", [
+    "10 pushups at 9pm",
+    "take pills for 9pm",
+    "take medicine at 9pm",
+])
+def test_no_user_id_goes_to_the_llm(text):
+    data, confidence = parse(text)
+    assert data["user_id"] == ""
+    assert confidence < get_min_confidence()
+
+
+def test_duration_is_not_a_user_id():
+    data, confidence = parse("take pills at 9am every day for 2 weeks for user_5")
+    assert data["user_id"] == "user_5"
+    assert data["duration"] == "2 weeks"
+
+
+@pytest.mark.parametrize("text", [
+    "user_1 call mom every month at 9am",
+    "user_1 call mom next week at 9am",
+    "user_1 pay rent on the 1st at 9am",
+    "user_1 gym at 6pm until friday",
+    "user_1 water plants in 2 days at 9am",
+    "user_1 dentist on march 3 at 3pm",
+])
+def test_unparsed_dates_go_to_the_llm(text):
+    _, confidence = parse(text)
+    assert confidence < get_min_confidence()
+
+
+def test_parser_errors_defer_to_the_llm(monkeypatch):
+    import fast_parser
+
+    def boom(text):
+        raise RuntimeError("bad input")
+
+    monkeypatch.setattr(fast_parser, "categorize_activity", boom)
+    assert try_parse_activity("user_1 take medicine at 9pm", NOW) == (None, 0.0)
@@ -0,0 +1,117 @@
+from datetime import datetime, timedelta
+
+import mongomock
+import pytest
+from pymongo.errors import AutoReconnect
+from dedupe import DedupeLedger
+from outbox import Outbox, drain, PENDING, SENT, DEAD
+
+
+@pytest.fixture
+def db():
+    return mongomock.MongoClient().db
+
+
+def activity(key, name="take medicine"):
+    return {"_id": key, "name": name, "form": {"name": name, "description": ""}}
+
+
+class StubDispatcher:
+    max_workers = 4
+
+    def __init__(self, ok=True):
+        self.ok = ok
+        self.calls = []
+
+    def submit(self, activity, fire_at=None):
+        from concurrent.futures import Future
+
+        self.calls.append((activity["_id"], fire_at))
+        future = Future()
+        future.set_result((self.ok, None if self.ok else "status 500"))
+        return future
+
+
+def test_enqueue_is_idempotent_per_fire(db):
+    outbox = Outbox(db.call_outbox)
+    fire_at = datetime.now().replace(second=0, microsecond=0)
+    assert outbox.dispatch([(fire_at, activity("a")), (fire_at, activity("a"))]) == 2
+    outbox.enqueue(activity("a"), fire_at)
+    outbox.enqueue(activity("a"), fire_at + timedelta(minutes=1))
+    assert db.call_outbox.count_documents({}) == 2
+
+
+def test_drain_sends_most_urgent_first(db):
+    outbox = Outbox(db.call_outbox)
+    fire_at = datetime.now().replace(second=0, microsecond=0)
+    outbox.dispatch([(fire_at, activity("study", "study maths")), (fire_at, activity("meds", "take medicine"))])
+    dispatcher = StubDispatcher()
+    dispatcher.max_workers = 1
+    drain(outbox, dispatcher)
+    assert dispatcher.calls == [("meds", fire_at)]
+    assert db.call_outbox.find_one({"_id": f"meds:{fire_at.isoformat()}"})["status"] == SENT
+
+
+def test_a_sent_job_is_not_claimed_again(db):
+    outbox = Outbox(db.call_outbox)
+    fire_at = datetime.now().replace(second=0, microsecond=0)
+    outbox.dispatch([(fire_at, activity("a"))])
+    assert drain(outbox, StubDispatcher()) == 1
+    assert drain(outbox, StubDispatcher()) == 0
+
+
+def test_failures_back_off_then_dead_letter(db):
+    outbox = Outbox(db.call_outbox, max_attempts=2, base_delay=60)
+    fire_at = datetime.now().replace(second=0, microsecond=0)
+    outbox.dispatch([(fire_at, activity("a"))])
+    drain(outbox, StubDispatcher(ok=False))
+    job = db.call_outbox.find_one()
+    assert job["status"] == PENDING
+    assert job["attempts"] == 1
+    assert job["next_attempt_at"] > datetime.now() + timedelta(seconds=30)
+    # Not ready again until the backoff passes
+    assert outbox.claim(10) == []
+    db.call_outbox.update_one({}, {"$set": {"next_attempt_at": datetime.now()}})
+    drain(outbox, StubDispatcher(ok=False))
+    assert db.call_outbox.find_one()["status"] == DEAD
+
+
+def test_jobs_past_the_grace_window_are_dead_lettered(db):
+    outbox = Outbox(db.call_outbox, grace_seconds=300)
+    outbox.dispatch([(datetime.now() - timedelta(minutes=10), activity("a"))])
+    dispatcher = StubDispatcher()
+    assert drain(outbox, dispatcher) == 0
+    assert dispatcher.calls == []
+    assert db.call_outbox.find_one()["status"] == DEAD
+
+
+def test_claims_that_never_report_back_are_dead_lettered(db):
+    outbox = Outbox(db.call_outbox, max_attempts=2, visibility_seconds=1)
+    fire_at = datetime.now().replace(second=0, microsecond=0)
+    outbox.dispatch([(fire_at, activity("a"))])
+    for _ in range(2):
+        assert len(outbox.claim(1)) == 1
+        # The drainer crashed; the job becomes visible again
+        db.call_outbox.update_one({}, {"$set": {"next_attempt_at": datetime.now()}})
+    assert outbox.claim(1) == []
+    assert db.call_outbox.find_one()["status"] == DEAD
+
+
+def test_an_enqueue_mongo_refuses_is_released_and_retried(db):
+    ledger = DedupeLedger(db.fired_jobs)
+    outbox = Outbox(db.call_outbox, ledger=ledger)
+    fire_at = datetime.now().replace(second=0, microsecond=0)
+    assert ledger.claim("a", fire_at)
+    update_one = db.call_outbox.update_one
+
+    def down(*args, **kwargs):
+        raise AutoReconnect("down")
+
+    outbox.collection.update_one = down
+    assert outbox.dispatch([(fire_at, activity("a"))]) == 0
+    assert outbox.unqueued
+    assert ledger.claim("a", fire_at)
+    outbox.collection.update_one = update_one
+    assert outbox.dispatch([]) == 1
+    assert outbox.unqueued == []
+    assert db.call_outbox.count_documents({}) == 1
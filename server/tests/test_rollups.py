@@ -0,0 +1,127 @@
+from datetime import datetime, timedelta
+
+import mongomock
+import pytest
+from bson import ObjectId
+from rollups import RecordFeed, AdherenceRollups, read_adherence
+
+
+class FakeStream:
+    def __init__(self):
+        self.events = []
+
+    def try_next(self):
+        return self.events.pop(0) if self.events else None
+
+
+@pytest.fixture
+def db():
+    db = mongomock.MongoClient().db
+
+    def bulk_write(operations, ordered=True):
+        # mongomock's bulk_write doesn't apply $max; run the upserts one at a time
+        for op in operations:
+            db.adherence_daily.update_one(op._filter, op._doc, upsert=op._upsert)
+
+    db.adherence_daily.bulk_write = bulk_write
+    return db
+
+
+def record(seconds_ago, activity_id="a", completed=True):
+    return {"_id": ObjectId(), "activityId": activity_id, "completed": completed,
+            "createdAt": (datetime.utcnow() - timedelta(seconds=seconds_ago)).replace(microsecond=0)}
+
+
+def run_once(feed, rollups):
+    batch = feed.poll()
+    rollups.apply(batch)
+    feed.commit(batch)
+    return batch
+
+
+def totals(db, key="a"):
+    return read_adherence(db.adherence_daily, "activity", key, days=2)["total"]
+
+
+def test_polling_only_reads_settled_records_in_order(db):
+    older, old, fresh = record(300), record(120), record(5)
+    db.records.insert_many([fresh, old, older])
+    feed = RecordFeed(db.records, db.rollup_state, use_change_stream=False, safety_lag=60)
+    assert [r["_id"] for r in feed.poll()] == [older["_id"], old["_id"]]
+
+
+def test_catch_up_resumes_from_the_saved_checkpoint(db):
+    db.records.insert_many([record(300), record(200)])
+    rollups = AdherenceRollups(db.adherence_daily, db.activities)
+    feed = RecordFeed(db.records, db.rollup_state, use_change_stream=False, safety_lag=60)
+    assert len(run_once(feed, rollups)) == 2
+    assert feed.poll() == []
+    db.records.insert_one(record(100))
+    restarted = RecordFeed(db.records, db.rollup_state, use_change_stream=False, safety_lag=60)
+    assert len(run_once(restarted, rollups)) == 1
+    assert totals(db) == 3
+
+
+def test_a_record_committing_late_is_still_counted(db):
+    rollups = AdherenceRollups(db.adherence_daily, db.activities)
+    feed = RecordFeed(db.records, db.rollup_state, use_change_stream=False, safety_lag=60)
+    db.records.insert_one(record(120))
+    run_once(feed, rollups)
+    # Created before the last applied record but committed after it was read
+    db.records.insert_one(record(90))
+    assert len(run_once(feed, rollups)) == 1
+    assert totals(db) == 2
+
+
+def test_counters_split_completed_and_missed(db):
+    db.activities.insert_one({"_id": "a", "user_id": "user_1"})
+    db.records.insert_many([record(300), record(200, completed="no"), record(100, completed="true")])
+    feed = RecordFeed(db.records, use_change_stream=False, safety_lag=60)
+    run_once(feed, AdherenceRollups(db.adherence_daily, db.activities))
+    view = read_adherence(db.adherence_daily, "user", "user_1", days=2)
+    assert (view["total"], view["completed"], view["missed"]) == (3, 2, 1)
+
+
+def stream_feed(db, stream):
+    db.records.watch = lambda *args, **kwargs: stream
+    feed = RecordFeed(db.records, db.rollup_state, safety_lag=60)
+    # Catch up, which opens the stream, then the overlap pass
+    assert feed.poll() == []
+    assert feed.poll() == []
+    assert feed._stream is stream and not feed._catching_up
+    return feed
+
+
+def test_stream_records_are_applied_once(db):
+    stream = FakeStream()
+    rollups = AdherenceRollups(db.adherence_daily, db.activities)
+    feed = stream_feed(db, stream)
+    new = record(1)
+    db.records.insert_one(new)
+    stream.events.append({"fullDocument": new})
+    stream.events.append({"fullDocument": new})
+    assert len(run_once(feed, rollups)) == 1
+    # The stream breaks; catching up by polling must not count the record again
+    stream.try_next = lambda: (_ for _ in ()).throw(RuntimeError("stream closed"))
+    feed.poll()
+    feed._stream = None
+    feed.safety_lag = timedelta(0)
+    assert feed.poll() == []
+    assert totals(db) == 1
+
+
+def test_a_failed_apply_is_retried_before_reading_on(db):
+    stream = FakeStream()
+    rollups = AdherenceRollups(db.adherence_daily, db.activities)
+    feed = stream_feed(db, stream)
+    first, second = record(2), record(1)
+    db.records.insert_many([first, second])
+    stream.events.append({"fullDocument": first})
+    batch = feed.poll()
+    assert batch == [first]
+    # apply() raised, so nothing is committed; the consumed event must come back
+    stream.events.append({"fullDocument": second})
+    assert feed.poll() == [first]
+    run_once(feed, rollups)
+    assert run_once(feed, rollups) == [second]
+    assert totals(db) == 2
@@ -0,0 +1,37 @@
+import pytest
+from router import route_query, get_min_confidence
+
+
+@pytest.mark.parametrize("query, intent", [
+    ("fetch all activities for user_1", "fetch"),
+    ("show the history of user_42", "fetch"),
+    ("add activity for user_1 to take medicine at 9pm", "add"),
+    ("user_1 take medicine at 9:45 pm tomorrow", "add"),
+])
+def test_simple_commands_route_directly(query, intent):
+    route = route_query(query)
+    assert route.intent == intent
+    assert route.confidence >= get_min_confidence()
+
+
+@pytest.mark.parametrize("query", [
+    "user_123 see the dentist at 3pm tomorrow",
+    "user_1 view the sunset at 6pm",
+    "user_7 show grandma the photos tonight",
+])
+def test_fetch_verb_with_a_time_goes_to_the_agent(query):
+    assert route_query(query).confidence < get_min_confidence()
+
+
+def test_no_user_id_goes_to_the_agent():
+    route = route_query("fetch all my activities")
+    assert route.user_id is None
+    assert route.confidence < get_min_confidence()
+
+
+def test_add_without_a_time_goes_to_the_agent():
+    assert route_query("add a reminder for user_1 to stretch").confidence < get_min_confidence()
+
+
+def test_both_intents_are_ambiguous():
+    assert route_query("show and add activities for user_1").intent is None
@@ -0,0 +1,83 @@
+from datetime import datetime
+
+from scheduler import ScheduleIndex, normalize_activity
+
+# A Sunday
+NOW = datetime(2026, 10, 18, 8, 0)
+
+
+def weekly(key, times, **fields):
+    return dict({"_id": key, "type": "recurring", "days": list(times), "recurringTimes": times}, **fields)
+
+
+def one_time(key, timestamp, **fields):
+    return dict({"_id": key, "type": "one_time", "timestamp": timestamp}, **fields)
+
+
+def keys(entries):
+    return sorted(entry.key for entry in entries)
+
+
+def test_normalize_reads_days_from_the_form():
+    activity = {"_id": "a", "type": "recurring", "form": {"days": ["Tue"], "recurringTimes": {"Tue": "07:05"}}}
+    entry = normalize_activity(activity)
+    assert list(entry.weekly) == [-1, 7 * 60 + 5, -1, -1, -1, -1, -1]
+
+
+def test_normalize_ignores_times_for_unlisted_days():
+    entry = normalize_activity({"_id": "a", "type": "recurring", "days": ["Mon"],
+                                "recurringTimes": {"Mon": "09:00", "Tue": "10:00"}})
+    assert list(entry.weekly) == [540, -1, -1, -1, -1, -1, -1]
+
+
+def test_due_matches_weekday_and_date():
+    index = ScheduleIndex([
+        weekly("a", {"Mon": "09:00", "Wed": "09:00"}),
+        one_time("b", "2026-10-19T09:00:00"),
+        one_time("c", "2026-10-26T09:00:00"),
+    ])
+    assert keys(index.due(datetime(2026, 10, 19, 9, 0, 59))) == ["a", "b"]
+    assert keys(index.due(datetime(2026, 10, 21, 9, 0))) == ["a"]
+    assert keys(index.due(datetime(2026, 10, 26, 9, 0))) == ["a", "c"]
+    assert index.due(datetime(2026, 10, 19, 9, 1)) == []
+
+
+def test_due_between_covers_every_minute_of_the_window():
+    index = ScheduleIndex([weekly("a", {"Sun": "08:01"}), weekly("b", {"Sun": "08:03"}), weekly("c", {"Sun": "08:00"})])
+    window = list(index.due_between(NOW, datetime(2026, 10, 18, 8, 3)))
+    assert [(moment.minute, keys(entries)) for moment, entries in window] == [(1, ["a"]), (3, ["b"])]
+
+
+def test_upsert_moves_and_remove_unindexes():
+    index = ScheduleIndex([weekly("a", {"Mon": "09:00"})])
+    index.upsert(weekly("a", {"Tue": "10:00"}))
+    assert len(index) == 1
+    assert index.due(datetime(2026, 10, 19, 9, 0)) == []
+    assert keys(index.due(datetime(2026, 10, 20, 10, 0))) == ["a"]
+    index.remove("a")
+    assert len(index) == 0
+    assert index.due(datetime(2026, 10, 20, 10, 0)) == []
+
+
+def test_expired_entries_are_not_due_and_are_pruned():
+    index = ScheduleIndex([
+        weekly("a", {"Mon": "09:00", "Wed": "09:00"}, expiry="2026-10-20"),
+        weekly("b", {"Wed": "09:00"}),
+    ])
+    assert keys(index.due(datetime(2026, 10, 19, 9, 0))) == ["a"]
+    assert keys(index.due(datetime(2026, 10, 21, 9, 0))) == ["b"]
+    assert index.prune(datetime(2026, 10, 20, 23, 59)) == 0
+    assert index.prune(datetime(2026, 10, 21, 0, 0)) == 1
+    assert len(index) == 1
+
+
+def test_prune_ignores_a_superseded_expiry():
+    index = ScheduleIndex([weekly("a", {"Mon": "09:00"}, expiry="2026-10-19")])
+    index.upsert(weekly("a", {"Mon": "09:00"}, expiry="2026-12-31"))
+    assert index.prune(datetime(2026, 10, 21)) == 0
+    assert len(index) == 1
+
+
+def test_unschedulable_activities_are_not_indexed():
+    index = ScheduleIndex([one_time("a", "garbage"), {"_id": "b", "type": "weekly"}])
+    assert len(index) == 0
@@ -0,0 +1,89 @@
+from datetime import datetime
+
+from scheduler import Scheduler, next_fire_time
+
+# A Sunday
+NOW = datetime(2026, 10, 18, 8, 0)
+
+
+def weekly(key, times, **fields):
+    return dict({"_id": key, "type": "recurring", "days": list(times), "recurringTimes": times}, **fields)
+
+
+def one_time(key, timestamp, **fields):
+    return dict({"_id": key, "type": "one_time", "timestamp": timestamp}, **fields)
+
+
+def test_weekly_recurrence_picks_the_next_listed_day():
+    activity = weekly("a", {"Mon": "09:00", "Wed": "18:30"})
+    assert next_fire_time(activity, NOW) == datetime(2026, 10, 19, 9, 0)
+    assert next_fire_time(activity, datetime(2026, 10, 19, 9, 1)) == datetime(2026, 10, 21, 18, 30)
+    # Wraps into the following week
+    assert next_fire_time(activity, datetime(2026, 10, 21, 18, 31)) == datetime(2026, 10, 26, 9, 0)
+
+
+def test_fire_time_is_inclusive_at_minute_resolution():
+    activity = weekly("a", {"Sun": "08:00"})
+    assert next_fire_time(activity, datetime(2026, 10, 18, 8, 0, 42)) == datetime(2026, 10, 18, 8, 0)
+
+
+def test_one_time_fires_once():
+    activity = one_time("b", "2026-10-19T10:15:00")
+    assert next_fire_time(activity, NOW) == datetime(2026, 10, 19, 10, 15)
+    assert next_fire_time(activity, datetime(2026, 10, 19, 10, 16)) is None
+
+
+def test_expiry_stops_recurrence():
+    # A bare date expires at the end of that day
+    activity = weekly("a", {"Mon": "09:00", "Wed": "09:00"}, expiry="2026-10-20")
+    assert next_fire_time(activity, NOW) == datetime(2026, 10, 19, 9, 0)
+    assert next_fire_time(activity, datetime(2026, 10, 19, 9, 1)) is None
+
+
+def test_unschedulable_activities():
+    assert next_fire_time({"_id": "c", "type": "recurring", "days": ["Mon"], "recurringTimes": {}}, NOW) is None
+    assert next_fire_time(one_time("d", "not a date"), NOW) is None
+    assert next_fire_time({"_id": "e"}, NOW) is None
+
+
+def test_pop_due_rearms_recurring_and_drops_one_time():
+    engine = Scheduler()
+    engine.load([weekly("a", {"Mon": "09:00", "Tue": "09:00"}), one_time("b", "2026-10-19T09:00:00")], NOW)
+    assert engine.next_due_at() == datetime(2026, 10, 19, 9, 0)
+    assert engine.pop_due(datetime(2026, 10, 19, 8, 59)) == []
+    due = engine.pop_due(datetime(2026, 10, 19, 9, 0, 30))
+    assert sorted(activity["_id"] for _, activity in due) == ["a", "b"]
+    assert len(engine) == 1
+    assert engine.next_due_at() == datetime(2026, 10, 20, 9, 0)
+
+
+def test_rearming_after_a_fire_does_not_fire_the_same_minute_again():
+    engine = Scheduler()
+    activity = weekly("a", {"Mon": "09:00"})
+    engine.arm(activity, NOW)
+    assert engine.pop_due(datetime(2026, 10, 19, 9, 0))
+    # An edit synced in the same minute must not re-arm the minute that just fired
+    assert engine.arm(activity, datetime(2026, 10, 19, 9, 0)) == datetime(2026, 10, 26, 9, 0)
+
+
+def test_disarm_and_reload_forget_activities():
+    engine = Scheduler()
+    engine.load([weekly("a", {"Mon": "09:00"}), weekly("b", {"Mon": "10:00"})], NOW)
+    engine.disarm("a")
+    assert engine.next_due_at() == datetime(2026, 10, 19, 10, 0)
+    engine.load([weekly("c", {"Tue": "07:00"})], NOW)
+    assert len(engine) == 1
+    assert engine.pop_due(datetime(2026, 10, 19, 23, 59)) == []
+
+
+def test_upcoming_does_not_pop():
+    engine = Scheduler()
+    engine.load([weekly("a", {"Sun": "08:01"}), weekly("b", {"Sun": "09:00"})], NOW)
+    assert [activity["_id"] for _, activity in engine.upcoming(datetime(2026, 10, 18, 8, 2))] == ["a"]
+    assert len(engine) == 2
+
+
+def test_expired_activity_is_not_armed():
+    engine = Scheduler()
+    assert engine.arm(weekly("a", {"Mon": "09:00"}, expiry="2026-10-18T07:00:00"), NOW) is None
+    assert len(engine) == 0
@@ -1,32 +1,273 @@
-from langchain.agents import Tool, initialize_agent
-from langchain.agents.agent_types import AgentType
-from langchain_google_genai import ChatGoogleGenerativeAI
 import warnings
 import os
+import threading
+import time
+from datetime import datetime, timedelta
 from dotenv import load_dotenv
+from agent_pool import AgentPool
+from fast_parser import try_parse_activity, get_min_confidence
+from llm_cache import ExtractionCache, extraction_key
+from router import route_query, get_min_confidence as get_router_min_confidence
+from scheduler import WEEKDAYS, is_one_time, get_days_and_times, activity_expiry, normalize_activity
+from logs import get_logger, log, DEBUG, INFO, ERROR
+import metrics
 
 load_dotenv()
 
 warnings.filterwarnings("ignore", category=DeprecationWarning)
 
+logger = get_logger("tools")
+
+# Shared across requests so retries and templated inputs reuse one extraction
+extraction_cache = ExtractionCache()
+
+def estimate_tokens(text):
+    """Rough token count for Gemini prompts, about four characters per token."""
+    return (len(text) + 3) // 4
+
+def describe_schedule(activity):
+    """Short human-readable schedule, e.g. "Mon,Wed 09:00" or "once 2025-05-01 08:30"."""
+    frequency = activity.get("frequency") or {}
+    if is_one_time(activity) or frequency.get("type") == "one_time":
+        when = str(activity.get("timestamp") or frequency.get("date") or "")[:16].replace("T", " ")
+        return f"once {when}".strip()
+    days, recurring_times = get_days_and_times(activity)
+    if days and isinstance(recurring_times, dict):
+        times = {day: recurring_times[day] for day in WEEKDAYS if day in days and recurring_times.get(day)}
+        if len(set(times.values())) == 1:
+            return f"{','.join(times)} {next(iter(times.values()))}"
+        return ", ".join(f"{day} {time}" for day, time in times.items())
+    pattern = frequency.get("pattern") or []
+    return f"{','.join(pattern) or 'daily'} {frequency.get('time', '')}".strip()
+
+def summarize_activity(activity, stats, record_days):
+    """One line per activity: name, schedule, tags and recent completion."""
+    name = activity.get("name") or activity.get("description") or str(activity["_id"])
+    line = f"- {name[:80]} [{describe_schedule(activity)}]"
+    expires_at = activity_expiry(activity)
+    if expires_at is not None and expires_at <= datetime.now():
+        line += " (expired)"
+    tags = activity.get("tags")
+    if isinstance(tags, list) and tags:
+        line += f" tags={','.join(map(str, tags[:4]))}"
+    if stats:
+        last = "done" if stats["last_completed"] else "missed"
+        line += f"; last {record_days:g}d: {stats['completed']}/{stats['total']} completed, last {last}"
+        if isinstance(stats.get("last_at"), datetime):
+            line += f" {stats['last_at']:%Y-%m-%d}"
+    return line
+
 def fetch_activites(id: str):
-    mock_activities = [
-        f"Activity 1: User {id} logged in at 9:00 AM",
-        f"Activity 2: User {id} updated profile at 9:15 AM",
-        f"Activity 3: User {id} sent 3 messages at 10:30 AM",
-        f"Activity 4: User {id} joined group 'Research' at 11:00 AM",
-        f"Activity 5: User {id} uploaded document at 1:45 PM",
-        f"Activity 6: User {id} commented on post #1234 at 2:30 PM",
-        f"Activity 7: User {id} liked content at 3:15 PM",
-        f"Activity 8: User {id} shared article at 4:00 PM",
-        f"Activity 9: User {id} scheduled meeting at 4:45 PM",
-        f"Activity 10: User {id} logged out at 5:30 PM"
-    ]
-    activities_str = "\n".join(mock_activities)
-    print(f"\n--- USER ACTIVITIES FOR ID: {id} ---")
-    print(activities_str)
-    print("-----------------------------------\n")
-    return activities_str
+    """Summarize a user's activities and recent completion records for the agent.
+
+    Activities are read page by page with keyset pagination on (user_id, _id), and
+    records are aggregated per activity over the last FETCH_RECORD_DAYS. Output stops
+    at FETCH_TOKEN_BUDGET tokens, so power users don't flood the prompt.
+
+    Args:
+        id: User ID
+
+    Returns:
+        Text summary, one line per activity, with a note when it was truncated
+    """
+    from mongodb_utils import fetch_user_activities, count_user_activities, summarize_records
+
+    user_id = id.strip().strip("'\"").strip()
+    budget = int(os.getenv("FETCH_TOKEN_BUDGET", "1500"))
+    page_size = int(os.getenv("FETCH_PAGE_SIZE", "50"))
+    record_days = float(os.getenv("FETCH_RECORD_DAYS", "30"))
+    started = time.perf_counter()
+    try:
+        ensure_fetch_indexes()
+        header = f"Activities for user {user_id}:"
+        lines = []
+        used = estimate_tokens(header)
+        shown = 0
+        truncated = False
+        after = None
+        since = datetime.now() - timedelta(days=record_days)
+        while not truncated:
+            page = fetch_user_activities(user_id, after=after, limit=page_size)
+            if not page:
+                break
+            stats = summarize_records([str(activity["_id"]) for activity in page], since)
+            for activity in page:
+                line = summarize_activity(activity, stats.get(str(activity["_id"])), record_days)
+                cost = estimate_tokens(line) + 1
+                if used + cost > budget:
+                    truncated = True
+                    break
+                lines.append(line)
+                used += cost
+                shown += 1
+            if len(page) < page_size:
+                break
+            after = page[-1]["_id"]
+        if truncated:
+            total = count_user_activities(user_id)
+            lines.append(f"... {total - shown} more activities not shown ({shown} of {total}, trimmed to fit {budget} tokens)")
+    except Exception as e:
+        log(logger, ERROR, "could not fetch activities", user=user_id, error=e)
+        return f"Error fetching activities: {e}"
+
+    if not lines:
+        return f"No activities found for user {user_id}."
+    log(logger, INFO, "fetched user activities", user=user_id, shown=shown, truncated=truncated,
+        tokens=used, took=time.perf_counter() - started)
+    return "\n".join([header] + lines)
+
+_indexes_ready = False
+
+def ensure_fetch_indexes():
+    """Create the user_id/activityId indexes once per process before the first lookup."""
+    global _indexes_ready
+    if _indexes_ready:
+        return
+    from mongodb_utils import ensure_indexes
+    try:
+        ensure_indexes()
+    except Exception as e:
+        log(logger, ERROR, "could not ensure indexes", error=e)
+    _indexes_ready = True
+
+def build_activity(input_str, llm_data, path="llm", confidence=0.0):
+    """Turn extracted fields into the activity document returned by add_activity.
+
+    Args:
+        input_str: The original user input, used when a field wasn't extracted
+        llm_data: Dictionary in the extraction prompt's schema
+        path: Which extractor produced llm_data ("rules" or "llm")
+        confidence: Rule-based parser confidence for the input
+
+    Returns:
+        Activity dictionary
+
+    Raises:
+        ValueError: If the input has no user ID, description or time
+    """
+    import uuid
+    import re
+    from datetime import datetime, timedelta
+
+    # First try simple parsing for ID and description
+    if ',' in input_str:
+        parts = input_str.split(",", 1)
+        id = parts[0].strip()
+        name = parts[1].strip()
+    else:
+        words = input_str.split()
+        if len(words) < 2:
+            raise ValueError("Input must contain user ID and activity description")
+        id = words[0]
+        name = " ".join(words[1:])
+
+    date = datetime.now().strftime("%Y-%m-%d")
+    tags = []
+    time = None
+
+    if "user_id" in llm_data and llm_data["user_id"]:
+        id = llm_data["user_id"]
+    
+    if "description" in llm_data and llm_data["description"]:
+        name = llm_data["description"]
+        
+    if "time" in llm_data and llm_data["time"]:
+        time = llm_data["time"]
+        
+    if "date" in llm_data and llm_data["date"]:
+        date = llm_data["date"]
+        
+    if "tags" in llm_data and isinstance(llm_data["tags"], list) and llm_data["tags"]:
+        tags = llm_data["tags"]
+
+    try:
+        # The LLM sometimes drops the leading zero, e.g. "9:45"
+        time = datetime.strptime(str(time or "").strip(), "%H:%M").strftime("%H:%M")
+    except ValueError:
+        raise ValueError(f"Missing or invalid time of execution: {time!r}")
+    try:
+        datetime.strptime(date, "%Y-%m-%d")
+    except ValueError:
+        raise ValueError(f"Invalid date: {date!r}")
+            
+    activity_id = f"act_{uuid.uuid4().hex[:6]}"          
+    activity = {
+        "activity_id": activity_id,
+        "user_id": id,
+        "timestamp": datetime.now().isoformat() + "Z",
+        "description": name,
+        "tags": tags if tags else ["task"],
+        "source": "assistant",
+        "frequency": {
+            "type": llm_data.get("type", "one_time"),
+            "date": date,
+            "pattern": llm_data.get("pattern", []),
+            "time": time
+        },
+        "expiry": (datetime.now() + timedelta(days=14)).isoformat() + "Z",
+        "extraction": {"path": path, "confidence": round(confidence, 2)}
+    }
+            
+    if "duration" in llm_data and llm_data["duration"]:
+        duration = llm_data["duration"].lower()            
+        days = 7  
+        
+        if "week" in duration or "wk" in duration:                
+            match = re.search(r'(\d+)\s*(?:week|wk)', duration)
+            if match:
+                days = int(match.group(1)) * 7
+        elif "day" in duration:
+            match = re.search(r'(\d+)\s*day', duration)
+            if match:
+                days = int(match.group(1))
+        elif "month" in duration:
+            match = re.search(r'(\d+)\s*month', duration)
+            if match:
+                days = int(match.group(1)) * 30
+                            
+        activity["expiry"] = (datetime.now() + timedelta(days=days)).isoformat() + "Z"
+    return activity
+
+def activity_document(activity):
+    """Map a build_activity result onto the schema the client's activity form writes.
+
+    The scheduler reads the top-level type, timestamp (the local fire time for one-time
+    activities), days/recurringTimes and form; call() speaks form.name. createdAt and
+    updatedAt are UTC like the client's, so polling caches see the new document.
+    The extracted fields are kept alongside.
+
+    Raises:
+        ValueError: If the scheduler would never fire the result
+    """
+    frequency = activity["frequency"]
+    recurring = frequency.get("type") == "recurring"
+    # An empty pattern on a recurring activity means every day, as in describe_schedule
+    days = [day for day in WEEKDAYS if day.lower() in {str(d)[:3].lower() for d in frequency.get("pattern") or []}] or list(WEEKDAYS)
+    form = {
+        "name": activity["description"],
+        "description": "",
+        "type": "recurring" if recurring else "one_time",
+        "date": "" if recurring else frequency["date"],
+        "time": "" if recurring else frequency["time"],
+        "days": days if recurring else [],
+        "recurringTimes": {day: frequency["time"] for day in days} if recurring else {},
+    }
+    now = datetime.utcnow()
+    document = dict(
+        activity,
+        type=form["type"],
+        timestamp="" if recurring else f"{frequency['date']}T{frequency['time']}:00",
+        days=form["days"],
+        recurringTimes=form["recurringTimes"],
+        form=form,
+        metadata={"method": form["type"], "form_data": form, "triggered_by": activity.get("source", "assistant")},
+        createdAt=now,
+        updatedAt=now,
+    )
+    if normalize_activity(document) is None:
+        raise ValueError(f"Activity would never be scheduled: {activity['description']!r}")
+    return document
+
 def add_activity(input_str:str):
     """Add an activity for a user.
     
@@ -37,101 +278,46 @@ def add_activity(input_str:str):
         JSON formatted activity data
     """
     import json
-    import uuid
-    import re
-    from datetime import datetime, timedelta
 
     try:
-        # First try simple parsing for ID and description
-        if ',' in input_str:
-            parts = input_str.split(",", 1)
-            id = parts[0].strip()
-            name = parts[1].strip()
-        else:
-            words = input_str.split()
-            if len(words) >= 2:
-                id = words[0]
-                name = " ".join(words[1:])
-            else:
-                return "Error: Input must contain user ID and activity description"
+        if ',' not in input_str and len(input_str.split()) < 2:
+            return "Error: Input must contain user ID and activity description"
                         
-        date = datetime.now().strftime("%Y-%m-%d")
-        tags = []          
-        llm_data = extract_activity_data_with_llm(llm, input_str)
+        # Simple inputs are parsed by rules; only ambiguous ones need a Gemini round trip
+        llm_data, confidence = try_parse_activity(input_str)
+        path = "rules"
+        if confidence < get_min_confidence():
+            llm_data = extraction_cache.get_or_compute(
+                extraction_key(input_str),
+                lambda: extract_activity_data_with_llm(get_llm(), input_str)
+            )
+            path = "llm"
+        log(logger, INFO, "add_activity extraction", path=path, confidence=round(confidence, 2))
         
         if not llm_data:
             return "Service Unavailable: Unable to process the request at this time."
             
-        print("\n--- LLM EXTRACTED DATA ---")
-        print(json.dumps(llm_data, indent=2))
-        print("-------------------------\n")
-                
-        if "user_id" in llm_data and llm_data["user_id"]:
-            id = llm_data["user_id"]
-        
-        if "description" in llm_data and llm_data["description"]:
-            name = llm_data["description"]
-            
-        if "time" in llm_data and llm_data["time"]:
-            time = llm_data["time"]
-            
-        if "date" in llm_data and llm_data["date"]:
-            date = llm_data["date"]
-            
-        if "tags" in llm_data and isinstance(llm_data["tags"], list) and llm_data["tags"]:
-            tags = llm_data["tags"]
-                
-        activity_id = f"act_{uuid.uuid4().hex[:6]}"          
-        activity = {
-            "activity_id": activity_id,
-            "user_id": id,
-            "timestamp": datetime.now().isoformat() + "Z",
-            "description": name,
-            "tags": tags if tags else ["task"],
-            "source": "assistant",
-            "frequency": {
-                "type": llm_data.get("type", "one_time") if llm_data else "one_time",
-                "date": date,
-                "pattern": llm_data.get("pattern", []) if llm_data else [],
-                "time": time
-            },
-            "expiry": (datetime.now() + timedelta(days=14)).isoformat() + "Z"
-        }
-                
-        if llm_data and "duration" in llm_data and llm_data["duration"]:
-            duration = llm_data["duration"].lower()            
-            days = 7  
-            
-            if "week" in duration or "wk" in duration:                
-                match = re.search(r'(\d+)\s*(?:week|wk)', duration)
-                if match:
-                    days = int(match.group(1)) * 7
-            elif "day" in duration:
-                match = re.search(r'(\d+)\s*day', duration)
-                if match:
-                    days = int(match.group(1))
-            elif "month" in duration:
-                match = re.search(r'(\d+)\s*month', duration)
-                if match:
-                    days = int(match.group(1)) * 30
-                                
-            activity["expiry"] = (datetime.now() + timedelta(days=days)).isoformat() + "Z"
-                
+        log(logger, DEBUG, "extracted activity data", data=json.dumps(llm_data))
+
+        activity = build_activity(input_str, llm_data, path, confidence)
         formatted_json = json.dumps(activity, indent=2)
         
-        print(f"\n--- ADDING ACTIVITY FOR USER: {id} ---")
-        print(f"Activity: {name}")
-        print(f"Execution Time: {time}")
-        print("Activity JSON Data:")
-        print(formatted_json)
-        print("-----------------------------------\n")
+        log(logger, DEBUG, "adding activity", user=activity['user_id'], description=activity['description'],
+            time=activity['frequency']['time'])
         
         return formatted_json
     except Exception as e:
-        print(f"Error in add_activity: {e}")
-        print(f"Input received: '{input_str}'")
+        log(logger, ERROR, "add_activity failed", input=input_str, error=e)
         return f"Error processing activity: {e}"
 
+def invoke_llm(llm, prompt, tool):
+    """Invoke the LLM, recording its latency under the tool that asked."""
+    started = time.perf_counter()
+    try:
+        return llm.invoke(prompt)
+    finally:
+        metrics.LLM_SECONDS.observe(time.perf_counter() - started, tool=tool)
+
 def extract_activity_data_with_llm(llm, input_str):
     """Use the Gemini API to directly extract structured activity data from user input.
     
@@ -162,7 +348,7 @@ Extract and return ONLY a valid, properly formatted JSON object with these field
 RESPOND ONLY WITH THE JSON OBJECT, no explanations or other text.
 """
         # Call the LLM to extract the data
-        response = llm.invoke(prompt)
+        response = invoke_llm(llm, prompt, "UserActivityAdded")
         content = response.content.strip()
         
         # Try to parse the response directly as JSON
@@ -187,64 +373,250 @@ RESPOND ONLY WITH THE JSON OBJECT, no explanations or other text.
             return None
     except Exception as e:
         # Any error returns None
-        print(f"Error extracting data with LLM: {e}")
+        log(logger, ERROR, "could not extract data with LLM", error=e)
         return None
 
-# ✅ Wrap it as a Tool
-tools = [
-    Tool(
-        name="UserActivityFetcher",
-        func=fetch_activites,
-        description="Use this tool to fetch user activity logs. Input should be a user ID string."
-    ),    Tool(
-        name="UserActivityAdded",
-        func=add_activity,
-        description="Use this tool to add user activity. Input should be a string containing user ID and activity description and a time for execution (either comma-separated or as first word followed by description)."
-    )
-]
+def extract_activities_batch_with_llm(llm, inputs):
+    """Extract structured activity data for many inputs with one prompt.
+
+    Args:
+        llm: The language model to use
+        inputs: List of user input strings
+
+    Returns:
+        List with one dictionary (or None if that item failed) per input, in order
+    """
+    import json
+    import re
+    from datetime import datetime
+
+    numbered = "\n".join(f"{i}. {json.dumps(text)}" for i, text in enumerate(inputs))
+    prompt = f"""
+You are a data extraction assistant. Today's date is {datetime.now().strftime("%Y-%m-%d")}.
+Parse each of the following numbered user inputs into a structured JSON object.
+
+User inputs:
+{numbered}
+
+Return ONLY a valid JSON array with exactly {len(inputs)} objects, in the same order as the inputs.
+Each object has these fields:
+- index (integer): The number of the input it was extracted from
+- user_id (string): The ID of the user mentioned in the input
+- description (string): A clean description of the activity without time/date information
+- time (string): The time of execution in 24-hour format (HH:MM)
+- date (string): The date in YYYY-MM-DD format, use tomorrow's date if "tomorrow" is mentioned
+- tags (array): Relevant tags based on the activity (e.g., ["medicine", "health"] for medicine-related activities)
+- type (string): Either "one_time" or "recurring" based on the frequency mentioned
+- pattern (array): For recurring activities, days of the week as ["mon", "tue", etc.], or empty for one-time
+- duration (string): How long the activity should continue (e.g., "2 weeks")
 
-# ✅ Gemini LLM wrapper
-llm = ChatGoogleGenerativeAI(model="gemini-2.0-flash", google_api_key=os.getenv('GOOGLE_API_KEY'))
+RESPOND ONLY WITH THE JSON ARRAY, no explanations or other text.
+"""
+    results = [None] * len(inputs)
+    try:
+        content = invoke_llm(llm, prompt, "add_activities_batch").content.strip()
+        json_match = re.search(r'(\[.*\])', content, re.DOTALL)
+        items = json.loads(json_match.group(1) if json_match else content)
+    except Exception as e:
+        log(logger, ERROR, "could not extract batch data with LLM", items=len(inputs), error=e)
+        return results
+    for position, item in enumerate(items if isinstance(items, list) else []):
+        if not isinstance(item, dict):
+            continue
+        index = item.pop("index", position)
+        if isinstance(index, int) and 0 <= index < len(inputs) and results[index] is None:
+            results[index] = item
+    return results
+
+def add_activities_batch(inputs):
+    """Extract, validate and store many activities at once.
+
+    Rule-based parsing handles what it can; the rest is extracted in chunks of
+    BATCH_EXTRACT_CHUNK inputs per LLM call. Valid activities are mapped onto the
+    stored activity schema by activity_document and written with a single bulk insert.
+
+    Args:
+        inputs: List of user input strings
 
-# ✅ Create the agent
-agent = initialize_agent(
-    tools=tools,
-    llm=llm,
-    agent_type=AgentType.ZERO_SHOT_REACT_DESCRIPTION,
-    verbose=True
-)
+    Returns:
+        List of per-item results with index, status ("created" or "error") and
+        either the activity or the error message
+    """
+    from pymongo.errors import BulkWriteError
+    from mongodb_utils import insert_activities
+
+    results = [{"index": i, "input": text} for i, text in enumerate(inputs)]
+    extracted = [None] * len(inputs)
+    pending = []
+    for i, text in enumerate(inputs):
+        if not isinstance(text, str) or not text.strip():
+            results[i].update(status="error", error="Input must be a non-empty string")
+            continue
+        data, confidence = try_parse_activity(text)
+        results[i]["confidence"] = round(confidence, 2)
+        if confidence >= get_min_confidence():
+            extracted[i] = data
+            results[i]["path"] = "rules"
+        else:
+            pending.append(i)
+            results[i]["path"] = "llm"
 
-# ✅ Ask the agent to fetch user activity
-#query = "user_32i4u92432 add activity called take medicine twice daily at 9:45 am and 8:30 pm starting tomorrow and continuing for the next 2 weeks"
-#output = agent.run(query)
+    chunk_size = int(os.getenv("BATCH_EXTRACT_CHUNK", "30"))
+    for start in range(0, len(pending), chunk_size):
+        chunk = pending[start:start + chunk_size]
+        for i, data in zip(chunk, extract_activities_batch_with_llm(get_llm(), [inputs[i] for i in chunk])):
+            extracted[i] = data
 
-def process_query_with_agent(query):
+    activities = []
+    for i, data in enumerate(extracted):
+        if "status" in results[i]:
+            continue
+        if not data:
+            results[i].update(status="error", error="Could not extract activity data")
+            continue
+        try:
+            activity = activity_document(build_activity(inputs[i], data, results[i]["path"], results[i]["confidence"]))
+        except ValueError as e:
+            results[i].update(status="error", error=str(e))
+            continue
+        results[i]["status"] = "created"
+        results[i]["activity"] = activity
+        activities.append(activity)
+
+    if activities:
+        created = [result for result in results if result.get("status") == "created"]
+        try:
+            insert_activities(activities)
+        except BulkWriteError as e:
+            # The insert is unordered, so everything not listed here was written
+            errors = e.details.get("writeErrors", [])
+            log(logger, ERROR, "could not insert some batch activities", failed=len(errors), error=e)
+            for error in errors:
+                created[error["index"]].update(status="error", error=f"Database write failed: {error.get('errmsg', e)}")
+                created[error["index"]].pop("activity", None)
+        except Exception as e:
+            log(logger, ERROR, "could not insert batch activities", error=e)
+            for result in created:
+                result.update(status="error", error=f"Database write failed: {e}")
+                result.pop("activity", None)
+    for activity in activities:
+        if "_id" in activity:
+            activity["_id"] = str(activity["_id"])
+    log(logger, INFO, "batch processed", items=len(inputs), valid=len(activities), llm=len(pending))
+    return results
+
+_llm = None
+_tools = None
+_agent = None
+_agent_pool = None
+_lazy_lock = threading.RLock()
+
+def get_tools():
+    """Return the LangChain tools the agent chooses between, importing LangChain on first use."""
+    global _tools
+    with _lazy_lock:
+        if _tools is None:
+            from langchain.agents import Tool
+
+            # ✅ Wrap it as a Tool
+            _tools = [
+                Tool(
+                    name="UserActivityFetcher",
+                    func=fetch_activites,
+                    description="Use this tool to fetch user activity logs. Input should be a user ID string."
+                ),    Tool(
+                    name="UserActivityAdded",
+                    func=add_activity,
+                    description="Use this tool to add user activity. Input should be a string containing user ID and activity description and a time for execution (either comma-separated or as first word followed by description)."
+                )
+            ]
+    return _tools
+
+def get_llm():
+    """Return the shared Gemini client, creating it on first use."""
+    global _llm
+    with _lazy_lock:
+        if _llm is None:
+            from langchain_google_genai import ChatGoogleGenerativeAI
+
+            # ✅ Gemini LLM wrapper
+            _llm = ChatGoogleGenerativeAI(model="gemini-2.0-flash", google_api_key=os.getenv('GOOGLE_API_KEY'))
+    return _llm
+
+def set_llm(llm):
+    """Use llm instead of Gemini, e.g. a stub in benchmarks; agents are rebuilt around it."""
+    global _llm, _agent, _agent_pool
+    with _lazy_lock:
+        _llm = llm
+        _agent = None
+        _agent_pool = None
+
+def get_agent_pool():
+    """Return the shared AgentPool, creating it on first use."""
+    global _agent_pool
+    with _lazy_lock:
+        if _agent_pool is None:
+            _agent_pool = AgentPool(get_llm, get_tools)
+    return _agent_pool
+
+def __getattr__(name):
+    # llm, tools and agent used to be built at import; keep them reachable, but only build on access
+    global _agent
+    if name == "llm":
+        return get_llm()
+    if name == "tools":
+        return get_tools()
+    if name == "agent":
+        with _lazy_lock:
+            if _agent is None:
+                from langchain.agents import initialize_agent
+                from langchain.agents.agent_types import AgentType
+                _agent = initialize_agent(
+                    tools=get_tools(),
+                    llm=get_llm(),
+                    agent_type=AgentType.ZERO_SHOT_REACT_DESCRIPTION,
+                    verbose=True
+                )
+        return _agent
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+def process_query_with_agent(query, callbacks=None, cancelled=None):
     """Process a user query using the agent to determine the appropriate tool
     
     Args:
         query: The user query string
+        callbacks: Optional LangChain callback handlers notified of each agent step
+        cancelled: Optional threading.Event set when the caller stops waiting; a query
+            still queued at that point is dropped instead of run
     
     Returns:
         The agent's response
     """
     try:
-        # Create an instance of the LLM if not already available
-        gemini_api_key = os.getenv("GOOGLE_API_KEY")
-        if not gemini_api_key:
+        if cancelled is not None and cancelled.is_set():
+            metrics.AGENT_QUERIES_DROPPED.inc(reason="cancelled")
+            return "Service Unavailable: Request cancelled"
+        # Simple commands go straight to their tool instead of through the ReAct loop
+        started = time.perf_counter()
+        route = route_query(query)
+        if route.confidence >= get_router_min_confidence():
+            if route.intent == "fetch":
+                output = fetch_activites(route.user_id)
+            else:
+                output = add_activity(query)
+            elapsed = time.perf_counter() - started
+            agent_avg = get_agent_pool().stats()["inference"]["avg_seconds"]
+            log(logger, INFO, "/process", route="direct", intent=route.intent, confidence=route.confidence,
+                took=elapsed, est_saved=max(agent_avg - elapsed, 0))
+            return output
+
+        if not os.getenv("GOOGLE_API_KEY"):
             return "Service Unavailable: Missing API key"
             
-        gemini = ChatGoogleGenerativeAI(model="gemini-2.0-flash", google_api_key=gemini_api_key)
-        
-        # Initialize the agent with tools
-        agent = initialize_agent(
-            tools=tools,
-            llm=gemini,
-            agent_type=AgentType.ZERO_SHOT_REACT_DESCRIPTION,
-            verbose=True
-        )
-        
-        # Let the agent decide which tool to use based on the query
-        output = agent.run(query)
+        # Let a pooled agent decide which tool to use based on the query
+        output = get_agent_pool().run(query, callbacks=callbacks, cancelled=cancelled)
+        log(logger, INFO, "/process", route="agent", intent=route.intent, confidence=route.confidence,
+            took=time.perf_counter() - started)
         
         # Return the output
         return output